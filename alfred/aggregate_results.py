@@ -0,0 +1,239 @@
+from alfred.utils.directory_tree import get_seeds_status, sanity_check_exists
+from alfred.utils.recorder import Recorder, RecorderReader, remove_nones
+from alfred.utils.config import parse_bool, parse_log_level, load_dict_from_json
+from alfred.utils.misc import create_logger, select_storage_dirs
+
+import multiprocessing
+import argparse
+import logging
+import pickle
+import time
+import csv
+import os
+import numpy as np
+
+SEED_STATS = ['final', 'best', 'average']
+
+
+def get_aggregate_results_args():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-f', '--from_file', type=str, default=None,
+                        help="Path containing all the storage_names to aggregate")
+
+    parser.add_argument('-s', '--storage_name', type=str, default=None)
+
+    parser.add_argument('--metric', type=str, required=True,
+                        help="Name of the recorded metric to aggregate")
+    parser.add_argument('--recorder_path', type=str, default='metrics.pkl',
+                        help="Path of the Recorder in each seed_dir. Can be a pickle file, a directory of chunks "
+                             "(Recorder.save_chunk) or a columnar directory (Recorder.save_columnar)")
+    parser.add_argument('--higher_is_better', type=parse_bool, default=True)
+    parser.add_argument('--include_pruned', type=parse_bool, default=False,
+                        help="Also aggregates the seeds stopped early by the pruning of alfred.launch_schedule")
+    parser.add_argument('--n_processes', type=int, default=os.cpu_count())
+
+    parser.add_argument('-r', '--root_dir', default=None, type=str)
+    parser.add_argument('--log_level', type=parse_log_level, default=logging.INFO)
+    return parser.parse_args()
+
+
+def aggregate_storage_dirs(storage_dirs, metric, recorder_path, higher_is_better, n_processes, logger,
+                           include_pruned=False):
+    """
+    Computes, for each experiment of each storage_dir, the mean and std across seeds of the final, best and
+    average value of 'metric', and writes them in storage_dir/summary_<metric>.csv (one row per experiment).
+    The statistics of each seed are cached in storage_dir/.aggregate_results_cache.pkl, so that only the seeds
+    whose recorder has been modified (different mtime or size) since the last aggregation are read again.
+    Seeds flagged as PRUNED are ignored unless include_pruned is True (their metrics stop early).
+    :return: dict storage_dir -> list of summary rows (dicts)
+    """
+    cache_key = (recorder_path, metric, higher_is_better)
+
+    # Finds the seeds that need to be (re-)read across all storage_dirs
+
+    caches = {}
+    seeds_to_keep = {}
+    to_read = []
+
+    for storage_dir in storage_dirs:
+        caches[storage_dir] = _load_cache(storage_dir).get(cache_key, {})
+        seeds_to_keep[storage_dir] = []
+
+        for seed_dir, status in get_seeds_status(storage_dir).items():
+            if status == 'PRUNED' and not include_pruned:
+                continue
+
+            path = seed_dir / recorder_path
+            try:
+                stat = os.stat(str(path))
+            except FileNotFoundError:
+                continue
+
+            seed_name = f"{seed_dir.parent.name}/{seed_dir.name}"
+            seeds_to_keep[storage_dir].append(seed_name)
+
+            file_state = (stat.st_mtime_ns, stat.st_size)
+            cached = caches[storage_dir].get(seed_name)
+            if cached is None or cached[0] != file_state:
+                to_read.append((storage_dir, seed_name, path, file_state))
+
+    logger.info(f"{len(to_read)} recorders to read ({sum([len(seeds) for seeds in seeds_to_keep.values()])} "
+                f"seeds with a recorder in {len(storage_dirs)} storage_dirs)")
+
+    # Reads the modified recorders in parallel (only the stats of each seed are sent back)
+
+    start_time = time.time()
+    jobs = [(path, metric, higher_is_better) for (_, _, path, _) in to_read]
+
+    if n_processes > 1 and len(jobs) > 1:
+        with multiprocessing.Pool(min(n_processes, len(jobs))) as pool:
+            all_stats = pool.map(_compute_seed_stats, jobs, chunksize=max(1, len(jobs) // (4 * n_processes)))
+    else:
+        all_stats = [_compute_seed_stats(job) for job in jobs]
+
+    for (storage_dir, seed_name, _, file_state), stats in zip(to_read, all_stats):
+        caches[storage_dir][seed_name] = (file_state, stats)
+
+    if len(jobs) > 0:
+        logger.info(f"Read {len(jobs)} recorders in {time.time() - start_time:.2f}s")
+
+    n_unreadable = len([stats for stats in all_stats if stats is None])
+    if n_unreadable > 0:
+        logger.warning(f"{n_unreadable} recorders could not be read or did not contain any value of '{metric}'")
+
+    # Writes the summary of each storage_dir and updates its cache
+
+    summaries = {}
+    for storage_dir in storage_dirs:
+        cache = {seed_name: caches[storage_dir][seed_name] for seed_name in seeds_to_keep[storage_dir]}
+        summaries[storage_dir] = _summarize(storage_dir, cache)
+
+        _save_summary(summaries[storage_dir], storage_dir / f'summary_{metric}.csv')
+        _save_cache(storage_dir, cache_key, cache)
+        logger.info(f"Summary of {len(summaries[storage_dir])} experiments saved in "
+                    f"{storage_dir / f'summary_{metric}.csv'}")
+
+    return summaries
+
+
+def aggregate_results(from_file, storage_name, metric, recorder_path, higher_is_better, n_processes, logger,
+                      root_dir, include_pruned=False):
+    # Select storage_dirs to run over
+
+    storage_dirs = select_storage_dirs(from_file, storage_name, root_dir)
+
+    # Sanity-check that storages exist
+
+    storage_dirs = [storage_dir for storage_dir in storage_dirs if sanity_check_exists(storage_dir, logger)]
+
+    return aggregate_storage_dirs(storage_dirs=storage_dirs,
+                                  metric=metric,
+                                  recorder_path=recorder_path,
+                                  higher_is_better=higher_is_better,
+                                  n_processes=n_processes,
+                                  logger=logger,
+                                  include_pruned=include_pruned)
+
+
+def _compute_seed_stats(job):
+    path, metric, higher_is_better = job
+
+    try:
+        values = _load_metric(path, metric)
+    except Exception:
+        return None
+
+    if len(values) == 0:
+        return None
+
+    return {'final': float(values[-1]),
+            'best': float(np.max(values) if higher_is_better else np.min(values)),
+            'average': float(np.mean(values)),
+            'n_steps': len(values)}
+
+
+def _load_metric(path, metric):
+    # Columnar directories are memory-mapped, pickles and chunks are loaded entirely
+
+    if (path / 'header.json').exists():
+        reader = RecorderReader(path)
+        values, mask = reader.get(metric), reader.get_mask(metric)
+        return np.asarray(values, dtype=np.float64)[np.asarray(mask)]
+
+    recorder = Recorder.init_from_pickle_file(path)
+    return np.asarray(remove_nones(recorder.tape[metric]), dtype=np.float64)
+
+
+def _summarize(storage_dir, cache):
+    seed_stats_per_experiment = {}
+    for seed_name, (_, stats) in cache.items():
+        if stats is not None:
+            seed_stats_per_experiment.setdefault(seed_name.split('/')[0], []).append((seed_name, stats))
+
+    summary = []
+    for experiment_name in sorted(seed_stats_per_experiment.keys(), key=lambda name: int(name.split('experiment')[1])):
+        seed_stats = seed_stats_per_experiment[experiment_name]
+
+        # Hyperparameters of this experiment (they are the same for all its seeds)
+
+        try:
+            config_unique = load_dict_from_json(str(storage_dir / seed_stats[0][0] / 'config_unique.json'))
+        except FileNotFoundError:
+            config_unique = {}
+
+        row = {'experiment': experiment_name, 'n_seeds': len(seed_stats)}
+        for stat_name in SEED_STATS:
+            values = [stats[stat_name] for _, stats in seed_stats]
+            row[f'{stat_name}_mean'] = float(np.mean(values))
+            row[f'{stat_name}_std'] = float(np.std(values))
+        row.update({key: value for key, value in config_unique.items() if key not in row and key != 'seed'})
+
+        summary.append(row)
+
+    return summary
+
+
+def _save_summary(summary, filename):
+    fieldnames = []
+    for row in summary:
+        fieldnames += [key for key in row.keys() if key not in fieldnames]
+
+    tmp_filename = filename.parent / f'.{filename.name}.tmp'
+    with open(str(tmp_filename), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(summary)
+    os.replace(str(tmp_filename), str(filename))
+
+
+def _load_cache(storage_dir):
+    try:
+        with open(str(storage_dir / '.aggregate_results_cache.pkl'), 'rb') as f:
+            return pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return {}
+
+
+def _save_cache(storage_dir, cache_key, cache):
+    all_caches = _load_cache(storage_dir)
+    all_caches[cache_key] = cache
+
+    tmp_filename = storage_dir / f'.aggregate_results_cache.pkl.{os.getpid()}.tmp'
+    with open(str(tmp_filename), 'wb') as f:
+        pickle.dump(all_caches, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(str(tmp_filename), str(storage_dir / '.aggregate_results_cache.pkl'))
+
+
+if __name__ == '__main__':
+    args = get_aggregate_results_args()
+    logger = create_logger(name="AGGREGATE RESULTS - MASTER", loglevel=args.log_level)
+    aggregate_results(from_file=args.from_file,
+                      storage_name=args.storage_name,
+                      metric=args.metric,
+                      recorder_path=args.recorder_path,
+                      higher_is_better=args.higher_is_better,
+                      include_pruned=args.include_pruned,
+                      n_processes=args.n_processes,
+                      logger=logger,
+                      root_dir=args.root_dir)
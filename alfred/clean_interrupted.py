@@ -1,11 +1,13 @@
-from alfred.utils.directory_tree import get_some_seeds, get_all_seeds, sanity_check_exists
+from alfred.utils.directory_tree import get_seeds_status, sanity_check_exists, reset_seed_dir, reclaim_seed, \
+    is_lease_expired, requeue_seed_dir, SEED_FLAGS
+from alfred.utils.seed_catalog import record_seed_status
 from alfred.utils.misc import create_logger, select_storage_dirs
 from alfred.utils.config import parse_bool
+from concurrent.futures import ThreadPoolExecutor
 
 import argparse
 import logging
-import shutil
-import os
+import alfred.defaults
 
 
 def get_clean_interrupted_args():
@@ -18,13 +20,33 @@ def get_clean_interrupted_args():
 
     parser.add_argument('--clean_opened', action='store_true', default=False)
     parser.add_argument('--clean_crashed', action='store_true', default=False)
+    parser.add_argument('--clean_preempted', action='store_true', default=False,
+                        help="Resets the PREEMPTED seeds, so that they restart from scratch instead of being resumed")
+    parser.add_argument('--resume_from_checkpoints', type=parse_bool, default=True,
+                        help="Keeps the interrupted seeds that have registered checkpoints as PREEMPTED (to be resumed "
+                             "by alfred.launch_schedule) instead of resetting them")
+    parser.add_argument('--clean_timeout', action='store_true', default=False,
+                        help="Resets the seeds killed by alfred.launch_schedule for exceeding --run_timeout")
+    parser.add_argument('--clean_pruned', action='store_true', default=False,
+                        help="Resets the seeds stopped by the pruning of alfred.launch_schedule (e.g. to re-run them "
+                             "with other pruning settings)")
     parser.add_argument('--ask_for_validation', type=parse_bool, default=True)
+    parser.add_argument('--reclaim_expired', type=parse_bool, default=True,
+                        help="Resets the OPENED seeds whose lease has expired (their run is dead), "
+                             "even without --clean_opened (once validated, see --ask_for_validation). The seeds "
+                             "claimed by an older version of alfred have no lease and are only reset by --clean_opened")
+    parser.add_argument('--lease_timeout', type=float, default=alfred.defaults.DEFAULT_LEASE_TIMEOUT,
+                        help="Number of seconds without heartbeat after which the lease of an OPENED seed expires")
+    parser.add_argument('--n_threads', type=int, default=8,
+                        help="Number of threads used to scan and clean the storage_dirs")
 
     parser.add_argument('-r', '--root_dir', default=None, type=str)
     return parser.parse_args()
 
 
-def clean_interrupted(from_file, storage_name, clean_opened, clean_crashed, ask_for_validation, logger, root_dir):
+def clean_interrupted(from_file, storage_name, clean_opened, clean_crashed, ask_for_validation, logger, root_dir,
+                      reclaim_expired=True, lease_timeout=alfred.defaults.DEFAULT_LEASE_TIMEOUT, n_threads=8,
+                      clean_pruned=False, clean_timeout=False, clean_preempted=False, resume_from_checkpoints=True):
     # Select storage_dirs to run over
 
     storage_dirs = select_storage_dirs(from_file, storage_name, root_dir)
@@ -33,46 +55,85 @@ def clean_interrupted(from_file, storage_name, clean_opened, clean_crashed, ask_
 
     storage_dirs = [storage_dir for storage_dir in storage_dirs if sanity_check_exists(storage_dir, logger)]
 
+    # Scans the status of all the seeds of all storage_dirs concurrently (a single pass per storage_dir)
+
+    def scan(storage_dir):
+        seeds_status = get_seeds_status(storage_dir)
+        expired_seeds = [seed_dir for seed_dir, status in seeds_status.items()
+                         if status == 'OPENED' and is_lease_expired(seed_dir, lease_timeout)]
+        return seeds_status, expired_seeds
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        scans = list(executor.map(scan, storage_dirs))
+
     # For all storage_dirs...
 
-    for storage_dir in storage_dirs:
+    for storage_dir, (seeds_status, expired_seeds) in zip(storage_dirs, scans):
 
-        all_seeds = get_all_seeds(storage_dir)
-        unhatched_seeds = get_some_seeds(storage_dir, file_check='UNHATCHED')
-        opened_seeds = get_some_seeds(storage_dir, file_check='OPENED')
-        completed_seeds = get_some_seeds(storage_dir, file_check='COMPLETED')
-        crashed_seeds = get_some_seeds(storage_dir, file_check='CRASH')
-        assert set(all_seeds) == set(unhatched_seeds + opened_seeds + completed_seeds + crashed_seeds)
+        n_seeds_per_status = {status: 0 for status in SEED_FLAGS}
+        for status in seeds_status.values():
+            n_seeds_per_status[status] += 1
 
         # Prints some info
 
         logger.info(f"All seed_dir status in {storage_dir}:\n"
-                    f"\nNumber of seeds:\t\t{len(all_seeds)}"
+                    f"\nNumber of seeds:\t\t{len(seeds_status)}"
                     f"\n{'-'*30}"
-                    f"\nNumber of seeds UNHATCHED:\t{len(unhatched_seeds)}"
-                    f"\nNumber of seeds OPENED: \t{len(opened_seeds)}"
-                    f"\nNumber of seeds CRASHED:\t{len(crashed_seeds)}"
-                    f"\nNumber of seeds COMPLETED:\t{len(completed_seeds)}"
+                    f"\nNumber of seeds UNHATCHED:\t{n_seeds_per_status['UNHATCHED']}"
+                    f"\nNumber of seeds PREEMPTED:\t{n_seeds_per_status['PREEMPTED']}"
+                    f"\nNumber of seeds OPENED: \t{n_seeds_per_status['OPENED']}"
+                    f" ({len(expired_seeds)} with an expired lease)"
+                    f"\nNumber of seeds CRASHED:\t{n_seeds_per_status['CRASH']}"
+                    f"\nNumber of seeds TIMEOUT:\t{n_seeds_per_status['TIMEOUT']}"
+                    f"\nNumber of seeds PRUNED: \t{n_seeds_per_status['PRUNED']}"
+                    f"\nNumber of seeds COMPLETED:\t{n_seeds_per_status['COMPLETED']}"
                     f"\n\nclean_opened={clean_opened}"
                     f"\nclean_crashed={clean_crashed}"
+                    f"\nclean_preempted={clean_preempted}"
+                    f"\nclean_timeout={clean_timeout}"
+                    f"\nclean_pruned={clean_pruned}"
                     f"\n"
                     )
 
         # Check what should be cleaned
 
-        seeds_to_clean = []
+        status_to_clean = set()
 
         if clean_opened:
-            seeds_to_clean += [seed_dir for seed_dir in all_seeds if seed_dir in opened_seeds]
+            status_to_clean.add('OPENED')
 
         if clean_crashed:
-            seeds_to_clean += [seed_dir for seed_dir in all_seeds if seed_dir in crashed_seeds]
+            status_to_clean.add('CRASH')
+
+        if clean_preempted:
+            status_to_clean.add('PREEMPTED')
+
+        if clean_timeout:
+            status_to_clean.add('TIMEOUT')
+
+        if clean_pruned:
+            status_to_clean.add('PRUNED')
+
+        seeds_to_clean = [seed_dir for seed_dir, status in seeds_status.items() if status in status_to_clean]
+
+        # The seeds whose lease has expired (their run is dead) are also reclaimed, even without clean_opened
+
+        seeds_to_reclaim = expired_seeds if reclaim_expired and not clean_opened else []
+
+        if len(seeds_to_clean) == 0 and len(seeds_to_reclaim) == 0:
+            logger.info('No seed_dir to clean.')
+            continue
 
-        if len(seeds_to_clean) != 0:
+        if len(seeds_to_clean) > 0:
             logger.info(f'{len(seeds_to_clean)} seeds about to be cleaned:')
             for seed_dir in seeds_to_clean:
                 logger.info(f'--- {seed_dir}')
 
+        if len(seeds_to_reclaim) > 0:
+            logger.info(f'{len(seeds_to_reclaim)} seeds with an expired lease about to be reclaimed:')
+            for seed_dir in seeds_to_reclaim:
+                logger.info(f'--- {seed_dir}')
+
         if ask_for_validation:
 
             # Asks for validation to clean this storage_dir
@@ -82,27 +143,42 @@ def clean_interrupted(from_file, storage_name, clean_opened, clean_crashed, ask_
                 logger.debug("Aborting...")
                 continue
 
-            logger.debug("Starting...")
+        logger.debug("Starting...")
 
-            # Clean each seed_directory
+        # Reclaims the seeds whose lease is still expired (a run may have sent a heartbeat since the scan)
 
-            for seed_dir in seeds_to_clean:
-                logger.info(f"Cleaning {seed_dir}")
+        if len(seeds_to_reclaim) > 0:
+            with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                new_status = list(executor.map(
+                    lambda seed_dir: reclaim_seed(seed_dir, lease_timeout, resume=resume_from_checkpoints),
+                    seeds_to_reclaim))
 
-                for path in seed_dir.iterdir():
-                    if path.name not in ["config.json", "config_unique.json"]:
-                        if path.is_dir():
-                            shutil.rmtree(path)
-                        else:
-                            os.remove(path)
-                    else:
-                        continue
+            _record_new_status(seeds_to_reclaim, new_status)
+            logger.info(f'{len([status for status in new_status if status is not None])} seeds with an expired lease '
+                        f'have been reclaimed ({new_status.count("PREEMPTED")} will be resumed from a checkpoint)')
 
-                open(str(seed_dir / 'UNHATCHED'), 'w+').close()
-            logger.info('Done')
+        # Clean each seed_directory (interrupted runs that have registered checkpoints only get a PREEMPTED flag)
+
+        def clean(seed_dir):
+            if seeds_status[seed_dir] == 'OPENED':
+                return requeue_seed_dir(seed_dir, resume=resume_from_checkpoints)
+
+            reset_seed_dir(seed_dir)
+            return 'UNHATCHED'
+
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            new_status = list(executor.map(clean, seeds_to_clean))
+
+        _record_new_status(seeds_to_clean, new_status)
+        logger.info(f'Done ({new_status.count("PREEMPTED")} seeds will be resumed from a checkpoint)')
+
+
+def _record_new_status(seed_dirs, new_status):
+    for status in set(new_status):
+        if status is not None:
+            record_seed_status([seed_dir for seed_dir, seed_status in zip(seed_dirs, new_status)
+                                if seed_status == status], status)
 
-        else:
-            logger.info('No seed_dir to clean.')
 
 if __name__ == '__main__':
     kwargs = vars(get_clean_interrupted_args())
@@ -1,7 +1,11 @@
 from alfred.utils.config import *
 from alfred.utils.directory_tree import *
 from alfred.utils.misc import create_logger, select_storage_dirs
+from alfred.utils.seed_catalog import record_seed_status
+from alfred.utils.scheduling import RESOURCES_FILENAME
+from concurrent.futures import ThreadPoolExecutor
 from importlib import import_module
+import shutil
 
 
 def my_type_func(add_arg):
@@ -59,26 +63,12 @@ def copy_configs(from_file, storage_name, new_desc, append_new_desc, additional_
 
     for storage_to_copy in storage_dirs:
         seeds_to_copy = get_all_seeds(storage_to_copy)
-        config_path_list = []
-        config_unique_path_list = []
-
-        # find the path to all the configs files
-
-        for dir in seeds_to_copy:
-            config_path_list.append(dir / 'config.json')
-            config_unique_path_list.append(dir / 'config_unique.json')
 
         # extract storage name info
 
         _, _, _, _, old_desc = \
             DirectoryTree.extract_info_from_storage_name(storage_to_copy.name)
 
-        # overwrites it
-
-        tmp_dir_tree = DirectoryTree(alg_name="nope", task_name="nap", desc="nip", seed=1, root=root_dir)
-        storage_name_id, git_hashes, _, _, _ = \
-            DirectoryTree.extract_info_from_storage_name(str(tmp_dir_tree.storage_dir.name))
-
         if new_desc is None:
             desc = old_desc
         elif new_desc is not None and append_new_desc:
@@ -88,39 +78,93 @@ def copy_configs(from_file, storage_name, new_desc, append_new_desc, additional_
 
         # creates the new folders with loaded config from which we overwrite the task_name
 
-        dir = None
-        for config_path, config_unique_path in zip(config_path_list, config_unique_path_list):
+        new_storage_dir, new_seed_dirs = copy_seed_configs(seeds_to_copy=seeds_to_copy,
+                                                           desc=desc,
+                                                           additional_params=additional_params,
+                                                           root_dir=root_dir)
+
+        logger.info(f"Created {len(new_seed_dirs)} seed_dirs in {str(new_storage_dir)}")
+        open(str(new_storage_dir / f'config_copied_from_{str(storage_to_copy.name)}'), 'w+').close()
+
+
+def copy_seed_configs(seeds_to_copy, desc, additional_params, root_dir, new_seeds=None, n_io_threads=8):
+    """
+    Creates a new storage_dir (with a new id) containing UNHATCHED copies of the given seed_dirs. Each copy keeps
+    the experiment number of the seed_dir it has been copied from.
+    :param seeds_to_copy (list): seed_dirs to copy, all from the same storage_dir
+    :param desc (str): description of the new storage_dir
+    :param additional_params (list): (key, value) pairs to overwrite in the copied configs (or None)
+    :param new_seeds (list): if provided, the config of the first seed_dir of each experiment is copied once
+                             for each of these seeds (instead of copying each seed_dir once)
+    :return: the new storage_dir and its new seed_dirs
+    """
+    # Reserves a new storage_name_id
+
+    tmp_dir_tree = DirectoryTree(alg_name="nope", task_name="nap", desc="nip", seed=1, root=root_dir)
+    storage_name_id, git_hashes, _, _, _ = \
+        DirectoryTree.extract_info_from_storage_name(str(tmp_dir_tree.storage_dir.name))
+
+    # Selects the seed_dirs whose config will be copied
+
+    if new_seeds is not None:
+        first_seed_per_experiment = {}
+        for seed_dir in seeds_to_copy:
+            first_seed_per_experiment.setdefault(seed_dir.parent.name, seed_dir)
+        copies = [(seed_dir, seed) for seed_dir in first_seed_per_experiment.values() for seed in new_seeds]
+    else:
+        copies = [(seed_dir, None) for seed_dir in seeds_to_copy]
+
+    # Computes the content of every new seed_dir
+
+    layout = []
+    storage_dir = None
+    loaded_configs = load_seed_configs([seed_dir for seed_dir, _ in copies], n_threads=n_io_threads)
+
+    for (seed_dir, seed), (config, config_unique_dict) in zip(copies, loaded_configs):
+        config.desc = desc
+
+        if seed is not None:
+            config.seed = seed
+            config_unique_dict['seed'] = seed
+
+        if additional_params is not None:
+
+            for (key, value) in additional_params:
+                config.__dict__[key] = value
+                config_unique_dict[key] = value
+
+        validate_config_unique(config, config_unique_dict)
+
+        if storage_dir is None:
+            storage_dir = DirectoryTree(id=storage_name_id,
+                                        alg_name=config.alg_name,
+                                        task_name=config.task_name,
+                                        desc=config.desc,
+                                        seed=config.seed,
+                                        experiment_num=1,
+                                        git_hashes=git_hashes,
+                                        root=root_dir).storage_dir
 
-            config = load_config_from_json(str(config_path))
-            config.desc = desc
-            expe_name = config_path.parents[1].name
-            experiment_num = int(''.join([s for s in expe_name if s.isdigit()]))
+        new_seed_dir = storage_dir / seed_dir.parent.name / f'seed{config.seed}'
+        layout.append((new_seed_dir, dict(vars(config)), config_unique_dict))
 
-            config_unique_dict = load_dict_from_json(str(config_unique_path))
+    # Creates them concurrently (same path as alfred.prepare_schedule)
 
-            if additional_params is not None:
+    with ThreadPoolExecutor(max_workers=n_io_threads) as executor:
+        list(executor.map(lambda args: create_seed_dir(*args), layout))
 
-                for (key, value) in additional_params:
-                    config.__dict__[key] = value
-                    config_unique_dict[key] = value
+    new_seed_dirs = [new_seed_dir for new_seed_dir, _, _ in layout]
+    record_seed_status(new_seed_dirs, 'UNHATCHED')
 
-            dir = DirectoryTree(id=storage_name_id,
-                                alg_name=config.alg_name,
-                                task_name=config.task_name,
-                                desc=config.desc,
-                                seed=config.seed,
-                                experiment_num=experiment_num,
-                                git_hashes=git_hashes,
-                                root=root_dir)
+    # Copies the resources needed by the runs of each experiment (if they have been declared)
 
-            dir.create_directories()
-            print(f"Creating {str(dir.seed_dir)}\n")
-            save_config_to_json(config, filename=str(dir.seed_dir / "config.json"))
-            validate_config_unique(config, config_unique_dict)
-            save_dict_to_json(config_unique_dict, filename=str(dir.seed_dir / "config_unique.json"))
-            open(str(dir.seed_dir / 'UNHATCHED'), 'w+').close()
+    for seed_dir, _ in copies:
+        resources_path = seed_dir.parent / RESOURCES_FILENAME
+        new_resources_path = storage_dir / seed_dir.parent.name / RESOURCES_FILENAME
+        if resources_path.exists() and not new_resources_path.exists():
+            shutil.copyfile(str(resources_path), str(new_resources_path))
 
-        open(str(dir.seed_dir.parents[1] / f'config_copied_from_{str(storage_to_copy.name)}'), 'w+').close()
+    return storage_dir, new_seed_dirs
 
 
 if __name__ == "__main__":
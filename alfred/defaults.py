@@ -1,3 +1,17 @@
 from collections import OrderedDict
 
 DEFAULT_DIRECTORY_TREE_GIT_REPOS_TO_TRACK = OrderedDict()
+
+# If True, git-hashes are read from the .git/HEAD and .git/refs files instead of calling 'git rev-parse'
+# (no subprocess is forked, but the short hash is always 7 characters long)
+DEFAULT_DIRECTORY_TREE_READ_GIT_REFS_DIRECTLY = False
+
+# Seeds claimed by alfred.launch_schedule hold a lease: their OPENED flag is touched every HEARTBEAT_INTERVAL
+# seconds while they run. A seed whose OPENED flag has not been touched for LEASE_TIMEOUT seconds is considered
+# dead and can be reclaimed (made UNHATCHED again) by alfred.launch_schedule and alfred.clean_interrupted
+DEFAULT_HEARTBEAT_INTERVAL = 30.
+DEFAULT_LEASE_TIMEOUT = 600.
+
+# Maximum number of json files (e.g. config.json) whose content is cached in memory by alfred.utils.config,
+# the oldest ones are evicted first (0 disables the cache)
+DEFAULT_JSON_CACHE_MAX_SIZE = 20000
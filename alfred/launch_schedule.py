@@ -14,19 +14,41 @@ except ImportError as e:
         f"\n\t2. a function 'main.main(config, dir_tree, logger)' that runs the project with the specified hyperparameters"
     )
 
+# OPTIONAL: a function 'main.worker_init()' called once per worker process. Its output (e.g. datasets or
+# environments that are expensive to create) is passed to every subsequent call made by this worker as
+# 'main.main(config, dir_tree, logger, worker_context)'
+try:
+    from main import worker_init
+except ImportError:
+    worker_init = None
+
+# OPTIONAL: a function 'main.get_priority(config)' returning the priority (number) of a seed, used by
+# '--dispatch_policy=priority' (seeds with the highest priority are launched first)
+try:
+    from main import get_priority
+except ImportError:
+    get_priority = None
+
 # other imports
 import numpy as np
 import traceback
 import datetime
 import argparse
 from multiprocessing import Process
+from multiprocessing.connection import wait
 import time
 import logging
 import random
+import sys
 
 from alfred.utils.config import load_config_from_json, parse_bool, parse_log_level
 from alfred.utils.directory_tree import *
-from alfred.utils.misc import create_logger, create_new_filehandler, select_storage_dirs, formatted_time_diff
+from alfred.utils.seed_catalog import SeedCatalog, SeedQueue
+from alfred.utils.pruning import AshaPruner, SeedPruned
+from alfred.utils.scheduling import ResourcePacker, load_resources, set_run_resources, get_available_cpus, \
+    set_memory_limit
+from alfred.utils.misc import create_logger, create_logging_listener, stop_logging_listener, create_queue_logger, \
+    close_logger, select_storage_dirs, formatted_time_diff
 from alfred.clean_interrupted import clean_interrupted
 import alfred.defaults
 
@@ -42,6 +64,39 @@ def get_launch_schedule_args():
 
     parser.add_argument('-p', '--n_processes', type=int, default=1)
     parser.add_argument('--n_experiments_per_proc', type=int, default=np.inf)
+    parser.add_argument('--dispatch_policy', type=str, default='sequential', choices=SeedQueue.policies,
+                        help="Order in which the seeds are launched: storage_dirs one after the other (sequential), "
+                             "seed 1 of every experiment before seed 2 (seed_major), one seed from each storage_dir "
+                             "in turn (round_robin), or highest main.get_priority(config) first (priority)")
+    parser.add_argument('--respawn_dead_workers', type=parse_bool, default=False,
+                        help="Replaces each process that ends while some seeds are still unhatched")
+    parser.add_argument('--heartbeat_interval', type=float, default=alfred.defaults.DEFAULT_HEARTBEAT_INTERVAL,
+                        help="Number of seconds between two renewals of the lease (OPENED flag) of a running seed")
+    parser.add_argument('--lease_timeout', type=float, default=alfred.defaults.DEFAULT_LEASE_TIMEOUT,
+                        help="Number of seconds without heartbeat after which the lease of an OPENED seed expires")
+    parser.add_argument('--reclaim_expired', type=parse_bool, default=True,
+                        help="When no unhatched seed is left, re-runs the OPENED seeds whose lease has expired")
+    parser.add_argument('--pack_resources', type=parse_bool, default=False,
+                        help="Runs each seed in its own process, packing as many seeds as possible on the cpus of the "
+                             "node according to the resources declared in the schedule (ignores --n_processes)")
+    parser.add_argument('--n_cpus', type=int, default=None,
+                        help="Number of cpus used with --pack_resources (defaults to all the cpus available)")
+    parser.add_argument('--memory_gb', type=float, default=None,
+                        help="Memory used with --pack_resources (defaults to ignoring the memory requirements)")
+    parser.add_argument('--run_timeout', type=float, default=None,
+                        help="Number of seconds after which a run is killed and flagged as TIMEOUT. "
+                             "If set, each seed is run in a child process of its worker")
+    parser.add_argument('--run_memory_gb', type=float, default=None,
+                        help="Limit on the address space of each run (rlimit), beyond which allocations fail. "
+                             "If set, each seed is run in a child process of its worker")
+    parser.add_argument('--prune', type=parse_bool, default=False,
+                        help="Stops the runs whose values reported with alfred.utils.pruning.report() are not among "
+                             "the best ones of their storage_dir (asynchronous successive halving)")
+    parser.add_argument('--prune_min_step', type=int, default=1,
+                        help="Step of the first rung (the next ones are at prune_min_step * prune_reduction_factor**k)")
+    parser.add_argument('--prune_reduction_factor', type=int, default=3,
+                        help="Only the top 1/prune_reduction_factor of the runs reaching a rung are continued")
+    parser.add_argument('--prune_higher_is_better', type=parse_bool, default=True)
     parser.add_argument('--check_hash', type=parse_bool, default=True)
     parser.add_argument('--run_clean_interrupted', type=parse_bool, default=False,
                         help="Will clean opened seeds to be re-runned, but not crashed experiments")
@@ -52,103 +107,370 @@ def get_launch_schedule_args():
     return parser.parse_args()
 
 
-def _work_on_schedule(storage_dirs, n_experiments_per_proc, logger, root_dir, process_i=0):
+def _work_on_schedule(storage_dirs, n_experiments_per_proc, logger, root_dir, process_i=0,
+                      heartbeat_interval=alfred.defaults.DEFAULT_HEARTBEAT_INTERVAL, lease_timeout=None,
+                      dispatch_policy='sequential', pruning=None, run_timeout=None, run_memory_gb=None):
     call_i = 0
 
     try:
 
-        time.sleep(np.random.uniform(low=0., high=1.5))
+        # Lets the project set up the state that is shared by all the runs of this worker
 
-        # For all storage_dirs...
+        if worker_init is not None:
+            logger.info(f"PROCESS{process_i} - Initialising worker...")
+            main_kwargs = {'worker_context': worker_init()}
+        else:
+            main_kwargs = {}
 
-        for storage_dir in storage_dirs:
+        # Reads the status of all seeds of all storage_dirs from their catalogs
 
-            # Gets unhatched seeds directories for the current storage_dir
+        queue = _create_seed_queue(storage_dirs, dispatch_policy, offset=process_i)
 
-            unhatched_seeds = get_some_seeds(storage_dir, file_check='UNHATCHED')
+        while True:
 
-            while len(unhatched_seeds) > 0:
+            # Checks if that process didn't exceed its number of experiments to run
 
-                start_time = time.time()
+            if call_i >= n_experiments_per_proc:
+                logger.info(f"Limit of {n_experiments_per_proc} experiments reached.")
+                break
 
-                # Checks if that process didn't exceed its number of experiments to run
+            # Select the next seed directory
 
-                if call_i >= n_experiments_per_proc:
-                    logger.info(f"Limit of {n_experiments_per_proc} experiments reached.")
-                    break
+            seed_dir, catalog = queue.pop()
+
+            # When no seed is left, the seeds whose run is dead (expired lease) are made runnable again
+
+            if seed_dir is None and lease_timeout is not None \
+                    and sum([_reclaim_expired_seeds(catalog, lease_timeout, logger) for catalog in queue.catalogs]) > 0:
+                continue
+
+            if seed_dir is None:
+                logger.info(f"No more unhatched seeds")
+                break
+
+            # Claims it by atomically turning its UNHATCHED (or PREEMPTED) flag into OPENED
+
+            lease = claim_seed(seed_dir)
+            if lease is None:
+                logger.debug(f"{seed_dir} - Already hatched")
+                continue
+
+            catalog.record(seed_dir, 'OPENED')
+
+            # Runs it (in a child process if it has to be killed when exceeding its limits)
+
+            if run_timeout is None and run_memory_gb is None:
+                completed = _run_seed(seed_dir, catalog, logger, root_dir, process_i, heartbeat_interval, main_kwargs,
+                                      pruning, lease)
+
+            else:
+                p = Process(target=_run_limited_seed, args=(seed_dir, logger, root_dir, process_i, heartbeat_interval,
+                                                            main_kwargs, pruning, None, run_memory_gb, lease))
+                deadline = time.time() + run_timeout if run_timeout is not None else None
+                p.start()
+                p.join(run_timeout)
+                completed = _end_limited_run(p, seed_dir, catalog, logger, run_timeout, deadline, lease)
+
+            if completed:
+                call_i += 1
+
+        logger.info(f"Done. Shutting down.")
 
-                # Select the next seed directory
+    except Exception as e:
+        logger.info(f"The process CRASHED with the following error:\n{e}")
+
+    return call_i
+
+
+def _run_seed(seed_dir, catalog, logger, root_dir, process_i, heartbeat_interval, main_kwargs, pruning=None,
+              lease=None):
+    """
+    Runs main() on a seed_dir claimed by this process and replaces its OPENED flag with COMPLETED, PRUNED or CRASH
+    :param pruning (dict): arguments of the AshaPruner given to main() through dir_tree.pruner (None to never prune)
+    :param lease (str): lease id returned by claim_seed(), the flags are only replaced while this lease is held
+    :return: True if the run has completed (or has been pruned)
+    """
+    start_time = time.time()
+
+    # Keeps the lease of the seed alive while it runs
+
+    heartbeat = Heartbeat(seed_dir, interval=heartbeat_interval, lease=lease)
+    heartbeat.start()
+
+    # Load the config and try to train the model
+
+    experiment_logger = None
+    try:
+        config = load_config_from_json(str(seed_dir / 'config.json'))
+        dir_tree = DirectoryTree.init_from_seed_path(seed_dir, root=root_dir)
+        dir_tree.pruner = AshaPruner(**pruning) if pruning is not None else None
+        dir_tree.resume_checkpoint = get_last_checkpoint(seed_dir)
+
+        experiment_logger = create_logger(
+            name=f'PROCESS{process_i}:'
+                 f'{dir_tree.storage_dir.name}/'
+                 f'{dir_tree.experiment_dir.name}/'
+                 f'{dir_tree.seed_dir.name}',
+            loglevel=logging.INFO,
+            logfile=dir_tree.seed_dir / 'logger.out',
+            streamHandle=True
+        )
+
+        if dir_tree.resume_checkpoint is not None:
+            logger.info(f"{seed_dir} - Resuming from {dir_tree.resume_checkpoint}...")
+        else:
+            logger.info(f"{seed_dir} - Launching...")
+
+        main(config=config, dir_tree=dir_tree, logger=experiment_logger, **main_kwargs)
+
+        heartbeat.stop()
+        if heartbeat.lease_lost or not release_seed(seed_dir, 'COMPLETED', lease=heartbeat.lease):
+            logger.warning(f"{seed_dir} - Lease lost while running (the seed has been reclaimed)")
+            return False
+
+        catalog.record(seed_dir, 'COMPLETED')
+
+        end_time = time.time()
+        logger.info(
+            f"{seed_dir} - "
+            f"COMPLETED ({formatted_time_diff(total_time_seconds=end_time - start_time)} elapsed)"
+        )
+        return True
+
+    except SeedPruned as e:
+        heartbeat.stop()
+        if heartbeat.lease_lost or not release_seed(seed_dir, 'PRUNED', content=f'{e}\n', lease=heartbeat.lease):
+            logger.warning(f"{seed_dir} - Lease lost while running (the seed has been reclaimed)")
+            return False
+
+        catalog.record(seed_dir, 'PRUNED')
+        logger.info(f"{seed_dir} - PRUNED ({e})")
+        return True
+
+    except Exception as e:
+        heartbeat.stop()
+        crash_report = f'Crashed at: {datetime.datetime.now().strftime("%Y/%m/%d %H:%M:%S")}.' \
+                       f'Error: {e}\n' \
+                       f'{traceback.format_exc()}'
+        if heartbeat.lease_lost:
+            logger.warning(f"{seed_dir} - Lease lost while running (the seed has been reclaimed)")
+        elif release_seed(seed_dir, 'CRASH', content=crash_report, lease=heartbeat.lease):
+            catalog.record(seed_dir, 'CRASH')
+        return False
+
+    finally:
+        heartbeat.stop()
+        if experiment_logger is not None:
+            close_logger(experiment_logger)
+
+
+def _run_limited_seed(seed_dir, logger, root_dir, process_i, heartbeat_interval, main_kwargs, pruning, cpus=None,
+                      memory_gb=None, lease=None):
+    # Runs a seed in its own process, restricted to the cpus and memory it has been allocated
+
+    if cpus is not None:
+        set_run_resources(cpus)
+        logger.debug(f"{seed_dir} - Running on cpus {cpus}")
+
+    if memory_gb is not None:
+        set_memory_limit(memory_gb)
+
+    completed = _run_seed(seed_dir, SeedCatalog(seed_dir.parents[1]), logger, root_dir, process_i,
+                          heartbeat_interval, main_kwargs, pruning, lease)
+    sys.exit(0 if completed else 1)
+
+
+def _end_limited_run(p, seed_dir, catalog, logger, run_timeout, deadline, lease=None):
+    """
+    Kills the process of a run that is still alive after its deadline and flags its seed_dir as TIMEOUT.
+    A process that died without releasing the lease of its seed_dir (e.g. killed by a signal) is flagged as CRASH.
+    The flag of the seed_dir is only replaced while it still holds 'lease' (the run may have lost it, and the
+    seed_dir may have been claimed again by another worker).
+    :return: True if the run has completed
+    """
+    # A process that has just died can still be seen as alive for a moment, only the deadline tells them apart
+
+    if deadline is not None and time.time() >= deadline and p.is_alive():
+        p.terminate()
+        p.join(5.)
+        if p.is_alive():
+            p.kill()
+        p.join()
+
+        if release_seed(seed_dir, 'TIMEOUT', content=f'Killed after {run_timeout}s at: '
+                                                     f'{datetime.datetime.now().strftime("%Y/%m/%d %H:%M:%S")}\n',
+                        lease=lease):
+            catalog.record(seed_dir, 'TIMEOUT')
+            logger.warning(f"{seed_dir} - TIMEOUT (killed after {run_timeout}s)")
+        return False
+
+    p.join()
+    if p.exitcode != 0 and release_seed(seed_dir, 'CRASH', content=f'The process of the run died '
+                                                                   f'(exitcode={p.exitcode})\n', lease=lease):
+        catalog.record(seed_dir, 'CRASH')
+        logger.warning(f"{seed_dir} - CRASH (the process of the run died with exitcode={p.exitcode})")
+
+    return p.exitcode == 0
+
+
+def _pack_schedule(storage_dirs, n_runs_max, logger, root_dir, cpus, memory_gb, heartbeat_interval, lease_timeout,
+                   dispatch_policy='sequential', pruning=None, run_timeout=None, run_memory_gb=None, lookahead=64):
+    """
+    Runs the seeds of storage_dirs, each in its own process, packing as many of them as possible on the
+    given cpus (and memory) according to the resources needed by their experiment (see alfred.utils.scheduling).
+    The next seed to launch is the first one, among the 'lookahead' next unhatched seeds (in the order given by
+    the dispatch policy), that fits in the currently free resources (first-fit), so that small runs fill the cpus
+    left idle by big ones.
+    :return: the number of runs that have been launched
+    """
+    packer = ResourcePacker(cpus=cpus, memory_gb=memory_gb)
+    queue = _create_seed_queue(storage_dirs, dispatch_policy)
+
+    # The state set up by worker_init() is inherited by the process of each run
+
+    if worker_init is not None:
+        logger.info(f"Initialising worker...")
+        main_kwargs = {'worker_context': worker_init()}
+    else:
+        main_kwargs = {}
+
+    waiting = []
+    running = {}
+    n_runs = 0
+
+    try:
+        while True:
 
-                unhatched_seeds = get_some_seeds(storage_dir, file_check='UNHATCHED', sort_by_seed=True)
+            # Fills the window of candidate seeds (popped from the queue, in order)
 
-                if len(unhatched_seeds) > 0:
-                    seed_dir = unhatched_seeds[0]
-                else:
-                    logger.info(f"{storage_dir} - No more unhatched seeds")
+            no_more_seeds = False
+            while len(waiting) < lookahead and n_runs + len(waiting) < n_runs_max:
+                seed_dir, catalog = queue.pop()
+                if seed_dir is None:
+                    no_more_seeds = True
                     break
+                waiting.append((seed_dir, catalog, load_resources(seed_dir.parent)))
 
-                # Removes its unhatched flag
+            # Launches every candidate that fits in the free resources
 
-                try:
-                    os.remove(str(seed_dir / 'UNHATCHED'))
-                except FileNotFoundError:
-                    logger.info(f"{seed_dir} - Already hatched")
+            for seed_dir, catalog, resources in list(waiting):
+                allocation = packer.allocate(resources)
+                if allocation is None:
                     continue
 
-                open(str(seed_dir / 'OPENED'), 'w+').close()
+                waiting.remove((seed_dir, catalog, resources))
 
-                # Load the config and try to train the model
+                # Claims it by atomically turning its UNHATCHED (or PREEMPTED) flag into OPENED
 
-                try:
-                    config = load_config_from_json(str(seed_dir / 'config.json'))
-                    dir_tree = DirectoryTree.init_from_seed_path(seed_dir, root=root_dir)
+                lease = claim_seed(seed_dir)
+                if lease is None:
+                    logger.debug(f"{seed_dir} - Already hatched")
+                    packer.release(allocation)
+                    continue
 
-                    experiment_logger = create_logger(
-                        name=f'PROCESS{process_i}:'
-                             f'{dir_tree.storage_dir.name}/'
-                             f'{dir_tree.experiment_dir.name}/'
-                             f'{dir_tree.seed_dir.name}',
-                        loglevel=logging.INFO,
-                        logfile=dir_tree.seed_dir / 'logger.out',
-                        streamHandle=True
-                    )
+                catalog.record(seed_dir, 'OPENED')
 
-                    logger.info(f"{seed_dir} - Launching...")
+                p = Process(target=_run_limited_seed, args=(seed_dir, logger, root_dir, n_runs, heartbeat_interval,
+                                                            main_kwargs, pruning, allocation['cpus'], run_memory_gb,
+                                                            lease))
+                p.start()
+                deadline = time.time() + run_timeout if run_timeout is not None else None
+                running[p.sentinel] = (p, seed_dir, catalog, allocation, deadline, lease)
+                n_runs += 1
 
-                    main(config=config, dir_tree=dir_tree, logger=experiment_logger)
+            if len(running) == 0:
 
-                    os.remove(str(seed_dir / 'OPENED'))
-                    open(str(seed_dir / 'COMPLETED'), 'w+').close()
-                    call_i += 1
+                # All the candidates have been claimed by other launchers, new ones are popped
 
-                    end_time = time.time()
-                    logger.info(
-                        f"{seed_dir} - "
-                        f"COMPLETED ({formatted_time_diff(total_time_seconds=end_time - start_time)} elapsed)"
-                    )
+                if n_runs < n_runs_max and not no_more_seeds:
+                    continue
 
-                except Exception as e:
-                    os.remove(str(seed_dir / 'OPENED'))
-                    with open(str(seed_dir / 'CRASH'), 'w+') as f:
-                        f.write(f'Crashed at: {datetime.datetime.now().strftime("%Y/%m/%d %H:%M:%S")}.')
-                        f.write(f'Error: {e}\n')
-                        f.write(traceback.format_exc())
+                # When no seed is left, the seeds whose run is dead (expired lease) are made runnable again
+
+                if n_runs < n_runs_max and lease_timeout is not None \
+                        and sum([_reclaim_expired_seeds(catalog, lease_timeout, logger)
+                                 for catalog in queue.catalogs]) > 0:
+                    continue
 
-            if call_i >= n_experiments_per_proc:
                 break
 
-        logger.info(f"Done. Shutting down.")
+            # Waits for at least one run to end (or to exceed its timeout) and frees its resources
 
-    except Exception as e:
-        logger.info(f"The process CRASHED with the following error:\n{e}")
+            deadlines = [deadline for (_, _, _, _, deadline, _) in running.values() if deadline is not None]
+            timeout = max(0., min(deadlines) - time.time()) if len(deadlines) > 0 else None
+            ended = wait(list(running.keys()), timeout=timeout)
 
-    return call_i
+            for sentinel in list(running.keys()):
+                p, seed_dir, catalog, allocation, deadline, lease = running[sentinel]
+                if sentinel in ended or (deadline is not None and time.time() >= deadline):
+                    running.pop(sentinel)
+                    _end_limited_run(p, seed_dir, catalog, logger, run_timeout, deadline, lease)
+                    packer.release(allocation)
+
+    except KeyboardInterrupt:
+        logger.info("KEYBOARD INTERRUPT. Killing all runs")
+        for p, _, _, _, _, _ in running.values():
+            p.terminate()
+
+    logger.info(f"Done. {n_runs} runs launched.")
+    return n_runs
+
+
+def _create_seed_queue(storage_dirs, dispatch_policy, offset=0):
+    if dispatch_policy == 'priority':
+        assert get_priority is not None, "--dispatch_policy=priority requires a function 'main.get_priority(config)'"
+        return SeedQueue(storage_dirs, policy=dispatch_policy, priority_fn=_get_seed_priority, offset=offset)
+
+    return SeedQueue(storage_dirs, policy=dispatch_policy, offset=offset)
+
+
+def _get_seed_priority(seed_dir):
+    return get_priority(load_config_from_json(str(seed_dir / 'config.json')))
+
+
+def _reclaim_expired_seeds(catalog, lease_timeout, logger):
+    n_reclaimed = 0
+    for seed_dir in catalog.get_seeds('OPENED'):
+        status = reclaim_seed(seed_dir, lease_timeout)
+        if status is not None:
+            logger.info(f"{seed_dir} - Lease expired, the seed has been reclaimed ({status})")
+            catalog.record(seed_dir, status)
+            n_reclaimed += 1
+
+    # The new records are read by the SeedQueue of this catalog, which is the one queueing the reclaimed seeds
+
+    return n_reclaimed
+
+
+def _count_unhatched_seeds(catalogs):
+    n_unhatched = 0
+    for catalog in catalogs:
+        catalog.refresh()
+        n_unhatched += sum([len(catalog.get_seeds(status)) for status in RUNNABLE_FLAGS])
+
+    return n_unhatched
 
 
 def launch_schedule(from_file, storage_name, n_processes, n_experiments_per_proc, check_hash,
-                    run_clean_interrupted, root_dir, log_level):
+                    run_clean_interrupted, root_dir, log_level, respawn_dead_workers=False,
+                    heartbeat_interval=alfred.defaults.DEFAULT_HEARTBEAT_INTERVAL,
+                    lease_timeout=alfred.defaults.DEFAULT_LEASE_TIMEOUT, reclaim_expired=True,
+                    pack_resources=False, n_cpus=None, memory_gb=None, dispatch_policy='sequential', prune=False,
+                    prune_min_step=1, prune_reduction_factor=3, prune_higher_is_better=True, run_timeout=None,
+                    run_memory_gb=None):
     set_up_alfred()
 
+    assert heartbeat_interval < lease_timeout, "The lease of running seeds would expire between two heartbeats"
+    assert dispatch_policy != 'priority' or get_priority is not None, \
+        "--dispatch_policy=priority requires a function 'main.get_priority(config)'"
+
+    if prune:
+        pruning = {'min_step': prune_min_step,
+                   'reduction_factor': prune_reduction_factor,
+                   'higher_is_better': prune_higher_is_better}
+    else:
+        pruning = None
+
     # Select storage_dirs to run over
 
     storage_dirs = select_storage_dirs(from_file, storage_name, root_dir)
@@ -170,12 +492,14 @@ def launch_schedule(from_file, storage_name, n_processes, n_experiments_per_proc
     if check_hash:
         storage_dirs = [storage_dir for storage_dir in storage_dirs if sanity_check_hash(storage_dir, master_logger)]
 
-    # Continues with sanity-checked storage_dir list
+    # Continues with sanity-checked storage_dir list. From now on, all processes send their records to
+    # a single listener that writes them to stdout and to the logfile of every storage_dir
 
-    for storage_dir in storage_dirs:
-        file_handler = create_new_filehandler(master_logger.name,
-                                              logfile=storage_dir / 'alfred_launch_schedule_logger.out')
-        master_logger.addHandler(file_handler)
+    log_queue, log_listener = create_logging_listener(
+        logfiles=[storage_dir / 'alfred_launch_schedule_logger.out' for storage_dir in storage_dirs],
+        streamHandle=True)
+
+    master_logger = create_queue_logger(name=master_logger.name, loglevel=log_level, log_queue=log_queue)
 
     master_logger.debug("Storage Directories to be launched:")
     for storage_dir in storage_dirs:
@@ -189,6 +513,15 @@ def launch_schedule(from_file, storage_name, n_processes, n_experiments_per_proc
                         f"\nstorage_name={storage_name}"
                         f"\nn_processes={n_processes}"
                         f"\nn_experiments_per_proc={n_experiments_per_proc}"
+                        f"\nrespawn_dead_workers={respawn_dead_workers}"
+                        f"\ndispatch_policy={dispatch_policy}"
+                        f"\nheartbeat_interval={heartbeat_interval}"
+                        f"\nlease_timeout={lease_timeout}"
+                        f"\nreclaim_expired={reclaim_expired}"
+                        f"\npack_resources={pack_resources}"
+                        f"\npruning={pruning}"
+                        f"\nrun_timeout={run_timeout}"
+                        f"\nrun_memory_gb={run_memory_gb}"
                         f"\ncheck_hash={check_hash}"
                         f"\nroot={root_dir}"
                         f"\n")
@@ -196,73 +529,107 @@ def launch_schedule(from_file, storage_name, n_processes, n_experiments_per_proc
     # Clean the storage_dirs if asked to
 
     if run_clean_interrupted:
-        for storage_dir in storage_dirs:
-            clean_interrupted(from_file=None,
-                              storage_name=storage_dir.name,
-                              clean_crashes=False,
-                              ask_for_validation=False,
-                              logger=master_logger,
-                              root_dir=root_dir)
+        clean_interrupted(from_file=from_file,
+                          storage_name=storage_name,
+                          clean_opened=True,
+                          clean_crashed=False,
+                          ask_for_validation=False,
+                          logger=master_logger,
+                          root_dir=root_dir,
+                          lease_timeout=lease_timeout)
+
+    # Packs the runs on the cpus of the node
+
+    if pack_resources:
+        cpus = get_available_cpus()
+        if n_cpus is not None:
+            cpus = cpus[:n_cpus]
+
+        master_logger.info(f"Packing runs on {len(cpus)} cpus" +
+                           (f" and {memory_gb}GB of memory" if memory_gb is not None else ""))
+
+        n_calls = _pack_schedule(storage_dirs=storage_dirs,
+                                 n_runs_max=n_experiments_per_proc,
+                                 logger=master_logger,
+                                 root_dir=root_dir,
+                                 cpus=cpus,
+                                 memory_gb=memory_gb,
+                                 heartbeat_interval=heartbeat_interval,
+                                 lease_timeout=lease_timeout if reclaim_expired else None,
+                                 dispatch_policy=dispatch_policy,
+                                 pruning=pruning,
+                                 run_timeout=run_timeout,
+                                 run_memory_gb=run_memory_gb)
 
     # Launches multiple processes
 
-    if n_processes > 1:
-        ## TODO: Logger is not supported with multiprocess (should use queues and all)
+    elif n_processes > 1:
         n_calls = None  # for now we only return n_calls != None if running with one process only
 
-        processes = []
-
-        for i in range(n_processes):
+        def create_process(i):
 
             # Creates process logger
 
             logger_id = str(random.randint(1, 999999)).zfill(6)
-            logger = create_logger(name=f'ID:{logger_id} - SUBPROCESS_{i}',
-                                   loglevel=log_level,
-                                   logfile=storage_dir / 'alfred_launch_schedule_logger.out',
-                                   streamHandle=True)
-
-            # Adds logfiles to logger if multiple storage_dirs
-            if len(storage_dirs) > 1:
-                for storage_dir in storage_dirs[1:]:
-                    file_handler = create_new_filehandler(logger.name,
-                                                          logfile=storage_dir / 'alfred_launch_schedule_logger.out')
-                    logger.addHandler(file_handler)
+            logger = create_queue_logger(name=f'ID:{logger_id} - SUBPROCESS_{i}',
+                                         loglevel=log_level,
+                                         log_queue=log_queue)
 
             # Creates process
 
-            processes.append(Process(target=_work_on_schedule, args=(storage_dirs,
-                                                                     n_experiments_per_proc,
-                                                                     logger,
-                                                                     root_dir,
-                                                                     i)))
+            return Process(target=_work_on_schedule, args=(storage_dirs,
+                                                           n_experiments_per_proc,
+                                                           logger,
+                                                           root_dir,
+                                                           i,
+                                                           heartbeat_interval,
+                                                           lease_timeout if reclaim_expired else None,
+                                                           dispatch_policy,
+                                                           pruning,
+                                                           run_timeout,
+                                                           run_memory_gb))
+
+        catalogs = [SeedCatalog(storage_dir) for storage_dir in storage_dirs]
+        processes = {}
+
         try:
-            # start processes
+            # start processes (indexed by their sentinel to be notified as soon as they end)
+
+            n_unhatched = _count_unhatched_seeds(catalogs) if respawn_dead_workers else None
 
-            for p in processes:
+            for i in range(n_processes):
+                p = create_process(i)
                 p.start()
-                time.sleep(0.5)
+                processes[p.sentinel] = (i, p, n_unhatched)
 
             # waits for all processes to end
 
-            dead_processes = []
-            while any([p.is_alive() for p in processes]):
+            while len(processes) > 0:
 
-                # check if some processes are dead
+                for sentinel in wait(list(processes.keys())):
+                    i, p, n_unhatched_at_start = processes.pop(sentinel)
+                    p.join()
+                    master_logger.info(f'PROCESS_{i} has died (exitcode={p.exitcode}).')
 
-                for i, p in enumerate(processes):
-                    if not p.is_alive() and i not in dead_processes:
-                        master_logger.info(f'PROCESS_{i} has died.')
-                        dead_processes.append(i)
+                    if not respawn_dead_workers:
+                        continue
 
-                time.sleep(3)
+                    # replaces the dead process if some seeds are still waiting to be run
+                    # (and some progress has been made since it started, to avoid respawning a broken worker forever)
+
+                    n_unhatched = _count_unhatched_seeds(catalogs)
+                    if 0 < n_unhatched < n_unhatched_at_start:
+                        master_logger.info(f'Respawning PROCESS_{i}.')
+                        p = create_process(i)
+                        p.start()
+                        processes[p.sentinel] = (i, p, n_unhatched)
 
         except KeyboardInterrupt:
             master_logger.info("KEYBOARD INTERRUPT. Killing all processes")
 
             # terminates all processes
 
-            for process in processes:
+            for i, process, _ in processes.values():
                 process.terminate()
 
         master_logger.info("All processes are done. Closing '__main__'\n\n")
@@ -273,12 +640,19 @@ def launch_schedule(from_file, storage_name, n_processes, n_experiments_per_proc
         n_calls = _work_on_schedule(storage_dirs=storage_dirs,
                                     n_experiments_per_proc=n_experiments_per_proc,
                                     logger=master_logger,
-                                    root_dir=root_dir)
+                                    root_dir=root_dir,
+                                    heartbeat_interval=heartbeat_interval,
+                                    lease_timeout=lease_timeout if reclaim_expired else None,
+                                    dispatch_policy=dispatch_policy,
+                                    pruning=pruning,
+                                    run_timeout=run_timeout,
+                                    run_memory_gb=run_memory_gb)
+
+    stop_logging_listener(log_listener)
 
     return n_calls
 
 
 if __name__ == '__main__':
-    time.sleep(np.random.uniform(low=0., high=1.5))
     kwargs = vars(get_launch_schedule_args())
     launch_schedule(**kwargs)
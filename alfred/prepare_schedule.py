@@ -8,18 +8,26 @@
 
 import logging
 import sys
+import os
+import copy
+import time
 import re
 import itertools
+import random
 import argparse
+import numpy as np
 import matplotlib
 from pathlib import Path
 from importlib import import_module
+from concurrent.futures import ThreadPoolExecutor
 
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
-from alfred.utils.directory_tree import DirectoryTree
-from alfred.utils.config import save_dict_to_json, load_dict_from_json, save_config_to_json, config_to_str, parse_bool, validate_config_unique
+from alfred.utils.directory_tree import DirectoryTree, create_seed_dir
+from alfred.utils.seed_catalog import record_seed_status
+from alfred.utils.scheduling import get_experiment_resources, RESOURCES_FILENAME
+from alfred.utils.config import save_dict_to_json, load_dict_from_json, config_to_str, parse_bool, validate_config_unique
 from alfred.utils.misc import create_logger, plot_sampled_hyperparams
 
 
@@ -33,11 +41,55 @@ def get_prepare_schedule_args():
     parser.add_argument('--add_to_folder', type=str, default=None)
     parser.add_argument('--resample', type=parse_bool, default=True,
                         help="If true we resample a configuration for each task*alg combination")
+    parser.add_argument('--n_io_threads', type=int, default=8,
+                        help="Number of threads used to create the seed directories and their files")
+    parser.add_argument('--use_base_configs', type=parse_bool, default=False,
+                        help="If true, the config shared by the seeds of an experiment is stored once in "
+                             "storage_dir/base_configs and each seed_dir only stores its overrides")
 
     return parser.parse_args()
 
 
-def extract_schedule_grid(schedule_module):
+class GridExperiments(object):
+    """
+    Re-iterable view over the cartesian product of VARIATIONS. The grid is expanded lazily (one experiment
+    at a time) so that it never has to be held in memory, even for grids of millions of points.
+    - filter_experiment: optional predicate, only the experiments (dicts) for which it returns True are kept
+    - subsample_fraction: optional probability with which each (remaining) experiment is kept. The subsampling
+      is seeded so that every iteration over the grid yields the same experiments.
+    """
+
+    def __init__(self, VARIATIONS_LISTS, filter_experiment=None, subsample_fraction=None, subsample_seed=0):
+        self.VARIATIONS_LISTS = VARIATIONS_LISTS
+        self.filter_experiment = filter_experiment
+        self.subsample_fraction = subsample_fraction
+        self.subsample_seed = subsample_seed
+
+    def __iter__(self):
+        rng = random.Random(self.subsample_seed)
+
+        for experiment in itertools.product(*self.VARIATIONS_LISTS):
+            experiment = dict(experiment)
+
+            if self.filter_experiment is not None and not self.filter_experiment(experiment):
+                continue
+
+            if self.subsample_fraction is not None and rng.random() >= self.subsample_fraction:
+                continue
+
+            yield experiment
+
+    def n_grid_points(self):
+        """
+        Size of the full grid (before filtering and subsampling)
+        """
+        n = 1
+        for values in self.VARIATIONS_LISTS:
+            n *= len(values)
+        return n
+
+
+def extract_schedule_grid(schedule_module, lazy=False):
     try:
         schedule = import_module(schedule_module)
         VARIATIONS = schedule.VARIATIONS
@@ -61,13 +113,17 @@ def extract_schedule_grid(schedule_module):
     for key in sorted_keys:
         VARIATIONS_LISTS.append([(key, VARIATIONS[key][j]) for j in range(len(VARIATIONS[key]))])
 
-    # Creates a list of combinations of hyperparams given in VARIATIONS (to grid-search over)
+    # Combinations of hyperparams given in VARIATIONS (to grid-search over), optionally filtered and subsampled
 
-    experiments = list(itertools.product(*VARIATIONS_LISTS))
+    experiments = GridExperiments(VARIATIONS_LISTS,
+                                  filter_experiment=getattr(schedule, 'filter_experiment', None),
+                                  subsample_fraction=getattr(schedule, 'SUBSAMPLE_FRACTION', None),
+                                  subsample_seed=getattr(schedule, 'SUBSAMPLE_SEED', 0))
 
-    # Convert to list of dicts
+    # Convert to list of dicts (unless the caller streams over them)
 
-    experiments = [dict(experiment) for experiment in experiments]
+    if not lazy:
+        experiments = list(experiments)
 
     # Checks which hyperparameter are actually varied
 
@@ -79,7 +135,6 @@ def extract_schedule_grid(schedule_module):
 def extract_schedule_random(schedule_module):
     try:
         schedule = import_module(schedule_module)
-        sample_experiment = schedule.sample_experiment
         ALG_NAMES = schedule.ALG_NAMES
         TASK_NAMES = schedule.TASK_NAMES
         SEEDS = schedule.SEEDS
@@ -95,75 +150,147 @@ def extract_schedule_random(schedule_module):
 
     # Samples all experiments' hyperparameters
 
-    experiments = [sample_experiment().items() for _ in range(N_EXPERIMENTS)]
+    param_samples, experiments, varied_params = sample_random_experiments(schedule, N_EXPERIMENTS)[0]
+
+    return param_samples, ALG_NAMES, TASK_NAMES, SEEDS, experiments, varied_params, get_run_args, schedule
+
+
+def sample_random_experiments(schedule, n_experiments, n_samplings=1):
+    """
+    Samples n_samplings independent sets of n_experiments hyperparameter configurations from a random_schedule.
+    If the schedule defines 'sample_experiments(n)' (returning a dict of columns: param_name -> array of n values),
+    all the samplings are drawn in a single batched call. Otherwise 'sample_experiment()' (returning one dict)
+    is called once per experiment.
+    :return: list of n_samplings tuples (param_samples, experiments, varied_params)
+    """
+    n_total = n_experiments * n_samplings
+
+    # e.g. a single alg_name and task_name combination, for which no resampling is needed
+
+    if n_total == 0:
+        return [({}, [], []) for _ in range(n_samplings)]
+
+    if hasattr(schedule, 'sample_experiments'):
+        columns = {param_name: np.asarray(values) for param_name, values in schedule.sample_experiments(n_total).items()}
+        assert all([len(values) == n_total for values in columns.values()]), \
+            f"sample_experiments({n_total}) should return {n_total} values for every hyperparameter"
+
+    else:
+        samples = [dict(schedule.sample_experiment()) for _ in range(n_total)]
+        columns = {param_name: [sample[param_name] for sample in samples] for param_name in samples[0].keys()}
+
+    samplings = []
+    for i in range(n_samplings):
+        sampling_columns = {param_name: values[i * n_experiments:(i + 1) * n_experiments]
+                            for param_name, values in columns.items()}
+        samplings.append(_columns_to_experiments(sampling_columns))
 
-    # Convert to list of dicts
+    return samplings
 
-    experiments = [dict(experiment) for experiment in experiments]
 
+def _columns_to_experiments(columns):
     # Checks which hyperparams are actually varied
 
-    param_samples = {param_name: [] for param_name in experiments[0].keys()}
-    for experiment in experiments:
-        for param_name in experiment.keys():
-            param_samples[param_name].append(experiment[param_name])
+    varied_params = [param_name for param_name, values in columns.items() if not _is_constant(values)]
 
-    non_varied_params = []
-    for param_name in param_samples.keys():
-        if len(param_samples[param_name]) == param_samples[param_name].count(param_samples[param_name][0]):
-            non_varied_params.append(param_name)
+    # Convert to list of dicts (of python types, to be saved in json)
 
-    for param_name in non_varied_params:
-        del param_samples[param_name]
-    varied_params = list(param_samples.keys())
+    columns = {param_name: values.tolist() if isinstance(values, np.ndarray) else list(values)
+               for param_name, values in columns.items()}
+    experiments = [dict(zip(columns.keys(), experiment)) for experiment in zip(*columns.values())]
 
-    return param_samples, ALG_NAMES, TASK_NAMES, SEEDS, experiments, varied_params, get_run_args, schedule
+    param_samples = {param_name: columns[param_name] for param_name in varied_params}
+
+    return param_samples, experiments, varied_params
+
+
+def _is_constant(values):
+    if isinstance(values, np.ndarray):
+        return bool(np.all(values == values[0]))
+    else:
+        return all(value == values[0] for value in values)
+
+
+def create_experiment_dir(storage_name_id, config, config_unique_dict, SEEDS, root_dir, git_hashes=None,
+                          use_base_configs=False, resources_dict=None):
+    """
+    Creates the seed_dirs of a single experiment (see create_experiment_dirs)
+    :return: the DirectoryTree of its last seed_dir
+    """
+    storage_dir, experiment_nums = create_experiment_dirs(storage_name_id, [config], [config_unique_dict], SEEDS,
+                                                          root_dir, git_hashes, use_base_configs=use_base_configs,
+                                                          resources_dicts=None if resources_dict is None
+                                                          else [resources_dict])
+
+    return DirectoryTree.init_from_seed_path(storage_dir / f'experiment{experiment_nums[0]}' / f'seed{SEEDS[-1]}',
+                                             root=root_dir)
 
 
-def create_experiment_dir(storage_name_id, config, config_unique_dict, SEEDS, root_dir, git_hashes=None):
-    # Determine experiment number
+def create_experiment_dirs(storage_name_id, configs, config_unique_dicts, SEEDS, root_dir, git_hashes,
+                           n_io_threads=8, use_base_configs=False, resources_dicts=None):
+    """
+    Creates the seed_dirs of a batch of experiments: the layout of all the seed_dirs of these experiments is computed
+    in memory first, then the directories and files are created by a pool of threads (which overlaps the latency
+    of the filesystem, e.g. on network filesystems)
+    :param configs (list): one config (Namespace) per experiment, all from the same storage_dir
+    :param config_unique_dicts (list): one config_unique_dict per experiment
+    :param use_base_configs (bool): if True, the seed_dirs are created with base configs (see save_config_with_base)
+    :param resources_dicts (list): resources needed by each run of each experiment (saved in its experiment_dir)
+    :return: the storage_dir and the list of experiment numbers that have been created
+    """
+    # Determines the storage_dir and reserves a block of experiment numbers in it
 
-    tmp_dir_tree = DirectoryTree(id=storage_name_id, alg_name=config.alg_name, task_name=config.task_name,
-                                 desc=config.desc, seed=1, git_hashes=git_hashes, root=root_dir)
+    storage_dir = DirectoryTree(id=storage_name_id, alg_name=configs[0].alg_name, task_name=configs[0].task_name,
+                                desc=configs[0].desc, seed=1, experiment_num=1, git_hashes=git_hashes,
+                                root=root_dir).storage_dir
 
-    experiment_num = int(tmp_dir_tree.experiment_dir.name.strip('experiment'))
+    os.makedirs(str(storage_dir), exist_ok=True)
+    first_experiment_num = DirectoryTree.reserve_experiment_nums(storage_dir, n=len(configs))
+    experiment_nums = list(range(first_experiment_num, first_experiment_num + len(configs)))
 
-    # For each seed in these experiments, creates a directory
+    # Computes the content of every seed_dir
 
-    for seed in SEEDS:
-        config.seed = seed
-        config_unique_dict['seed'] = seed
+    layout = []
+    for experiment_num, config, config_unique_dict in zip(experiment_nums, configs, config_unique_dicts):
+        for seed in SEEDS:
+            config.seed = seed
+            config_unique_dict['seed'] = seed
+            validate_config_unique(config, config_unique_dict)
 
-        # Creates the experiment directory
+            seed_dir = storage_dir / f'experiment{experiment_num}' / f'seed{seed}'
+            layout.append((seed_dir, dict(vars(config)), dict(config_unique_dict), use_base_configs))
 
-        dir_tree = DirectoryTree(id=storage_name_id,
-                                 alg_name=config.alg_name,
-                                 task_name=config.task_name,
-                                 desc=config.desc,
-                                 seed=config.seed,
-                                 experiment_num=experiment_num,
-                                 git_hashes=git_hashes,
-                                 root=root_dir)
+    # Creates them concurrently
 
-        dir_tree.create_directories()
+    with ThreadPoolExecutor(max_workers=n_io_threads) as executor:
+        list(executor.map(lambda args: create_seed_dir(*args), layout))
 
-        # Saves the config as json file (to be run later)
+        # Saves the resources needed by the runs of each experiment (used by alfred.launch_schedule --pack_resources)
 
-        save_config_to_json(config, filename=str(dir_tree.seed_dir / 'config.json'))
+        if resources_dicts is not None:
+            list(executor.map(lambda args: save_dict_to_json(*args),
+                              [(resources_dict, str(storage_dir / f'experiment{experiment_num}' / RESOURCES_FILENAME))
+                               for experiment_num, resources_dict in zip(experiment_nums, resources_dicts)
+                               if len(resources_dict) > 0]))
 
-        # Saves a dictionary of what makes each seed_dir unique (just for display on graphs)
+    # Indexes the new seeds in the storage_dir's catalog (used by alfred.launch_schedule)
 
-        validate_config_unique(config, config_unique_dict)
-        save_dict_to_json(config_unique_dict, filename=str(dir_tree.seed_dir / 'config_unique.json'))
+    record_seed_status([seed_dir for seed_dir, _, _, _ in layout], 'UNHATCHED')
 
-        # Creates empty file UNHATCHED meaning that the experiment is ready to be run
+    return storage_dir, experiment_nums
 
-        open(str(dir_tree.seed_dir / 'UNHATCHED'), 'w+').close()
 
-    return dir_tree
+def _iter_chunks(iterable, chunk_size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if len(chunk) == 0:
+            return
+        yield chunk
 
 
-def prepare_schedule(desc, schedule_file, root_dir, add_to_folder, resample, logger, ask_for_validation):
+def prepare_schedule(desc, schedule_file, root_dir, add_to_folder, resample, logger, ask_for_validation,
+                     n_io_threads=8, use_base_configs=False):
     # Infers the search_type (grid or random) from provided schedule_file
 
     schedule_file_path = Path(schedule_file)
@@ -191,7 +318,7 @@ def prepare_schedule(desc, schedule_file, root_dir, add_to_folder, resample, log
 
     if search_type == 'grid':
 
-        VARIATIONS, ALG_NAMES, TASK_NAMES, SEEDS, experiments, varied_params, get_run_args, schedule = extract_schedule_grid(schedule_module)
+        VARIATIONS, ALG_NAMES, TASK_NAMES, SEEDS, experiments, varied_params, get_run_args, schedule = extract_schedule_grid(schedule_module, lazy=True)
 
     elif search_type == 'random':
 
@@ -208,10 +335,11 @@ def prepare_schedule(desc, schedule_file, root_dir, add_to_folder, resample, log
 
         desc = f"{search_type}_{desc}"
         agent_task_combinations = list(itertools.product(ALG_NAMES, TASK_NAMES))
+        git_hashes = DirectoryTree.get_git_hashes()
         mode = "NEW_STORAGE"
 
     elif add_to_folder is not None:
-        assert (root_dir / add_to_folder).exists(), f"{add_to_folder} does not exist."
+        assert (Path(root_dir) / add_to_folder).exists(), f"{add_to_folder} does not exist."
         assert desc is None, "If --add_to_folder is defined, new experiments will be added to the existing folder." \
                              "No --desc should be provided."
 
@@ -234,8 +362,7 @@ def prepare_schedule(desc, schedule_file, root_dir, add_to_folder, resample, log
 
     if search_type == 'random' and resample:
         assert not add_to_folder
-        for i in range(n_combinations - 1):
-            param_sa, _, _, _, expe, varied_pa, get_run_args, _ = extract_schedule_random(schedule_module)
+        for param_sa, expe, _ in sample_random_experiments(schedule, schedule.N_EXPERIMENTS, n_combinations - 1):
             experiments.append(expe)
             param_samples.append(param_sa)
 
@@ -252,6 +379,7 @@ def prepare_schedule(desc, schedule_file, root_dir, add_to_folder, resample, log
     info_str += f"\nSEEDS: {SEEDS}"
 
     if search_type == "grid":
+        info_str += f"\n\nGrid of {experiments[0].n_grid_points()} experiments (before filtering and subsampling)"
         info_str += f"\n\nVARIATIONS:"
         for key in VARIATIONS.keys():
             info_str += f"\n\t{key}: {VARIATIONS[key]}"
@@ -267,8 +395,6 @@ def prepare_schedule(desc, schedule_file, root_dir, add_to_folder, resample, log
     if ask_for_validation:
 
         if mode == "NEW_STORAGE":
-            git_hashes = DirectoryTree.get_git_hashes()
-
             string = "\n"
             for alg_name, task_name in agent_task_combinations:
                 string += f"\n\tID_{git_hashes}_{alg_name}_{task_name}_{desc}"
@@ -277,7 +403,7 @@ def prepare_schedule(desc, schedule_file, root_dir, add_to_folder, resample, log
                          f"{string}")
 
         else:
-            n_existing_experiments = len([path for path in root_dir / add_to_folder.iterdir()
+            n_existing_experiments = len([path for path in (Path(root_dir) / add_to_folder).iterdir()
                                           if path.name.startswith('experiment')])
 
             logger.debug(f"\n\nAbout to add {len(experiments)} experiment folders in the following directory"
@@ -294,52 +420,79 @@ def prepare_schedule(desc, schedule_file, root_dir, add_to_folder, resample, log
     # For each storage_dir to be created
 
     all_storage_dirs = []
+    default_config = get_run_args(overwritten_cmd_line="")
+    n_seed_dirs_created = 0
+    creation_time = 0.
 
     for alg_task_i, (alg_name, task_name) in enumerate(agent_task_combinations):
 
         # Determines storing ID (if new storage_dir)
 
         if mode == "NEW_STORAGE":
-            tmp_dir_tree = DirectoryTree(alg_name=alg_name, task_name=task_name, desc=desc, seed=1, root=root_dir)
+            tmp_dir_tree = DirectoryTree(alg_name=alg_name, task_name=task_name, desc=desc, seed=1,
+                                         git_hashes=git_hashes, root=root_dir)
             storage_name_id = tmp_dir_tree.storage_dir.name.split('_')[0]
 
-        # For each experiments...
+        # For each experiments (streamed by chunks so that memory stays flat for very large grids)...
 
-        for param_dict in experiments[alg_task_i]:
+        storage_dir = None
+        first_experiment_created = None
+        last_experiment_created = None
 
-            # Creates dictionary pointer-access to a training config object initialized by default
+        for experiments_chunk in _iter_chunks(experiments[alg_task_i], chunk_size=1000):
 
-            config = get_run_args(overwritten_cmd_line="")
-            config_dict = vars(config)
+            configs = []
+            config_unique_dicts = []
+            resources_dicts = []
+            for param_dict in experiments_chunk:
 
-            # Modifies the config for this particular experiment
+                # Creates dictionary pointer-access to a training config object initialized by default
 
-            config.alg_name = alg_name
-            config.task_name = task_name
-            config.desc = desc
+                config = copy.deepcopy(default_config)
+                config_dict = vars(config)
 
-            config_unique_dict = {k: v for k, v in param_dict.items() if k in varied_params}
-            config_unique_dict['alg_name'] = config.alg_name
-            config_unique_dict['task_name'] = config.task_name
-            config_unique_dict['seed'] = config.seed
+                # Modifies the config for this particular experiment
 
-            for param_name in param_dict.keys():
-                if param_name not in config_dict.keys():
-                    raise ValueError(f"'{param_name}' taken from the schedule is not a valid hyperparameter "
-                                     f"i.e. it cannot be found in the Namespace returned by get_run_args().")
-                else:
-                    config_dict[param_name] = param_dict[param_name]
+                config.alg_name = alg_name
+                config.task_name = task_name
+                config.desc = desc
 
-            # Create the experiment directory
+                config_unique_dict = {k: v for k, v in param_dict.items() if k in varied_params}
+                config_unique_dict['alg_name'] = config.alg_name
+                config_unique_dict['task_name'] = config.task_name
+                config_unique_dict['seed'] = config.seed
 
-            dir_tree = create_experiment_dir(storage_name_id, config, config_unique_dict, SEEDS, root_dir, git_hashes)
+                for param_name in param_dict.keys():
+                    if param_name not in config_dict.keys():
+                        raise ValueError(f"'{param_name}' taken from the schedule is not a valid hyperparameter "
+                                         f"i.e. it cannot be found in the Namespace returned by get_run_args().")
+                    else:
+                        config_dict[param_name] = param_dict[param_name]
 
-        all_storage_dirs.append(dir_tree.storage_dir)
+                configs.append(config)
+                config_unique_dicts.append(config_unique_dict)
+                resources_dicts.append(get_experiment_resources(schedule, config))
 
-        # Saves VARIATIONS in the storage directory
+            # Create the experiment directories
+
+            start_time = time.time()
+            storage_dir, experiment_nums = create_experiment_dirs(storage_name_id, configs, config_unique_dicts,
+                                                                  SEEDS, root_dir, git_hashes, n_io_threads,
+                                                                  use_base_configs, resources_dicts)
+            creation_time += time.time() - start_time
+            n_seed_dirs_created += len(experiment_nums) * len(SEEDS)
+
+            if first_experiment_created is None:
+                first_experiment_created = experiment_nums[0]
+            last_experiment_created = experiment_nums[-1]
 
-        first_experiment_created = int(dir_tree.current_experiment.strip('experiment')) - len(experiments[0]) + 1
-        last_experiment_created = first_experiment_created + len(experiments[0]) - 1
+        if storage_dir is None:
+            logger.warning(f"No experiment to create for alg_name={alg_name}, task_name={task_name}")
+            continue
+
+        all_storage_dirs.append(storage_dir)
+
+        # Saves VARIATIONS in the storage directory
 
         if search_type == 'grid':
 
@@ -349,15 +502,15 @@ def prepare_schedule(desc, schedule_file, root_dir, add_to_folder, resample, log
 
             key = f'{first_experiment_created}-{last_experiment_created}'
 
-            if (dir_tree.storage_dir / 'variations.json').exists():
-                variations_dict = load_dict_from_json(filename=str(dir_tree.storage_dir / 'variations.json'))
+            if (storage_dir / 'variations.json').exists():
+                variations_dict = load_dict_from_json(filename=str(storage_dir / 'variations.json'))
                 assert key not in variations_dict.keys()
                 variations_dict[key] = VARIATIONS
             else:
                 variations_dict = {key: VARIATIONS}
 
-            save_dict_to_json(variations_dict, filename=str(dir_tree.storage_dir / 'variations.json'))
-            open(str(dir_tree.storage_dir / 'GRID_SEARCH'), 'w+').close()
+            save_dict_to_json(variations_dict, filename=str(storage_dir / 'variations.json'))
+            open(str(storage_dir / 'GRID_SEARCH'), 'w+').close()
 
         elif search_type == 'random':
             len_samples = len(param_samples[alg_task_i])
@@ -371,19 +524,22 @@ def prepare_schedule(desc, schedule_file, root_dir, add_to_folder, resample, log
 
             j = 1
             while True:
-                if (dir_tree.storage_dir / f'variations{j}.png').exists():
+                if (storage_dir / f'variations{j}.png').exists():
                     j += 1
                 else:
                     break
-            fig.savefig(str(dir_tree.storage_dir / f'variations{j}.png'))
+            fig.savefig(str(storage_dir / f'variations{j}.png'))
             plt.close(fig)
 
-            open(str(dir_tree.storage_dir / 'RANDOM_SEARCH'), 'w+').close()
+            open(str(storage_dir / 'RANDOM_SEARCH'), 'w+').close()
 
         # Printing summary
 
         logger.info(f'Created directories '
-                    f'{str(dir_tree.storage_dir)}/experiment{first_experiment_created}-{last_experiment_created}')
+                    f'{str(storage_dir)}/experiment{first_experiment_created}-{last_experiment_created}')
+
+    logger.info(f"Created {n_seed_dirs_created} seed directories in {creation_time:.1f}s "
+                f"({n_seed_dirs_created / max(creation_time, 1e-6):.0f} dirs/sec)")
 
     # Saving the list of created storage_dirs in a text file located with the provided schedule_file
 
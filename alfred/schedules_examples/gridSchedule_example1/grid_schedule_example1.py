@@ -37,6 +37,22 @@ assert "task_name" not in VARIATIONS.keys()
 
 check_params_defined_twice(keys=list(VARIATIONS.keys()))
 
+# [OPTIONAL] The grid is expanded lazily, one experiment at a time. Experiments can be discarded with a predicate
+# 'filter_experiment' (returning False for the experiments to skip) and/or randomly subsampled with SUBSAMPLE_FRACTION
+
+# def filter_experiment(experiment):
+#     return not (experiment['optimizer'] == "sgd" and experiment['learning_rate'] < 0.01)
+
+# SUBSAMPLE_FRACTION = 0.5
+
+# [OPTIONAL] Resources needed by each run, used by 'alfred.launch_schedule --pack_resources=True' to pack the runs
+# on the cpus of the node. Either a dict RESOURCES shared by all experiments or a function 'get_resources(config)'
+
+# RESOURCES = {'n_cpus': 2, 'memory_gb': 4}
+
+# def get_resources(config):
+#     return {'n_cpus': 4 if config.optimizer == "adam" else 1}
+
 
 # (5) Function that returns the hyperparameters for the current search
 
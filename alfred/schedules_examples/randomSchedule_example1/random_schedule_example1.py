@@ -48,6 +48,19 @@ def sample_experiment():
 
    check_params_defined_twice(keys=list(sampled_config.keys()))
 
+   return sampled_config
+
+
+# [OPTIONAL] Instead of sample_experiment(), a batched version can be defined. It receives the number of experiments
+# to sample and returns, for each hyperparam, an array containing all the sampled values. This makes sampling
+# (and resampling for each alg_name*task_name combination) much faster for large searches.
+
+# def sample_experiments(n):
+#     return {
+#         'learning_rate': 10. ** np.random.uniform(low=-8., high=-3., size=n),
+#         'optimizer': np.full(n, "sgd"),
+#     }
+
 
 # (6) Function that returns the hyperparameters for the current search
 
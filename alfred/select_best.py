@@ -0,0 +1,131 @@
+from alfred.utils.directory_tree import get_all_seeds, sanity_check_exists, DirectoryTree
+from alfred.utils.config import parse_bool, parse_log_level
+from alfred.utils.misc import create_logger, select_storage_dirs
+from alfred.aggregate_results import aggregate_storage_dirs, SEED_STATS
+from alfred.copy_config import copy_seed_configs
+
+import argparse
+import logging
+import os
+
+
+def get_select_best_args():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-f', '--from_file', type=str, default=None,
+                        help="Path containing all the storage_names from which to select the best experiments")
+
+    parser.add_argument('-s', '--storage_name', type=str, default=None)
+
+    parser.add_argument('--metric', type=str, required=True,
+                        help="Name of the recorded metric used to rank the experiments")
+    parser.add_argument('--stat', type=str, default='final', choices=SEED_STATS,
+                        help="Statistic of the metric (averaged across seeds) used to rank the experiments")
+    parser.add_argument('--higher_is_better', type=parse_bool, default=True)
+    parser.add_argument('--top_k', type=int, default=1)
+
+    parser.add_argument('--n_seeds', type=int, default=10,
+                        help="Number of new seeds to run for each selected experiment")
+    parser.add_argument('--seeds', type=int, nargs='+', default=None,
+                        help="Seeds to run for each selected experiment. "
+                             "Defaults to the n_seeds seeds following the largest seed of the search")
+    parser.add_argument('--new_desc', type=str, default='retrainBest')
+    parser.add_argument('--append_new_desc', type=parse_bool, default=True)
+
+    parser.add_argument('--recorder_path', type=str, default='metrics.pkl')
+    parser.add_argument('--n_processes', type=int, default=os.cpu_count())
+    parser.add_argument('--n_io_threads', type=int, default=8)
+
+    parser.add_argument('-r', '--root_dir', default=None, type=str)
+    parser.add_argument('--log_level', type=parse_log_level, default=logging.INFO)
+    return parser.parse_args()
+
+
+def rank_experiments(summary, stat, higher_is_better):
+    """
+    Sorts the rows of a summary (see alfred.aggregate_results) from best to worst experiment
+    """
+    return sorted(summary, key=lambda row: row[f'{stat}_mean'], reverse=higher_is_better)
+
+
+def select_best(from_file, storage_name, metric, stat, higher_is_better, top_k, n_seeds, seeds, new_desc,
+                append_new_desc, recorder_path, n_processes, n_io_threads, logger, root_dir):
+    # Select storage_dirs to run over
+
+    storage_dirs = select_storage_dirs(from_file, storage_name, root_dir)
+
+    # Sanity-check that storages exist
+
+    storage_dirs = [storage_dir for storage_dir in storage_dirs if sanity_check_exists(storage_dir, logger)]
+
+    # Summaries are computed from the cached per-seed statistics (only modified recorders are read again)
+
+    summaries = aggregate_storage_dirs(storage_dirs=storage_dirs,
+                                       metric=metric,
+                                       recorder_path=recorder_path,
+                                       higher_is_better=higher_is_better,
+                                       n_processes=n_processes,
+                                       logger=logger)
+
+    new_storage_dirs = []
+    for storage_dir in storage_dirs:
+        best_rows = rank_experiments(summaries[storage_dir], stat, higher_is_better)[:top_k]
+
+        if len(best_rows) == 0:
+            logger.warning(f"No results found for metric '{metric}' in {storage_dir}. Skipping.")
+            continue
+
+        logger.info(f"Best experiments of {storage_dir} ({stat} {metric}):\n" +
+                    "\n".join([f"    {row['experiment']}: {row[f'{stat}_mean']:.4g} +/- {row[f'{stat}_std']:.4g} "
+                               f"({row['n_seeds']} seeds)" for row in best_rows]))
+
+        # Copies the configs of the best experiments with new seeds
+
+        best_experiments = set([row['experiment'] for row in best_rows])
+        all_seeds = get_all_seeds(storage_dir)
+        seeds_to_copy = [seed_dir for seed_dir in all_seeds if seed_dir.parent.name in best_experiments]
+
+        if seeds is None:
+            max_seed = max([int(seed_dir.name.split('seed')[1]) for seed_dir in all_seeds])
+            new_seeds = list(range(max_seed + 1, max_seed + 1 + n_seeds))
+        else:
+            new_seeds = seeds
+
+        _, _, _, _, old_desc = DirectoryTree.extract_info_from_storage_name(storage_dir.name)
+        desc = f"{old_desc}_{new_desc}" if append_new_desc else new_desc
+
+        new_storage_dir, new_seed_dirs = copy_seed_configs(seeds_to_copy=seeds_to_copy,
+                                                           desc=desc,
+                                                           additional_params=None,
+                                                           root_dir=root_dir,
+                                                           new_seeds=new_seeds,
+                                                           n_io_threads=n_io_threads)
+
+        open(str(new_storage_dir / f'config_copied_from_{str(storage_dir.name)}'), 'w+').close()
+        logger.info(f"Created {len(new_seed_dirs)} seed_dirs in {new_storage_dir}")
+        new_storage_dirs.append(new_storage_dir)
+
+    if len(new_storage_dirs) > 0:
+        logger.info(f"To launch them:\n" + "\n".join([storage_dir.name for storage_dir in new_storage_dirs]))
+
+    return new_storage_dirs
+
+
+if __name__ == '__main__':
+    args = get_select_best_args()
+    logger = create_logger(name="SELECT BEST - MASTER", loglevel=args.log_level)
+    select_best(from_file=args.from_file,
+                storage_name=args.storage_name,
+                metric=args.metric,
+                stat=args.stat,
+                higher_is_better=args.higher_is_better,
+                top_k=args.top_k,
+                n_seeds=args.n_seeds,
+                seeds=args.seeds,
+                new_desc=args.new_desc,
+                append_new_desc=args.append_new_desc,
+                recorder_path=args.recorder_path,
+                n_processes=args.n_processes,
+                n_io_threads=args.n_io_threads,
+                logger=logger,
+                root_dir=args.root_dir)
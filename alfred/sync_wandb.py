@@ -1,5 +1,7 @@
 import argparse
 import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 from alfred.utils.config import parse_bool
 from alfred.utils.misc import create_logger
@@ -17,23 +19,31 @@ def get_synch_wandb_args():
     parser.add_argument('--ask_for_validation', type=parse_bool, default=True)
     parser.add_argument('--project', type=str, default='il_without_rl', help="Project you want to upload to")
     parser.add_argument('--entity', type=str, default='irl_la_forge', help="Entity you want to upload to")
+    parser.add_argument('--n_parallel', type=int, default=4,
+                        help="Number of 'wandb sync' subprocesses running at the same time")
+    parser.add_argument('--resync', type=parse_bool, default=False,
+                        help="If true, also syncs the runs that have already been synced successfully")
+    parser.add_argument('--wandb_executable', type=str, default='wandb')
 
     return parser.parse_args()
 
 
-def sync_wandb(root_dir, tag, ask_for_validation, project, entity, logger):
-    # Define sync command line
+# Marker written in each run directory once it has been synced successfully
 
-    command_line = f"wandb sync --project {project} --entity {entity} "
+SYNCED_MARKER = '.alfred_synced'
 
-    if not os.name == "posix":
-        command_line = command_line.split(" ")
+
+def sync_wandb(root_dir, tag, ask_for_validation, project, entity, logger, n_parallel=4, resync=False,
+               wandb_executable='wandb'):
+    # Define sync command line (the run directory is appended for each run)
+
+    command_line = [wandb_executable, 'sync', '--project', project, '--entity', entity]
 
     # Select the root dir
 
-    child_dirs = [child for child in root_dir.iterdir() if tag in child.name]
+    child_dirs = [child for child in Path(root_dir).iterdir() if tag in child.name]
 
-    info_string = f"Folders to be synced to {entity}\{project}: \n"
+    info_string = f"Folders to be synced to {entity}/{project}: \n"
 
     for child in child_dirs:
         info_string += str(child) + "\n"
@@ -49,19 +59,60 @@ def sync_wandb(root_dir, tag, ask_for_validation, project, entity, logger):
             logger.debug("Aborting...")
             return
 
-        logger.info("Starting...")
+    logger.info("Starting...")
+
+    # Get all wandb folders (the ones that have already been synced are skipped)
+    # wandb links the last run of a folder as 'latest-run', so symlinks are skipped and runs are deduplicated
 
+    runs_to_sync = []
+    n_skipped = 0
+    seen_runs = set()
     for child in child_dirs:
+        for run_dir in child.glob('**/wandb/*run*/'):
+            if run_dir.is_symlink() or run_dir.resolve() in seen_runs:
+                continue
+            seen_runs.add(run_dir.resolve())
+
+            if not resync and (run_dir / SYNCED_MARKER).exists():
+                n_skipped += 1
+            else:
+                runs_to_sync.append(run_dir)
+
+    logger.info(f"{len(runs_to_sync)} runs to sync ({n_skipped} already synced)")
+
+    # Syncs them concurrently, failures are collected instead of aborting the other syncs
+
+    def sync(run_dir):
+        try:
+            result = subprocess.run(command_line + [run_dir.name], cwd=str(run_dir.parent),
+                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        except OSError as e:
+            # e.g. the wandb executable is missing or not executable
+            result = subprocess.CompletedProcess(args=command_line + [run_dir.name], returncode=-1, stdout=f'{e}\n')
+
+        if result.returncode == 0:
+            open(str(run_dir / SYNCED_MARKER), 'w+').close()
+            logger.info(f"Synced {run_dir}")
+        else:
+            logger.warning(f"Failed to sync {run_dir} (exit code {result.returncode})")
+
+        return result
+
+    with ThreadPoolExecutor(max_workers=n_parallel) as executor:
+        results = list(executor.map(sync, runs_to_sync))
 
-        # get all wandb folders
+    failures = [(run_dir, result) for run_dir, result in zip(runs_to_sync, results) if result.returncode != 0]
 
-        wandb_dirs = child.glob('**/wandb/*run*/')
+    logger.info(f"{len(runs_to_sync) - len(failures)} runs synced, {n_skipped} skipped, {len(failures)} failed")
 
-        for to_sync in wandb_dirs:
-            logger.info(subprocess.run(command_line + str(to_sync.name), shell=True, cwd=str(to_sync.parent),
-                                       check=True))
+    if len(failures) > 0:
+        failures_string = "The following runs could not be synced (re-run the same command to retry them):\n"
+        for run_dir, result in failures:
+            last_lines = result.stdout.strip().split('\n')[-3:]
+            failures_string += f"--- {run_dir}\n" + "".join([f"        {line}\n" for line in last_lines])
+        logger.warning(failures_string)
 
-        logger.info(f'Storage {child} has been synced \n')
+    return failures
 
 
 if __name__ == '__main__':
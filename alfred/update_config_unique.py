@@ -28,13 +28,10 @@ def _update_config_unique(from_file, storage_name, root_dir):
         logger.info(str(storage_to_copy))
         seeds_to_copy = get_all_seeds(storage_to_copy)
 
-        # find the path to all the configs files
+        # loads all the configs files
 
-        for dir in seeds_to_copy:
-            config_path = dir / 'config.json'
+        for dir, (config, config_unique_dict) in zip(seeds_to_copy, load_seed_configs(seeds_to_copy)):
             config_unique_path = dir / 'config_unique.json'
-            config = load_config_from_json(str(config_path))
-            config_unique_dict = load_dict_from_json(str(config_unique_path))
 
             try:
                 # check if configs are the same
@@ -1,7 +1,28 @@
+import os
 import logging
 import json
+import hashlib
 import argparse
+import threading
+from pathlib import Path
 from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+import alfred.defaults
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# In-process cache of the json files: filename -> (file_state, content), its size is bounded by
+# alfred.defaults.DEFAULT_JSON_CACHE_MAX_SIZE. Files are read by many threads (see load_seed_configs).
+
+_JSON_CACHE = {}
+_JSON_CACHE_LOCK = threading.Lock()
+
+# Name of the file replacing config.json and config_unique.json in seed_dirs created with base configs
+
+CONFIG_OVERRIDES_FILENAME = 'config_overrides.json'
 
 
 def parse_bool(bool_arg):
@@ -57,10 +78,15 @@ def load_dict_from_json(filename):
     :param filename: full filename to json file from which to load the config
     :return: dictionary object with content from the json file
     """
-    with open(filename, 'r') as f:
-        loaded_dict = json.load(f)
+    try:
+        return _read_json(filename)
+    except FileNotFoundError:
+        if not _has_config_overrides(filename):
+            raise
 
-    return loaded_dict
+    # config.json and config_unique.json of seed_dirs created with base configs are rebuilt from their overrides
+
+    return _load_from_config_overrides(filename)
 
 
 def save_dict_to_json(dictionary, filename):
@@ -91,8 +117,7 @@ def load_config_from_json(filename):
     :param filename: full filename to json file from which to load the config
     :return: argparse.ArgumentParser.parse_args() object (NameSpace) populated as in the json file
     """
-    with open(filename, 'r') as f:
-        loaded_config_dict = json.load(f)
+    loaded_config_dict = load_dict_from_json(filename)
 
     # Creates a pointer to default NameSpace dict
     config = SimpleNamespace()
@@ -103,6 +128,111 @@ def load_config_from_json(filename):
     return config
 
 
+def save_config_with_base(config_dict, config_unique_dict, seed_dir, override_keys=('seed',)):
+    """
+    Saves the config of a seed_dir as a base config shared by all the seed_dirs of the storage_dir having
+    the same config (storage_dir/base_configs/<hash>.json, named after the hash of its content) and a small
+    seed_dir/config_overrides.json containing the keys specific to this seed_dir. load_dict_from_json() and
+    load_config_from_json() resolve seed_dir/config.json and seed_dir/config_unique.json from these files.
+    :param config_dict: full config of the seed_dir
+    :param config_unique_dict: dictionary of what makes this seed_dir unique (all its keys must be in config_dict)
+    :param override_keys: keys of config_dict that are stored with the seed_dir instead of in the base config
+    """
+    assert all([key in config_dict for key in config_unique_dict.keys()])
+
+    base_config_dict = {key: value for key, value in config_dict.items() if key not in override_keys}
+    content = json.dumps(base_config_dict, sort_keys=True).encode('utf-8')
+    base_config_hash = hashlib.sha1(content).hexdigest()
+
+    # Base configs are immutable: they are only written once (atomically) per storage_dir
+
+    base_configs_dir = Path(seed_dir).parents[1] / 'base_configs'
+    base_config_path = base_configs_dir / f'{base_config_hash}.json'
+    if not base_config_path.exists():
+        os.makedirs(str(base_configs_dir), exist_ok=True)
+        tmp_path = base_configs_dir / f'.{base_config_hash}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(str(tmp_path), 'wb') as f:
+            f.write(content)
+        os.replace(str(tmp_path), str(base_config_path))
+
+    save_dict_to_json({'base_config': base_config_hash,
+                       'overrides': {key: config_dict[key] for key in override_keys if key in config_dict},
+                       'unique_keys': list(config_unique_dict.keys())},
+                      filename=str(Path(seed_dir) / CONFIG_OVERRIDES_FILENAME))
+
+
+def load_seed_configs(seed_dirs, n_threads=8):
+    """
+    Loads the config.json and config_unique.json of many seed_dirs with a pool of threads
+    (which overlaps the latency of the filesystem, e.g. on network filesystems)
+    :param seed_dirs: list of seed_dirs (pathlib.Path)
+    :return: list of (config, config_unique_dict), in the same order as seed_dirs
+    """
+    def load(seed_dir):
+        return load_config_from_json(str(seed_dir / 'config.json')), \
+               load_dict_from_json(str(seed_dir / 'config_unique.json'))
+
+    if n_threads <= 1 or len(seed_dirs) <= 1:
+        return [load(seed_dir) for seed_dir in seed_dirs]
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        return list(executor.map(load, seed_dirs))
+
+
+def _read_json(filename):
+    # The content of the file is cached and only used if the file has not been modified (nor replaced) since
+    # it was read. Raw bytes are cached rather than loaded dicts: decoding them returns a fresh copy (that
+    # callers are free to modify) and they are not scanned by the garbage collector.
+
+    filename = str(filename)
+    stat = os.stat(filename)
+    file_state = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    cached = _JSON_CACHE.get(filename)
+    if cached is not None and cached[0] == file_state:
+        content = cached[1]
+
+    else:
+        with open(filename, 'rb', buffering=0) as f:
+            content = f.readall()
+
+        max_size = alfred.defaults.DEFAULT_JSON_CACHE_MAX_SIZE
+        with _JSON_CACHE_LOCK:
+            while len(_JSON_CACHE) > 0 and len(_JSON_CACHE) >= max_size:
+                del _JSON_CACHE[next(iter(_JSON_CACHE))]
+            if max_size > 0:
+                _JSON_CACHE[filename] = (file_state, content)
+
+    # orjson is used when installed (it rejects NaN and Infinity, which json.dump can write)
+
+    if orjson is not None:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            pass
+
+    return json.loads(content)
+
+
+def _has_config_overrides(filename):
+    filename = Path(filename)
+    return filename.name in ['config.json', 'config_unique.json'] \
+           and (filename.parent / CONFIG_OVERRIDES_FILENAME).exists()
+
+
+def _load_from_config_overrides(filename):
+    filename = Path(filename)
+    config_overrides = _read_json(filename.parent / CONFIG_OVERRIDES_FILENAME)
+
+    config_dict = _read_json(filename.parents[2] / 'base_configs' / f"{config_overrides['base_config']}.json")
+    config_dict.update(config_overrides['overrides'])
+
+    if filename.name == 'config.json':
+        return config_dict
+    else:
+        return {key: config_dict[key] for key in config_overrides['unique_keys']}
+
+
 def config_to_str(config):
     config_string = 'Configs'
     for arg in vars(config):
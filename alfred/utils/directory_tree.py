@@ -1,7 +1,32 @@
 import os
+import time
+import shutil
+import socket
+import threading
+import uuid
 import subprocess
+import datetime
 from pathlib import Path
 import alfred.defaults
+from alfred.utils.config import save_dict_to_json, save_config_with_base
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, counters are then incremented without lock
+    fcntl = None
+
+# FLAG-files that can be found in a seed_dir (see README)
+
+SEED_FLAGS = ['UNHATCHED', 'PREEMPTED', 'OPENED', 'COMPLETED', 'CRASH', 'PRUNED', 'TIMEOUT']
+
+# FLAG-files of the seed_dirs that can be claimed by alfred.launch_schedule
+
+RUNNABLE_FLAGS = ['UNHATCHED', 'PREEMPTED']
+
+# Checkpoints registered by the run of a seed_dir (see DirectoryTree.register_checkpoint)
+
+CHECKPOINTS_FILENAME = 'checkpoints.log'
 
 
 class DirectoryTree(object):
@@ -30,13 +55,15 @@ class DirectoryTree(object):
         else:
             n_letters = 2
             git_name_short = get_git_name()[:n_letters]
-            exst_ids_numbers = [int(folder.name.split('_')[0][n_letters:]) for folder in self.root.iterdir()
-                                if folder.is_dir() and folder.name.split('_')[0].startswith(git_name_short)]
 
-            if len(exst_ids_numbers) == 0:
-                id = f'{git_name_short}1'
-            else:
-                id = f'{git_name_short}{(max(exst_ids_numbers) + 1)}'
+            def get_max_existing_id():
+                exst_ids_numbers = [int(folder.name.split('_')[0][n_letters:]) for folder in self.root.iterdir()
+                                    if folder.is_dir() and folder.name.split('_')[0].startswith(git_name_short)]
+                return max(exst_ids_numbers, default=0)
+
+            id_number = reserve_from_counter(counter_file=self.root / f'.storage_id_counter_{git_name_short}',
+                                             get_initial_value=get_max_existing_id)
+            id = f'{git_name_short}{id_number}'
 
         # Adds code versions (git-hash) for tracked projects
 
@@ -65,13 +92,8 @@ class DirectoryTree(object):
             if not self.storage_dir.exists():
                 self.current_experiment = 'experiment1'
             else:
-                exst_run_nums = [int(str(folder.name).split('experiment')[1]) for folder in self.storage_dir.iterdir()
-                                 if str(folder.name).startswith('experiment')]
-
-                if len(exst_run_nums) == 0:
-                    self.current_experiment = 'experiment1'
-                else:
-                    self.current_experiment = f'experiment{(max(exst_run_nums) + 1)}'
+                experiment_num = DirectoryTree.reserve_experiment_nums(self.storage_dir)
+                self.current_experiment = f'experiment{experiment_num}'
 
         # Level 2: experiment_dir
 
@@ -81,12 +103,35 @@ class DirectoryTree(object):
 
         self.seed_dir = self.experiment_dir / f"seed{seed}"
 
+        # Newest checkpoint of a run that has been interrupted (set by alfred.launch_schedule when resuming it)
+
+        self.resume_checkpoint = None
+
     def create_directories(self):
         os.makedirs(str(self.seed_dir))
 
     def get_run_name(self):
         return self.storage_dir.name + '_' + self.experiment_dir.name + '_' + self.seed_dir.name
 
+    def register_checkpoint(self, path):
+        """
+        Registers a checkpoint saved by the run of this seed_dir (to be called by main.main() once the checkpoint
+        has been entirely written). If the run is interrupted, alfred.clean_interrupted keeps the seed_dir as
+        PREEMPTED instead of wiping it, and alfred.launch_schedule resumes it by giving the newest checkpoint to
+        main.main() as dir_tree.resume_checkpoint.
+        :param path (str or pathlib.Path): path of the checkpoint (preferably inside the seed_dir)
+        """
+        path = Path(path).absolute()
+        seed_dir = self.seed_dir.absolute()
+        if seed_dir in path.parents:
+            path = path.relative_to(seed_dir)
+
+        fd = os.open(str(self.seed_dir / CHECKPOINTS_FILENAME), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, f"{path}\n".encode('utf-8'))
+        finally:
+            os.close(fd)
+
     @staticmethod
     def get_all_experiments(storage_dir):
         all_experiments = [path for path in storage_dir.iterdir()
@@ -101,6 +146,22 @@ class DirectoryTree(object):
 
         return sorted(all_seeds, key=lambda item: (int(str(item.stem).strip('seed')), item))
 
+    @staticmethod
+    def reserve_experiment_nums(storage_dir, n=1):
+        """
+        Reserves n consecutive experiment numbers in an existing storage_dir (safe for concurrent processes)
+        :return: the first reserved experiment number
+        """
+
+        def get_max_existing_experiment():
+            exst_run_nums = [int(str(folder.name).split('experiment')[1]) for folder in storage_dir.iterdir()
+                             if str(folder.name).startswith('experiment')]
+            return max(exst_run_nums, default=0)
+
+        return reserve_from_counter(counter_file=storage_dir / '.experiment_counter',
+                                    get_initial_value=get_max_existing_experiment,
+                                    n=n)
+
     @classmethod
     def init_from_seed_path(cls, seed_path, root):
         assert isinstance(seed_path, Path)
@@ -193,22 +254,458 @@ def get_all_seeds(storage_dir):
     return all_seeds_dirs
 
 
-def get_git_hash(path):
+def get_seeds_status(storage_dir):
+    """
+    Classifies all the seed directories of a storage_dir according to their FLAG-file in a single pass
+    over the directory-tree (one os.scandir per directory, no stat per FLAG-file)
+    - a seed_dir without FLAG-file is being run or has been interrupted and is considered 'OPENED' (see README)
+    :return: dict seed_dir -> status, sorted numerically (by experiment then by seed) like get_all_seeds()
+    """
+    experiments = _scan_numbered_dirs(storage_dir, 'experiment')
+
+    seeds_status = {}
+    for _, experiment_path in experiments:
+        for _, seed_path in _scan_numbered_dirs(experiment_path, 'seed'):
+            with os.scandir(seed_path) as entries:
+                file_names = set([entry.name for entry in entries])
+
+            status = next((flag for flag in SEED_FLAGS if flag in file_names), 'OPENED')
+            seeds_status[Path(seed_path)] = status
+
+    return seeds_status
+
+
+def _scan_numbered_dirs(path, prefix):
+    with os.scandir(path) as entries:
+        numbered_dirs = [(int(entry.name[len(prefix):]), entry.path) for entry in entries
+                         if entry.name.startswith(prefix) and entry.is_dir()]
+
+    return sorted(numbered_dirs)
+
+
+def reserve_from_counter(counter_file, get_initial_value, n=1):
+    """
+    Reserves n consecutive numbers from a counter stored in a file. The file is locked while it is
+    read and incremented, so that concurrent processes (possibly on different nodes) never get the same number.
+    :param counter_file (pathlib.Path): file containing the last reserved number
+    :param get_initial_value (callable): returns the last number already in use if the counter file does not exist yet
+    :param n (int): how many numbers to reserve
+    :return: the first reserved number
+    """
+    fd = os.open(str(counter_file), os.O_RDWR | os.O_CREAT, 0o644)
     try:
-        return subprocess.check_output(
-            ["git", "--git-dir", os.path.join(path, '.git'), "rev-parse", "--short", "HEAD"]).decode(
-            "utf-8").strip()
+        if fcntl is not None:
+            fcntl.lockf(fd, fcntl.LOCK_EX)
 
-    except subprocess.CalledProcessError:
-        return 'NoGitHash'
+        content = os.read(fd, 64).decode('utf-8').strip()
+        last_value = int(content) if content != '' else get_initial_value()
+
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{last_value + n}\n".encode('utf-8'))
+
+    finally:
+        # closing the file descriptor releases the lock
+        os.close(fd)
+
+    return last_value + 1
+
+
+def claim_seed(seed_dir):
+    """
+    Atomically claims a seed_dir by renaming its UNHATCHED (or PREEMPTED) flag to OPENED. Only one of the processes
+    trying to claim the same seed_dir can succeed (this holds across nodes sharing the same filesystem).
+    The OPENED flag is then used as a lease containing the hostname, pid and time of the claim, and a unique lease id.
+    :param seed_dir (pathlib.Path): seed_dir to claim
+    :return: the lease id if the seed_dir has been claimed by this process, None if it was already hatched
+    """
+    for flag in RUNNABLE_FLAGS:
+        try:
+            os.rename(str(seed_dir / flag), str(seed_dir / 'OPENED'))
+            break
+        except FileNotFoundError:
+            continue
+    else:
+        return None
+
+    lease = uuid.uuid4().hex
+    with open(str(seed_dir / 'OPENED'), 'w') as f:
+        f.write(f"host={socket.gethostname()}\n"
+                f"pid={os.getpid()}\n"
+                f"claimed_at={datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S')}\n"
+                f"lease={lease}\n")
+
+    return lease
+
+
+def get_lease(seed_dir, flag='OPENED'):
+    """
+    Returns the lease id written by claim_seed() in the OPENED flag of a seed_dir, or None if the seed_dir is not
+    claimed (or has been claimed by an older version of alfred, whose OPENED flags are empty)
+    """
+    try:
+        with open(str(seed_dir / flag), 'r') as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None
+
+    for line in lines:
+        if line.startswith('lease='):
+            return line[len('lease='):]
+
+    return None
+
+
+def release_seed(seed_dir, flag, content='', lease=None):
+    """
+    Releases the lease of a seed_dir claimed by this process by replacing its OPENED flag with 'flag'.
+    The OPENED flag is first atomically renamed to a name private to this call, so that its lease can be checked
+    without another process claiming or reclaiming the seed_dir in the meantime.
+    :param content (str): content written in the new FLAG-file
+    :param lease (str): lease id returned by claim_seed(). If provided, the OPENED flag is only replaced if it
+                        still holds this lease (otherwise the seed_dir has been reclaimed and claimed again)
+    :return: False if the lease had already been lost (the seed_dir has been reclaimed), True otherwise
+    """
+    releasing_flag = f'.RELEASING.{uuid.uuid4().hex}'
+    try:
+        os.rename(str(seed_dir / 'OPENED'), str(seed_dir / releasing_flag))
+    except FileNotFoundError:
+        return False
+
+    # The OPENED flag of another claim is given back to its owner
+
+    if lease is not None and get_lease(seed_dir, flag=releasing_flag) != lease:
+        os.rename(str(seed_dir / releasing_flag), str(seed_dir / 'OPENED'))
+        return False
+
+    os.remove(str(seed_dir / releasing_flag))
+    with open(str(seed_dir / flag), 'w+') as f:
+        f.write(content)
+
+    return True
+
+
+def is_lease_expired(seed_dir, lease_timeout):
+    """
+    Returns True if the OPENED flag of a seed_dir has not been touched (see Heartbeat) for more than lease_timeout
+    seconds. Seeds without OPENED flag (not claimed) never expire. Neither do the seeds claimed by an older
+    version of alfred: their OPENED flag has no lease id and no heartbeat, so whether their run is still going
+    is unknown (see clean_interrupted --clean_opened).
+    """
+    try:
+        last_heartbeat = os.stat(str(seed_dir / 'OPENED')).st_mtime
+    except FileNotFoundError:
+        return False
+
+    return time.time() - last_heartbeat > lease_timeout and get_lease(seed_dir) is not None
+
+
+def reclaim_seed(seed_dir, lease_timeout, resume=True):
+    """
+    Makes a seed_dir whose lease has expired runnable again (see requeue_seed_dir). The OPENED flag is first
+    atomically renamed to RECLAIMING, so that only one of the processes trying to reclaim the same seed_dir can succeed.
+    :return: the new status of the seed_dir if it has been reclaimed by this process, None otherwise
+    """
+    if not is_lease_expired(seed_dir, lease_timeout):
+        return None
+
+    try:
+        os.rename(str(seed_dir / 'OPENED'), str(seed_dir / 'RECLAIMING'))
+    except FileNotFoundError:
+        return None
+
+    # The run may have sent a heartbeat between the check and the rename, in which case it is given back its lease
+
+    if time.time() - os.stat(str(seed_dir / 'RECLAIMING')).st_mtime <= lease_timeout:
+        os.rename(str(seed_dir / 'RECLAIMING'), str(seed_dir / 'OPENED'))
+        return None
+
+    return requeue_seed_dir(seed_dir, resume=resume)
+
+
+def requeue_seed_dir(seed_dir, resume=True):
+    """
+    Makes the seed_dir of an interrupted run runnable again. If the run has registered checkpoints (and resume
+    is True), the seed_dir is kept as is and only its flag is replaced with PREEMPTED, so that the run can
+    be resumed from its newest checkpoint. Otherwise it is reset to its UNHATCHED state (see reset_seed_dir).
+    :return: the new status of the seed_dir ('PREEMPTED' or 'UNHATCHED')
+    """
+    if not resume or get_last_checkpoint(seed_dir) is None:
+        reset_seed_dir(seed_dir)
+        return 'UNHATCHED'
+
+    # The previous flags are removed before the new one is created, so that a claim can never overwrite them
+
+    for flag in SEED_FLAGS + ['RECLAIMING']:
+        try:
+            os.remove(str(seed_dir / flag))
+        except FileNotFoundError:
+            pass
+
+    open(str(seed_dir / 'PREEMPTED'), 'w+').close()
+    return 'PREEMPTED'
+
+
+def get_last_checkpoint(seed_dir):
+    """
+    Returns the path of the newest checkpoint registered by the run of a seed_dir that still exists
+    (see DirectoryTree.register_checkpoint), or None if there is none
+    """
+    try:
+        with open(str(seed_dir / CHECKPOINTS_FILENAME), 'r') as f:
+            paths = f.read().splitlines()
+    except FileNotFoundError:
+        return None
+
+    for path in reversed(paths):
+        if path != '' and (seed_dir / path).exists():
+            return seed_dir / path
+
+    return None
+
+
+def reset_seed_dir(seed_dir):
+    """
+    Removes everything from a seed_dir except its config files and marks it as UNHATCHED
+    """
+    for path in seed_dir.iterdir():
+        if path.name not in ["config.json", "config_unique.json", "config_overrides.json"]:
+            if path.is_dir():
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        else:
+            continue
+
+    open(str(seed_dir / 'UNHATCHED'), 'w+').close()
+
+
+def create_seed_dir(seed_dir, config_dict, config_unique_dict, use_base_configs=False):
+    """
+    Creates a seed_dir with its config files and its UNHATCHED flag (ready to be run by alfred.launch_schedule)
+    :param use_base_configs (bool): if True, the config is saved as a base config (see save_config_with_base)
+    """
+    os.makedirs(str(seed_dir))
+
+    if use_base_configs:
+
+        # Saves the config as a shared base config and the overrides of this seed_dir
+
+        save_config_with_base(config_dict, config_unique_dict, seed_dir)
+
+    else:
+
+        # Saves the config as json file (to be run later)
+
+        save_dict_to_json(config_dict, filename=str(seed_dir / 'config.json'))
+
+        # Saves a dictionary of what makes each seed_dir unique (just for display on graphs)
+
+        save_dict_to_json(config_unique_dict, filename=str(seed_dir / 'config_unique.json'))
+
+    # Creates empty file UNHATCHED meaning that the experiment is ready to be run
+
+    open(str(seed_dir / 'UNHATCHED'), 'w+').close()
+
+
+class Heartbeat(object):
+    def __init__(self, seed_dir, interval, lease=None, n_retries=5, retry_interval=0.1):
+        """
+        Background thread keeping alive the lease of a seed_dir claimed by this process, by touching
+        its OPENED flag every 'interval' seconds (see is_lease_expired). If the OPENED flag is missing, the touch
+        is retried n_retries times every retry_interval seconds before the lease is considered lost (lease_lost).
+        The lease is also considered lost if the OPENED flag has been replaced by the one of another claim.
+        :param lease (str): lease id returned by claim_seed() (read from the OPENED flag if not provided)
+        """
+        self.seed_dir = seed_dir
+        self.path = str(seed_dir / 'OPENED')
+        self.reclaiming_path = str(seed_dir / 'RECLAIMING')
+        self.interval = interval
+        self.n_retries = n_retries
+        self.retry_interval = retry_interval
+        self.lease = get_lease(seed_dir) if lease is None else lease
+        self.lease_lost = False
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+        self.lease_lost = self.lease_lost or get_lease(self.seed_dir) != self.lease
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            if not self._touch():
+                self.lease_lost = True
+                return
+
+    def _touch(self):
+        for i in range(self.n_retries + 1):
+            try:
+                os.utime(self.path)
+
+                # After a miss, the seed_dir may have been reclaimed and claimed again by another process
+
+                return i == 0 or get_lease(self.seed_dir) == self.lease
+            except FileNotFoundError:
+                pass
+
+            # The lease is being reclaimed: refreshing the RECLAIMING flag makes reclaim_seed() give it back
+
+            try:
+                os.utime(self.reclaiming_path)
+            except FileNotFoundError:
+                pass
+
+            if self._stop_event.wait(self.retry_interval):
+                return True
+
+        return False
+
+
+# Process-level caches of git metadata (see get_git_hash and get_git_name)
+
+_GIT_HASH_CACHE = {}
+_GIT_NAME_CACHE = {}
+
+
+def get_git_hash(path):
+    """
+    Returns the short hash of the commit checked-out in the repository located at 'path'.
+    The result is cached for the lifetime of the process and only recomputed when HEAD (or the ref it points to)
+    changes. If alfred.defaults.DEFAULT_DIRECTORY_TREE_READ_GIT_REFS_DIRECTLY is True, the hash is read from
+    the files in .git instead of forking a 'git' subprocess.
+    """
+    git_dir = _resolve_git_dir(os.path.join(path, '.git'))
+    head_state = _get_git_head_state(git_dir)
+
+    cached = _GIT_HASH_CACHE.get(git_dir)
+    if cached is not None and cached[0] == head_state:
+        return cached[1]
+
+    git_hash = None
+
+    if alfred.defaults.DEFAULT_DIRECTORY_TREE_READ_GIT_REFS_DIRECTLY and head_state is not None:
+        full_hash = _read_git_ref(git_dir, head_state[0])
+        if full_hash is not None:
+            git_hash = full_hash[:7]
+
+    if git_hash is None:
+        try:
+            git_hash = subprocess.check_output(
+                ["git", "--git-dir", os.path.join(path, '.git'), "rev-parse", "--short", "HEAD"]).decode(
+                "utf-8").strip()
+
+        except subprocess.CalledProcessError:
+            git_hash = 'NoGitHash'
+
+    _GIT_HASH_CACHE[git_dir] = (head_state, git_hash)
+    return git_hash
 
 
 def get_git_name():
+    """
+    Returns git's user.name. The result is cached for the lifetime of the process and only recomputed
+    when the working directory or one of git's config files changes.
+    """
+    config_state = (os.getcwd(),) + tuple(_get_file_state(config_file) for config_file in
+                                          [os.path.expanduser('~/.gitconfig'),
+                                           os.path.expanduser('~/.config/git/config'),
+                                           os.path.join('.git', 'config')])
+
+    if config_state in _GIT_NAME_CACHE:
+        return _GIT_NAME_CACHE[config_state]
+
     try:
-        return subprocess.check_output(["git", "config", "user.name"]).decode("utf-8").strip()
+        git_name = subprocess.check_output(["git", "config", "user.name"]).decode("utf-8").strip()
 
     except subprocess.CalledProcessError:
-        return 'NoGitUsr'
+        git_name = 'NoGitUsr'
+
+    _GIT_NAME_CACHE.clear()
+    _GIT_NAME_CACHE[config_state] = git_name
+    return git_name
+
+
+def _resolve_git_dir(git_path):
+    # '.git' can be a file pointing to the actual git directory (worktrees and submodules)
+
+    if os.path.isfile(git_path):
+        with open(git_path, 'r') as f:
+            content = f.read().strip()
+        if content.startswith('gitdir:'):
+            return os.path.normpath(os.path.join(os.path.dirname(git_path), content[len('gitdir:'):].strip()))
+
+    return git_path
+
+
+def _get_file_state(filename):
+    try:
+        stat = os.stat(filename)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+def _get_git_common_dir(git_dir):
+    # Worktrees share the refs of the main repository
+
+    try:
+        with open(os.path.join(git_dir, 'commondir'), 'r') as f:
+            return os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    except OSError:
+        return git_dir
+
+
+def _get_git_head_state(git_dir):
+    # Content of HEAD and state of the files in which the ref it points to can be stored
+
+    try:
+        with open(os.path.join(git_dir, 'HEAD'), 'r') as f:
+            head = f.read().strip()
+    except OSError:
+        return None
+
+    if not head.startswith('ref:'):
+        return head, None, None
+
+    ref = head[len('ref:'):].strip()
+    common_dir = _get_git_common_dir(git_dir)
+    return (head,
+            _get_file_state(os.path.join(common_dir, ref)),
+            _get_file_state(os.path.join(common_dir, 'packed-refs')))
+
+
+def _read_git_ref(git_dir, head):
+    # Resolves HEAD to a full commit hash (loose ref first, then packed-refs)
+
+    if not head.startswith('ref:'):
+        return head
+
+    ref = head[len('ref:'):].strip()
+    common_dir = _get_git_common_dir(git_dir)
+
+    try:
+        with open(os.path.join(common_dir, ref), 'r') as f:
+            return f.read().strip()
+    except OSError:
+        pass
+
+    try:
+        with open(os.path.join(common_dir, 'packed-refs'), 'r') as f:
+            for line in f:
+                if line.startswith('#') or line.startswith('^'):
+                    continue
+                items = line.strip().split(' ')
+                if len(items) == 2 and items[1] == ref:
+                    return items[0]
+    except OSError:
+        pass
+
+    return None
 
 
 def sanity_check_hash(storage_dir, master_logger):
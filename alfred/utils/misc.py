@@ -1,4 +1,8 @@
 import logging
+import logging.handlers
+import multiprocessing
+import queue
+import time
 import sys
 from math import floor, log10
 import re
@@ -43,6 +47,111 @@ def create_new_filehandler(logger_name, logfile):
     return file_handler
 
 
+class BufferedFileHandler(logging.FileHandler):
+    """
+    FileHandler that flushes its stream at most every 'flush_interval' seconds (or when a WARNING or above is
+    emitted) instead of after every record
+    """
+
+    def __init__(self, filename, flush_interval=5.):
+        super().__init__(filename, mode='a')
+        self.flush_interval = flush_interval
+        self._last_flush = time.time()
+
+    def emit(self, record):
+        super().emit(record)
+        if record.levelno >= logging.WARNING:
+            self.flush(force=True)
+
+    def flush(self, force=False):
+        if force or time.time() - self._last_flush >= self.flush_interval:
+            super().flush()
+            self._last_flush = time.time()
+
+    def close(self):
+        self.flush(force=True)
+        super().close()
+
+
+class _FlushingQueueListener(logging.handlers.QueueListener):
+    """
+    QueueListener that flushes its (buffered) handlers whenever the queue has been idle for 'flush_interval' seconds
+    """
+
+    def __init__(self, queue, *handlers, flush_interval=5.):
+        super().__init__(queue, *handlers)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block=block, timeout=self.flush_interval)
+            except queue.Empty:
+                for handler in self.handlers:
+                    if isinstance(handler, BufferedFileHandler):
+                        handler.flush(force=True)
+                    else:
+                        handler.flush()
+
+
+def create_logging_listener(logfiles, streamHandle=True, flush_interval=5.):
+    """
+    Starts a listener (thread of the calling process) that receives log records from a multiprocessing queue
+    and writes them to every logfile (and stdout). All the loggers of all the processes created with
+    create_queue_logger() on this queue then share a single set of file descriptors.
+    :param logfiles (list): paths of the files to which every record is written
+    :param streamHandle (bool): whether records are also printed to stdout
+    :param flush_interval (float): maximum number of seconds a record can stay buffered before being written
+    :return: (multiprocessing.Queue, QueueListener)
+    """
+    formatter = logging.Formatter(fmt='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+                                  datefmt='%d/%m/%Y %H:%M:%S', )
+
+    handlers = [BufferedFileHandler(logfile, flush_interval=flush_interval) for logfile in logfiles]
+    if streamHandle:
+        handlers.append(logging.StreamHandler(stream=sys.stdout))
+
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = multiprocessing.Queue(-1)
+    listener = _FlushingQueueListener(log_queue, *handlers, flush_interval=flush_interval)
+    listener.start()
+
+    return log_queue, listener
+
+
+def stop_logging_listener(listener):
+    """
+    Writes the remaining records of the listener's queue and closes its handlers
+    """
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+def create_queue_logger(name, loglevel, log_queue):
+    """
+    Creates a logger sending its records to a listener created with create_logging_listener().
+    Handlers previously attached to a logger of the same name are removed.
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(loglevel)
+    close_logger(logger)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    return logger
+
+
+def close_logger(logger):
+    """
+    Removes and closes all the handlers of a logger (releasing the files it had opened)
+    """
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+
 def keep_two_signif_digits(x):
     try:
         if x == 0.:
@@ -0,0 +1,146 @@
+import os
+import math
+from pathlib import Path
+
+
+class SeedPruned(Exception):
+    """
+    Raised by report() when the run of a seed_dir has been pruned (the launcher then flags it as PRUNED)
+    """
+    pass
+
+
+def report(dir_tree, step, value):
+    """
+    Reports an intermediate value of the metric optimised by the search (to be called by main.main() during training).
+    If the launcher has been asked to prune runs (alfred.launch_schedule --prune=True) and this run is not among
+    the best ones at the current rung, raises SeedPruned (which main.main() should not catch). Does nothing otherwise.
+    :param dir_tree (DirectoryTree): dir_tree given to main.main()
+    :param step (int): training step (or epoch, episode...) at which the value has been measured
+    :param value (float): value of the metric
+    """
+    pruner = getattr(dir_tree, 'pruner', None)
+    if pruner is not None and pruner.should_prune(dir_tree.seed_dir, step, value):
+        raise SeedPruned(f"Pruned at step {step} ({value})")
+
+
+class AshaPruner(object):
+    def __init__(self, min_step, reduction_factor=3, higher_is_better=True):
+        """
+        Asynchronous successive halving (ASHA): rungs are located at steps min_step * reduction_factor**k.
+        When a run reaches a rung, it is only continued if its value is in the top 1/reduction_factor of the values
+        recorded at this rung by all the runs of its storage_dir (peers that have reached it so far). The first
+        reduction_factor runs to reach a rung are always continued.
+        The values are shared between processes (and nodes) through an append-only log in each storage_dir.
+        :param min_step (int): step of the first rung
+        :param reduction_factor (int): only 1/reduction_factor of the runs are promoted from one rung to the next
+        :param higher_is_better (bool): whether the reported metric should be maximised
+        """
+        assert min_step > 0
+        assert reduction_factor > 1
+
+        self.min_step = min_step
+        self.reduction_factor = reduction_factor
+        self.higher_is_better = higher_is_better
+        self._rung_logs = {}
+        self._last_rungs = {}
+
+    def get_rung(self, step):
+        """
+        Returns the index of the highest rung located at or before 'step' (-1 if step < min_step)
+        """
+        if step < self.min_step:
+            return -1
+
+        rung = int(math.floor(math.log(step / self.min_step, self.reduction_factor) + 1e-9))
+
+        # Guards against floating point errors on exact powers
+
+        while self.min_step * self.reduction_factor ** (rung + 1) <= step:
+            rung += 1
+
+        return rung
+
+    def should_prune(self, seed_dir, step, value):
+        """
+        Records the value of a run reaching a new rung and decides whether it should be stopped
+        """
+        seed_dir = Path(seed_dir)
+
+        # A diverged run (nan) is the worst of its rung
+
+        if math.isnan(value):
+            value = -math.inf if self.higher_is_better else math.inf
+
+        # Only the first report at or after each rung is considered
+
+        rung = self.get_rung(step)
+        if rung <= self._last_rungs.get(seed_dir, -1):
+            return False
+
+        self._last_rungs[seed_dir] = rung
+
+        storage_dir = seed_dir.parents[1]
+        if storage_dir not in self._rung_logs:
+            self._rung_logs[storage_dir] = RungLog(storage_dir)
+
+        rung_log = self._rung_logs[storage_dir]
+        rung_log.record(seed_dir, rung, value)
+        rung_log.refresh()
+
+        # Promotes the run if it is among the top 1/reduction_factor of its rung
+
+        values = list(rung_log.values.get(rung, {}).values())
+        if len(values) < self.reduction_factor:
+            return False
+
+        n_promoted = len(values) // self.reduction_factor
+        threshold = sorted(values, reverse=self.higher_is_better)[n_promoted - 1]
+
+        return value < threshold if self.higher_is_better else value > threshold
+
+
+class RungLog(object):
+    """
+    Values reported by the runs of a storage_dir at each rung, shared by all the processes working on it
+    - the log is an append-only text file located at storage_dir/pruning_rungs.log
+    - each line is '<experiment_name>/<seed_name> <rung> <value>', the last line for a seed_dir and rung wins
+    """
+    filename = 'pruning_rungs.log'
+
+    def __init__(self, storage_dir):
+        self.storage_dir = Path(storage_dir)
+        self.path = self.storage_dir / self.filename
+        self.values = {}
+        self._offset = 0
+
+    def refresh(self):
+        """
+        Reads the records appended to the log since the last call
+        """
+        try:
+            with open(str(self.path), 'rb') as f:
+                f.seek(self._offset)
+                new_bytes = f.read()
+        except FileNotFoundError:
+            return
+
+        # Only complete lines are parsed, a partially written record will be read on next refresh
+
+        end = new_bytes.rfind(b'\n') + 1
+        self._offset += end
+
+        for line in new_bytes[:end].decode('utf-8').splitlines():
+            if line == '':
+                continue
+            seed_name, rung, value = line.rsplit(' ', 2)
+            self.values.setdefault(int(rung), {})[seed_name] = float(value)
+
+    def record(self, seed_dir, rung, value):
+        line = f"{seed_dir.parent.name}/{seed_dir.name} {rung} {float(value)!r}\n"
+
+        fd = os.open(str(self.path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode('utf-8'))
+        finally:
+            os.close(fd)
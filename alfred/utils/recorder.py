@@ -1,7 +1,11 @@
+import os
 import copy
+import json
 import pickle
 import numpy as np
 import time
+from collections.abc import Mapping
+from pathlib import Path
 
 
 def remove_nones(input_list):
@@ -16,6 +20,7 @@ class Recorder(object):
         (could be reward, loss, action, parameters, gradients, evaluation metric, etc.)
         """
         self.tape = {}
+        self.n_saved_steps = 0
 
         for metric_name in metrics_to_record:
             self.tape[metric_name] = []
@@ -42,15 +47,455 @@ class Recorder(object):
         Saves the tape (dictionary) in .pkl file
         """
         with open(filename, 'wb') as f:
-            pickle.dump(self.tape, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(dict(self.tape), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def save_chunk(self, dirname):
+        """
+        Saves only the steps recorded since the last call in a new chunk (.pkl file) of the directory 'dirname'.
+        Each chunk is written to a temporary file and atomically renamed, so that the directory can be read
+        (see init_from_chunks) while the run is still going, and a crash never corrupts the steps already saved.
+        """
+        n_steps = len(self)
+        if n_steps == self.n_saved_steps:
+            return
+
+        dirname = Path(dirname)
+        os.makedirs(str(dirname), exist_ok=True)
+
+        chunk_name = f'{self.n_saved_steps:010d}-{n_steps:010d}.pkl'
+        tmp_path = dirname / f'.{chunk_name}.tmp'
+
+        with open(str(tmp_path), 'wb') as f:
+            pickle.dump(self._get_steps(self.n_saved_steps, n_steps), f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(str(tmp_path), str(dirname / chunk_name))
+
+        self.n_saved_steps = n_steps
 
     @classmethod
     def init_from_pickle_file(cls, filename):
         """
         Initialises Recorder() from a .pkl file containing a tape (dictionary)
+        or from a directory of chunks written by save_chunk()
         """
+        if Path(filename).is_dir():
+            return cls.init_from_chunks(filename)
+
         with open(filename, 'rb') as f:
             loaded_tape = pickle.load(f)
         instance = cls(metrics_to_record=loaded_tape.keys())
         instance.tape = loaded_tape
         return instance
+
+    @classmethod
+    def init_from_chunks(cls, dirname):
+        """
+        Initialises Recorder() by concatenating the chunks written by save_chunk() in the directory 'dirname'.
+        Calling save_chunk() on this instance then appends new chunks after the loaded ones.
+        """
+        loaded_tape = {}
+        n_steps = 0
+
+        for chunk_path in get_chunk_paths(dirname):
+            with open(str(chunk_path), 'rb') as f:
+                chunk = pickle.load(f)
+            n_chunk_steps = max([len(values) for values in chunk.values()], default=0)
+
+            for metric_name, values in chunk.items():
+                if metric_name not in loaded_tape:
+                    loaded_tape[metric_name] = [None] * n_steps
+                loaded_tape[metric_name] += values
+
+            n_steps += n_chunk_steps
+            for values in loaded_tape.values():
+                values += [None] * (n_steps - len(values))
+
+        instance = cls(metrics_to_record=loaded_tape.keys())
+        instance.tape = loaded_tape
+        instance.n_saved_steps = n_steps
+        return instance
+
+    @staticmethod
+    def convert_pickle_to_chunks(filename, dirname):
+        """
+        Converts a .pkl file written by save() into a directory of chunks (readable by init_from_chunks)
+        """
+        instance = Recorder.init_from_pickle_file(filename)
+        instance.save_chunk(dirname)
+
+    def save_columnar(self, dirname):
+        """
+        Saves the tape in a columnar layout that can be memory-mapped (see RecorderReader):
+        - one .npy file per numeric metric (plus one .npy for its mask, False where the metric is missing)
+        - non-numeric metrics are pickled together in objects.pkl
+        - header.json lists the metrics, their files and the number of steps. It is written last (and every file
+          is atomically replaced), so that readers never see a header describing files that are not written yet.
+        """
+        dirname = Path(dirname)
+        os.makedirs(str(dirname), exist_ok=True)
+
+        header = {'n_steps': len(self), 'metrics': {}}
+        objects = {}
+
+        for i, metric_name in enumerate(self._metric_names()):
+            values, mask = self.get_column(metric_name)
+
+            if isinstance(values, np.ndarray) and values.dtype != object:
+                header['metrics'][metric_name] = {'values': f'metric{i}.npy', 'mask': f'metric{i}_mask.npy'}
+                _atomic_np_save(values, dirname / f'metric{i}.npy')
+                _atomic_np_save(mask, dirname / f'metric{i}_mask.npy')
+            else:
+                header['metrics'][metric_name] = {'values': 'objects.pkl', 'mask': None}
+                objects[metric_name] = list(values)
+
+        if len(objects) > 0:
+            with open(str(dirname / '.objects.pkl.tmp'), 'wb') as f:
+                pickle.dump(objects, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(str(dirname / '.objects.pkl.tmp'), str(dirname / 'objects.pkl'))
+
+        with open(str(dirname / '.header.json.tmp'), 'w') as f:
+            json.dump(header, f)
+        os.replace(str(dirname / '.header.json.tmp'), str(dirname / 'header.json'))
+
+    def get_column(self, metric_name):
+        """
+        Returns the recorded values of a metric and the mask of the steps at which it has been written
+        (numpy arrays for numeric metrics)
+        """
+        column = _Column(initial_capacity=max(len(self), 1))
+        for row, value in enumerate(self.tape[metric_name]):
+            column.write(row, value)
+        return column.get(len(self))
+
+    def _metric_names(self):
+        return list(self.tape.keys())
+
+    def _get_steps(self, start, end):
+        return {metric_name: values[start:end] for metric_name, values in self.tape.items()}
+
+    def __len__(self):
+        return max([len(values) for values in self.tape.values()], default=0)
+
+
+class RecorderReader(object):
+    def __init__(self, dirname):
+        """
+        Read-only access to a tape saved with Recorder.save_columnar(). Numeric metrics are memory-mapped:
+        reading a metric (or only its last steps) only touches the corresponding bytes on disk.
+        """
+        self.dirname = Path(dirname)
+        with open(str(self.dirname / 'header.json'), 'r') as f:
+            self.header = json.load(f)
+        self.n_steps = self.header['n_steps']
+        self._objects = None
+
+    @property
+    def metrics(self):
+        return list(self.header['metrics'].keys())
+
+    def get(self, metric_name, tail=None):
+        """
+        Returns the values of a metric (a read-only memory-mapped array for numeric metrics)
+        :param tail (int): if provided, only the last 'tail' steps are returned
+        """
+        return self._read(metric_name, 'values', tail)
+
+    def get_mask(self, metric_name, tail=None):
+        """
+        Returns the mask of a metric (False at the steps where the metric has not been written)
+        """
+        return self._read(metric_name, 'mask', tail)
+
+    def to_recorder(self, recorder_class=None):
+        """
+        Loads the whole tape in memory as a Recorder (ColumnarRecorder by default)
+        """
+        recorder_class = ColumnarRecorder if recorder_class is None else recorder_class
+        tape = {}
+        for metric_name in self.metrics:
+            values, mask = self.get(metric_name), self.get_mask(metric_name)
+            if isinstance(values, np.ndarray):
+                values = values.tolist() if values.ndim == 1 else [np.array(value) for value in values]
+            tape[metric_name] = [value if is_written else None for value, is_written in zip(values, mask)]
+
+        instance = recorder_class(metrics_to_record=tape.keys())
+        instance.tape = tape
+        return instance
+
+    def _read(self, metric_name, key, tail):
+        start = 0 if tail is None else max(self.n_steps - tail, 0)
+        metric_info = self.header['metrics'][metric_name]
+
+        if metric_info['mask'] is None:
+            if self._objects is None:
+                with open(str(self.dirname / 'objects.pkl'), 'rb') as f:
+                    self._objects = pickle.load(f)
+            values = self._objects[metric_name][start:self.n_steps]
+            return values if key == 'values' else np.array([value is not None for value in values], dtype=bool)
+
+        return np.load(str(self.dirname / metric_info[key]), mmap_mode='r')[start:self.n_steps]
+
+
+def stack_metric_across_seeds(experiment_dir, metric_name, columnar_dirname='metrics', tail=None, stack=True):
+    """
+    Stacks a metric saved with Recorder.save_columnar() across all the seeds of an experiment. Only the
+    requested window of each seed's memory-mapped file is read: np.stack() copies these windows (and only them)
+    into the stacked array, while stack=False returns the memory-mapped windows themselves (no copy).
+    Seeds that recorded fewer steps than others are truncated to the steps shared by all seeds: their first
+    steps, or their last 'tail' steps (aligned on the last step of each seed) if tail is provided.
+    :param columnar_dirname (str): name of the directory (in each seed_dir) written by save_columnar()
+    :param tail (int): if provided, only the last 'tail' steps of each seed are stacked
+    :param stack (bool): if False, the values and masks of each seed are returned as lists of read-only views
+    :return: (values, mask), two arrays of shape (n_seeds, n_steps, ...) (or two lists of n_seeds arrays)
+    """
+    from alfred.utils.directory_tree import DirectoryTree
+
+    readers = [RecorderReader(seed_dir / columnar_dirname) for seed_dir in DirectoryTree.get_all_seeds(experiment_dir)
+               if (seed_dir / columnar_dirname / 'header.json').exists()]
+
+    if len(readers) == 0:
+        return (np.array([]), np.array([], dtype=bool)) if stack else ([], [])
+
+    n_steps = min([reader.n_steps for reader in readers])
+
+    if tail is None:
+        values = [reader.get(metric_name)[:n_steps] for reader in readers]
+        mask = [reader.get_mask(metric_name)[:n_steps] for reader in readers]
+    else:
+        n_steps = min(n_steps, tail)
+        values = [reader.get(metric_name, tail=n_steps) for reader in readers]
+        mask = [reader.get_mask(metric_name, tail=n_steps) for reader in readers]
+
+    if not stack:
+        return values, mask
+
+    return np.stack([np.asarray(seed_values) for seed_values in values]), np.stack(mask)
+
+
+def _atomic_np_save(array, path):
+    tmp_path = path.parent / f'.{path.name}.tmp'
+    with open(str(tmp_path), 'wb') as f:
+        np.save(f, array)
+    os.replace(str(tmp_path), str(path))
+
+
+def get_chunk_paths(dirname):
+    """
+    Returns the (completely written) chunks of a directory written by Recorder.save_chunk(), in order
+    """
+    return sorted([path for path in Path(dirname).iterdir()
+                   if path.suffix == '.pkl' and not path.name.startswith('.')])
+
+
+class ColumnarRecorder(Recorder):
+    def __init__(self, metrics_to_record, initial_capacity=1024):
+        """
+        Recorder storing each numeric metric in a typed, growable numpy column (with a mask marking the
+        steps at which the metric has been written) instead of a list of deep-copies.
+        - writing only touches the metrics present in 'new_values_dict' (missing ones are not padded with None)
+        - scalars and numpy arrays are copied into the column, other values (or values of another type than the
+          first one written, see _Column) fall back to a deep-copied list
+        - 'tape' is a read-only view of the columns (see _TapeView): the tape can only be modified by write_to_tape()
+        """
+        self.initial_capacity = initial_capacity
+        self.n_saved_steps = 0
+        self._n_rows = 0
+        self._columns = {}
+
+        for metric_name in metrics_to_record:
+            self._columns[metric_name] = _Column(initial_capacity)
+
+    @property
+    def tape(self):
+        return _TapeView(self)
+
+    @tape.setter
+    def tape(self, tape):
+        self._n_rows = max([len(values) for values in tape.values()], default=0)
+        self._columns = {}
+
+        for metric_name, values in tape.items():
+            self._columns[metric_name] = _Column(max(self.initial_capacity, self._n_rows))
+            for row, value in enumerate(values):
+                self._columns[metric_name].write(row, value)
+
+    def write_to_tape(self, new_values_dict):
+        """
+        Appends a new step to the tape with the values defined in 'new_values_dict'
+        (metrics absent from 'new_values_dict' are masked for this step)
+        """
+        for key, value in new_values_dict.items():
+            column = self._columns.get(key)
+
+            # new_values_dict is not allowed to contain un-initialised keys
+            assert column is not None, \
+                f"self.tape.keys()={self._columns.keys()}\nnew_values_dict.keys()={new_values_dict.keys()}"
+
+            column.write(self._n_rows, value)
+
+        self._n_rows += 1
+
+    def _get_steps(self, start, end):
+        return {metric_name: column.to_list(end, start=start) for metric_name, column in self._columns.items()}
+
+    def get_column(self, metric_name):
+        """
+        Returns the recorded values of a metric and the mask of the steps at which it has been written.
+        For numeric metrics, these are numpy arrays (views, not copies) of length equal to the number of steps.
+        """
+        return self._columns[metric_name].get(self._n_rows)
+
+    def _metric_names(self):
+        return list(self._columns.keys())
+
+    def __len__(self):
+        return self._n_rows
+
+
+class _TapeView(Mapping):
+    """
+    Read-only mapping giving the same access to the tape of a ColumnarRecorder as Recorder.tape. The list of values
+    of a metric is only built when that metric is accessed, and is a copy (modifying it does not change the tape).
+    """
+
+    def __init__(self, recorder):
+        self._recorder = recorder
+
+    def __getitem__(self, metric_name):
+        return self._recorder._columns[metric_name].to_list(self._recorder._n_rows)
+
+    def __iter__(self):
+        return iter(self._recorder._columns)
+
+    def __len__(self):
+        return len(self._recorder._columns)
+
+
+class _Column(object):
+    """
+    Growable storage of the values of one metric. Starts as a numpy buffer typed from the first written value
+    and falls back to a python list (of deep-copies) for non-numeric or heterogeneous values. A numpy column only
+    accepts values of the exact type of the first one (and arrays of the same dtype and shape), so that the values
+    read back are the ones that have been written (e.g. an int column receiving a float becomes a list instead of
+    being upcast).
+    """
+
+    # Dtypes of the numpy columns storing python scalars (numpy scalars and arrays keep their own dtype)
+
+    _PYTHON_DTYPES = {bool: np.bool_, int: np.int64, float: np.float64}
+
+    def __init__(self, initial_capacity):
+        self.initial_capacity = initial_capacity
+        self.values = None
+        self.mask = None
+        self.is_numeric = None
+        self._scalar_type = None
+        self._capacity = 0
+
+    def write(self, row, value):
+        # Fast path: scalar of the column's type, enough capacity
+
+        if row < self._capacity and type(value) is self._scalar_type:
+            try:
+                self.values[row] = value
+                self.mask[row] = True
+                return
+            except OverflowError:
+                pass
+
+        if value is None:
+            return
+
+        if self.is_numeric is None:
+            self._init_storage(value)
+
+        if self.is_numeric and not self._fits(value):
+            self._convert_to_list()
+
+        if self.is_numeric:
+            if row >= len(self.mask):
+                self._grow(row + 1)
+            try:
+                self.values[row] = value
+                self.mask[row] = True
+                return
+            except OverflowError:
+                # e.g. a python int that does not fit in the column's dtype
+                self._convert_to_list()
+
+        if row > len(self.values):
+            self.values.extend([None] * (row - len(self.values)))
+        self.values.append(copy.deepcopy(value))
+
+    def get(self, n_rows):
+        if self.is_numeric:
+            if n_rows > len(self.mask):
+                self._grow(n_rows)
+            return self.values[:n_rows], self.mask[:n_rows]
+
+        values = self.to_list(n_rows)
+        return values, np.array([value is not None for value in values], dtype=bool)
+
+    def to_list(self, n_rows, start=0):
+        if self.is_numeric is None:
+            return [None] * (n_rows - start)
+
+        if self.is_numeric:
+            values, mask = self.get(n_rows)
+            values, mask = values[start:], mask[start:]
+            if self._scalar_type in self._PYTHON_DTYPES:
+                values = values.tolist()
+            elif self._scalar_type is not None:
+                values = list(values)
+            else:
+                values = [np.array(value) for value in values]
+            return [value if is_written else None for value, is_written in zip(values, mask)]
+
+        return self.values[start:n_rows] + [None] * (n_rows - max(start, len(self.values)))
+
+    def _init_storage(self, value):
+        if type(value) in self._PYTHON_DTYPES:
+            dtype, shape, scalar_type = self._PYTHON_DTYPES[type(value)], (), type(value)
+        elif isinstance(value, np.generic) and value.dtype.kind in 'biufc':
+            dtype, shape, scalar_type = value.dtype, (), type(value)
+        elif isinstance(value, np.ndarray) and value.dtype.kind in 'biufc':
+            dtype, shape, scalar_type = value.dtype, value.shape, None
+        else:
+            self.is_numeric = False
+            self.values = []
+            return
+
+        self.is_numeric = True
+        self.values = np.zeros((self.initial_capacity,) + shape, dtype=dtype)
+        self.mask = np.zeros(self.initial_capacity, dtype=bool)
+        self._scalar_type = scalar_type
+        self._capacity = self.initial_capacity
+
+    def _fits(self, value):
+        if self._scalar_type is not None:
+            return type(value) is self._scalar_type
+
+        return isinstance(value, np.ndarray) and value.dtype == self.values.dtype \
+               and value.shape == self.values.shape[1:]
+
+    def _convert_to_list(self):
+        self.values = self.to_list(len(self.mask))
+        while len(self.values) > 0 and self.values[-1] is None:
+            self.values.pop()
+        self.mask = None
+        self.is_numeric = False
+        self._scalar_type = None
+        self._capacity = 0
+
+    def _grow(self, min_capacity):
+        capacity = max(min_capacity, 2 * len(self.mask))
+
+        values = np.zeros((capacity,) + self.values.shape[1:], dtype=self.values.dtype)
+        values[:len(self.values)] = self.values
+        self.values = values
+
+        mask = np.zeros(capacity, dtype=bool)
+        mask[:len(self.mask)] = self.mask
+        self.mask = mask
+        self._capacity = capacity
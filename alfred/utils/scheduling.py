@@ -0,0 +1,143 @@
+import os
+import sys
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the memory of the runs is then not limited
+    resource = None
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    # not installed, the thread-pools of the libraries already loaded are then only bounded by the affinity
+    threadpool_limits = None
+
+from alfred.utils.config import load_dict_from_json
+
+# Resources needed by each run of an experiment are saved in experiment_dir/resources.json
+
+RESOURCES_FILENAME = 'resources.json'
+DEFAULT_RESOURCES = {'n_cpus': 1, 'memory_gb': 0.}
+
+# Environment variables limiting the size of the thread-pools of the usual numerical libraries
+
+THREADS_ENV_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS',
+                    'VECLIB_MAXIMUM_THREADS']
+
+
+def get_experiment_resources(schedule, config):
+    """
+    Returns the resources needed by each run of an experiment, as declared in the schedule file:
+    either a function get_resources(config) returning a dict, or a dict RESOURCES shared by all experiments
+    (e.g. {'n_cpus': 4, 'memory_gb': 8}). Returns an empty dict if the schedule does not declare any.
+    """
+    if hasattr(schedule, 'get_resources'):
+        resources = dict(schedule.get_resources(config))
+    else:
+        resources = dict(getattr(schedule, 'RESOURCES', {}))
+
+    assert all([key in DEFAULT_RESOURCES for key in resources.keys()]), \
+        f"Unknown resources {list(resources.keys())}, only {list(DEFAULT_RESOURCES.keys())} are supported"
+
+    return resources
+
+
+def load_resources(experiment_dir):
+    """
+    Loads the resources needed by each run of an experiment (DEFAULT_RESOURCES if none have been declared)
+    """
+    resources = dict(DEFAULT_RESOURCES)
+    try:
+        resources.update(load_dict_from_json(str(experiment_dir / RESOURCES_FILENAME)))
+    except FileNotFoundError:
+        pass
+
+    return resources
+
+
+def get_available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    else:
+        return list(range(os.cpu_count()))
+
+
+def set_run_resources(cpus):
+    """
+    Restricts the current process to the given cpus and sizes the thread-pools of the numerical libraries
+    accordingly. The runs are forked from the launcher, so the libraries it has already loaded (e.g. numpy's BLAS)
+    are resized with threadpoolctl (if installed) and torch.set_num_threads (if torch is loaded). The environment
+    variables only affect the libraries loaded afterwards (and the subprocesses of the run).
+    """
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+
+    for env_var in THREADS_ENV_VARS:
+        os.environ[env_var] = str(len(cpus))
+
+    if threadpool_limits is not None:
+        threadpool_limits(limits=len(cpus))
+
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(len(cpus))
+
+
+def set_memory_limit(memory_gb):
+    """
+    Limits the address space of the current process (and of the subprocesses it creates afterwards) to memory_gb.
+    Allocations beyond it fail (MemoryError in python). Note that some libraries (e.g. CUDA) reserve much more
+    address space than the memory they actually use.
+    """
+    if resource is None:
+        return
+
+    limit = int(memory_gb * 1024 ** 3)
+    _, hard_limit = resource.getrlimit(resource.RLIMIT_AS)
+    if hard_limit != resource.RLIM_INFINITY:
+        limit = min(limit, hard_limit)
+
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard_limit))
+
+
+class ResourcePacker(object):
+    def __init__(self, cpus, memory_gb=None):
+        """
+        Keeps track of the cpus (and memory) of the node that are used by the runs currently launched
+        :param cpus (list): ids of the cpus that can be allocated
+        :param memory_gb (float): memory that can be allocated (None to ignore the memory requirements)
+        """
+        self.cpus = list(cpus)
+        self.memory_gb = memory_gb
+        self.free_cpus = set(self.cpus)
+        self.free_memory_gb = memory_gb
+
+    def allocate(self, resources):
+        """
+        Allocates the resources needed by a run if they are currently available. A run needing more than the
+        whole node gets the whole node (once it is idle).
+        :return: the allocation (to be given back to release()), or None if the run does not fit right now
+        """
+        n_cpus = max(1, min(int(resources['n_cpus']), len(self.cpus)))
+        memory_gb = 0. if self.memory_gb is None else min(float(resources['memory_gb']), self.memory_gb)
+
+        if n_cpus > len(self.free_cpus):
+            return None
+
+        if self.memory_gb is not None and memory_gb > self.free_memory_gb:
+            return None
+
+        cpus = sorted(self.free_cpus)[:n_cpus]
+        self.free_cpus.difference_update(cpus)
+        if self.memory_gb is not None:
+            self.free_memory_gb -= memory_gb
+
+        return {'cpus': cpus, 'memory_gb': memory_gb}
+
+    def release(self, allocation):
+        self.free_cpus.update(allocation['cpus'])
+        if self.memory_gb is not None:
+            self.free_memory_gb += allocation['memory_gb']
+
+    def is_idle(self):
+        return len(self.free_cpus) == len(self.cpus)
@@ -0,0 +1,240 @@
+import os
+import heapq
+from pathlib import Path
+
+from alfred.utils.directory_tree import get_seeds_status, RUNNABLE_FLAGS
+
+
+class SeedCatalog(object):
+    """
+    Persistent index of the status (FLAG-file) of every seed_dir in a storage_dir
+    - the catalog is an append-only text file located at storage_dir/seed_catalog.log
+    - each line is '<experiment_name>/<seed_name> <STATUS>', the last line for a seed_dir wins
+    - the FLAG-files remain the ground truth: the catalog is only used to find candidate
+      seed_dirs without walking the whole storage_dir
+    - if the catalog is missing (e.g. storage_dir created by an older version of alfred),
+      it is rebuilt from the FLAG-files the first time it is needed
+    """
+    filename = 'seed_catalog.log'
+
+    def __init__(self, storage_dir):
+        self.storage_dir = Path(storage_dir)
+        self.path = self.storage_dir / self.filename
+        self.status = {}
+        self._offset = 0
+
+    def refresh(self):
+        """
+        Reads the records appended to the catalog since the last call (rebuilds the catalog if missing)
+        :return: list of (seed_name, status) for the seed_dirs whose status has changed
+        """
+        try:
+            with open(str(self.path), 'rb') as f:
+                f.seek(self._offset)
+                new_bytes = f.read()
+        except FileNotFoundError:
+            self.rebuild()
+            return self.refresh()
+
+        changes = []
+
+        # Only complete lines are parsed, a partially written record will be read on next refresh
+
+        end = new_bytes.rfind(b'\n') + 1
+        self._offset += end
+
+        for line in new_bytes[:end].decode('utf-8').splitlines():
+            if line == '':
+                continue
+            seed_name, status = line.rsplit(' ', 1)
+            if self._update(seed_name, status):
+                changes.append((seed_name, status))
+
+        return changes
+
+    def rebuild(self):
+        """
+        Walks the storage_dir once and writes a snapshot of the FLAG-files as the catalog.
+        The snapshot is written to a temporary file and hard-linked into place so that
+        concurrent rebuilds never produce a partial catalog.
+        """
+        lines = [f"{_seed_name(seed_dir)} {status}\n" for seed_dir, status in get_seeds_status(self.storage_dir).items()]
+
+        tmp_path = self.storage_dir / f'.{self.filename}.{os.getpid()}.tmp'
+        with open(str(tmp_path), 'w') as f:
+            f.write(''.join(lines))
+        try:
+            os.link(str(tmp_path), str(self.path))
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(str(tmp_path))
+
+    def record(self, seed_dirs, status):
+        """
+        Appends a status record for each seed_dir (in a single write)
+        """
+        if isinstance(seed_dirs, Path):
+            seed_dirs = [seed_dirs]
+
+        lines = ''.join([f"{_seed_name(seed_dir)} {status}\n" for seed_dir in seed_dirs])
+
+        try:
+            fd = os.open(str(self.path), os.O_WRONLY | os.O_APPEND)
+        except FileNotFoundError:
+            # A concurrent rebuild may win the link with a snapshot taken before these FLAG-files were written,
+            # so the records are appended after the rebuild anyway (a duplicated record is harmless)
+            self.rebuild()
+            fd = os.open(str(self.path), os.O_WRONLY | os.O_APPEND)
+
+        try:
+            os.write(fd, lines.encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    def get_seeds(self, status, sort_by_seed=False):
+        """
+        Returns the seed_dirs whose last recorded status is 'status' (same ordering as get_some_seeds)
+        """
+        seed_names = [seed_name for seed_name, seed_status in self.status.items() if seed_status == status]
+        sort_key = _seed_major_key if sort_by_seed else _experiment_major_key
+        return [self.storage_dir / seed_name for seed_name in sorted(seed_names, key=sort_key)]
+
+    def _update(self, seed_name, status):
+        changed = self.status.get(seed_name) != status
+        self.status[seed_name] = status
+        return changed
+
+
+class SeedQueue(object):
+    """
+    In-memory priority queue of the runnable (UNHATCHED or PREEMPTED) seed_dirs of several storage_dirs, fed by
+    their catalogs.
+    The order in which the seeds are proposed is given by the dispatch policy:
+    - 'sequential': storage_dirs in the given order, lowest seed number (then experiment number) first
+    - 'seed_major': seed 1 of every experiment of every storage_dir before seed 2, and so on
+    - 'round_robin': one seed from each storage_dir in turn (fair-share), lowest seed number first within each
+    - 'priority': highest priority_fn(seed_dir) first, then seed-major
+    Proposing the next seed is O(log n), only the records read since the last refresh are pushed to the heaps.
+    """
+    policies = ['sequential', 'seed_major', 'round_robin', 'priority']
+
+    def __init__(self, storage_dirs, policy='sequential', priority_fn=None, offset=0):
+        """
+        :param storage_dirs (list): storage_dirs to dispatch the seeds of
+        :param policy (str): one of SeedQueue.policies
+        :param priority_fn (callable): seed_dir -> priority (number), only used by the 'priority' policy
+        :param offset (int): storage_dir served first by 'round_robin' (e.g. the index of the worker process,
+                             so that concurrent workers do not all start with the same storage_dir)
+        """
+        assert policy in self.policies, f"Unknown dispatch policy '{policy}', choose from {self.policies}"
+        assert policy != 'priority' or priority_fn is not None, "The 'priority' policy requires a priority_fn"
+
+        self.catalogs = [SeedCatalog(storage_dir) for storage_dir in storage_dirs]
+        self.policy = policy
+        self.priority_fn = priority_fn
+
+        # round_robin: one heap of seeds per storage_dir and a heap of the non-empty storage_dirs, keyed by
+        # the number of seeds already dispatched from them. Other policies: a single heap of seeds.
+
+        self._heap = []
+        self._storage_heaps = [[] for _ in self.catalogs]
+        self._n_dispatched = [0 for _ in self.catalogs]
+        self._in_storage_heap = [False for _ in self.catalogs]
+        self._tie_breaks = [(i - offset) % max(1, len(self.catalogs)) for i in range(len(self.catalogs))]
+
+    def refresh(self):
+        """
+        Reads the new records of all catalogs and queues the seed_dirs that have become runnable
+        """
+        for i, catalog in enumerate(self.catalogs):
+            for seed_name, status in catalog.refresh():
+                if status in RUNNABLE_FLAGS:
+                    self._push(i, seed_name)
+
+    def pop(self):
+        """
+        Removes and returns the next runnable seed_dir and its catalog, or (None, None) if there is none.
+        A seed_dir is only proposed again if a new UNHATCHED or PREEMPTED record is read from its catalog.
+        """
+        self.refresh()
+
+        if self.policy == 'round_robin':
+            while len(self._heap) > 0:
+                _, _, i = heapq.heappop(self._heap)
+                seed_name = self._pop_storage_heap(i)
+                if seed_name is None:
+                    self._in_storage_heap[i] = False
+                    continue
+
+                self._n_dispatched[i] += 1
+                heapq.heappush(self._heap, (self._n_dispatched[i], self._tie_breaks[i], i))
+                return self._dispatch(i, seed_name)
+
+        else:
+            while len(self._heap) > 0:
+                _, i, seed_name = heapq.heappop(self._heap)
+                if self.catalogs[i].status.get(seed_name) in RUNNABLE_FLAGS:
+                    return self._dispatch(i, seed_name)
+
+        return None, None
+
+    def _push(self, i, seed_name):
+        if self.policy == 'round_robin':
+            heapq.heappush(self._storage_heaps[i], (_seed_major_key(seed_name), seed_name))
+            if not self._in_storage_heap[i]:
+
+                # A storage_dir that gets new seeds does not get more than its share to catch up
+
+                if len(self._heap) > 0:
+                    self._n_dispatched[i] = max(self._n_dispatched[i], self._heap[0][0])
+                heapq.heappush(self._heap, (self._n_dispatched[i], self._tie_breaks[i], i))
+                self._in_storage_heap[i] = True
+            return
+
+        if self.policy == 'sequential':
+            key = (i,) + _seed_major_key(seed_name)
+        elif self.policy == 'seed_major':
+            key = _seed_major_key(seed_name) + (i,)
+        else:
+            key = (-self.priority_fn(self.catalogs[i].storage_dir / seed_name),) + _seed_major_key(seed_name) + (i,)
+
+        heapq.heappush(self._heap, (key, i, seed_name))
+
+    def _pop_storage_heap(self, i):
+        heap = self._storage_heaps[i]
+        while len(heap) > 0:
+            _, seed_name = heapq.heappop(heap)
+            if self.catalogs[i].status.get(seed_name) in RUNNABLE_FLAGS:
+                return seed_name
+
+        return None
+
+    def _dispatch(self, i, seed_name):
+        catalog = self.catalogs[i]
+        catalog.status[seed_name] = None
+        return catalog.storage_dir / seed_name, catalog
+
+
+def record_seed_status(seed_dirs, status):
+    """
+    Appends a status record to the catalog of the storage_dir containing these seed_dirs
+    """
+    if isinstance(seed_dirs, Path):
+        seed_dirs = [seed_dirs]
+
+    if len(seed_dirs) > 0:
+        SeedCatalog(seed_dirs[0].parents[1]).record(seed_dirs, status)
+
+
+def _seed_name(seed_dir):
+    return f"{seed_dir.parent.name}/{seed_dir.name}"
+
+
+def _seed_major_key(seed_name):
+    experiment_name, seed_dir_name = seed_name.split('/')
+    return int(seed_dir_name.split('seed')[1]), int(experiment_name.split('experiment')[1])
+
+
+def _experiment_major_key(seed_name):
+    return tuple(reversed(_seed_major_key(seed_name)))
@@ -0,0 +1,101 @@
+from alfred.utils.config import load_seed_configs, save_dict_to_json
+import alfred.utils.config
+import alfred.defaults
+
+from types import SimpleNamespace
+from pathlib import Path
+import argparse
+import tempfile
+import json
+import time
+
+
+def get_config_benchmark_args():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--n_seeds', type=int, default=50000,
+                        help="Number of seed_dirs (each with a config.json and a config_unique.json)")
+    parser.add_argument('--n_threads', type=int, default=8)
+    parser.add_argument('--n_repeats', type=int, default=3,
+                        help="The best of n_repeats measures is reported")
+    parser.add_argument('--root_dir', type=str, default=None,
+                        help="Directory in which the seed_dirs are created (a temporary directory by default), "
+                             "e.g. on a network filesystem")
+    return parser.parse_args()
+
+
+def make_seed_dirs(root_dir, n_seeds, n_seeds_per_experiment=10):
+    """
+    Creates the seed_dirs of a storage_dir, with configs of the size of a typical project
+    """
+    seed_dirs = []
+    for i in range(n_seeds):
+        seed_dir = Path(root_dir) / 'No1_alg_task_bench' / f'experiment{i // n_seeds_per_experiment + 1}' \
+                   / f'seed{i % n_seeds_per_experiment + 1}'
+        seed_dir.mkdir(parents=True)
+
+        config_unique_dict = {'lr': 10 ** -(i % 5), 'batch_size': 2 ** (i % 8), 'seed': i % n_seeds_per_experiment + 1}
+        config_dict = {'alg_name': 'alg', 'task_name': 'task', 'desc': 'bench', **config_unique_dict,
+                       **{f'param{j}': j * 0.5 for j in range(40)}}
+
+        save_dict_to_json(config_dict, filename=str(seed_dir / 'config.json'))
+        save_dict_to_json(config_unique_dict, filename=str(seed_dir / 'config_unique.json'))
+        seed_dirs.append(seed_dir)
+
+    return seed_dirs
+
+
+def load_seed_configs_without_cache(seed_dirs):
+    # Loaders used before the cache (a cold json.load per file)
+
+    configs = []
+    for seed_dir in seed_dirs:
+        with open(str(seed_dir / 'config.json'), 'r') as f:
+            config = SimpleNamespace(**json.load(f))
+        with open(str(seed_dir / 'config_unique.json'), 'r') as f:
+            config_unique_dict = json.load(f)
+        configs.append((config, config_unique_dict))
+
+    return configs
+
+
+def time_loader(load, n_repeats, clear_cache):
+    times = []
+    for _ in range(n_repeats):
+        if clear_cache:
+            alfred.utils.config._JSON_CACHE.clear()
+        start = time.perf_counter()
+        load()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def benchmark_config_loading(seed_dirs, n_threads, n_repeats):
+    # The cache is sized to hold the whole tree (see alfred.defaults.DEFAULT_JSON_CACHE_MAX_SIZE)
+
+    alfred.defaults.DEFAULT_JSON_CACHE_MAX_SIZE = max(alfred.defaults.DEFAULT_JSON_CACHE_MAX_SIZE, 2 * len(seed_dirs))
+
+    # Both loaders must return the same configs
+
+    assert load_seed_configs(seed_dirs[:100]) == load_seed_configs_without_cache(seed_dirs[:100])
+
+    return {
+        'previous loaders': time_loader(lambda: load_seed_configs_without_cache(seed_dirs), n_repeats, False),
+        'cold cache, 1 thread': time_loader(lambda: load_seed_configs(seed_dirs, n_threads=1), n_repeats, True),
+        f'cold cache, {n_threads} threads':
+            time_loader(lambda: load_seed_configs(seed_dirs, n_threads=n_threads), n_repeats, True),
+        'warm cache, 1 thread': time_loader(lambda: load_seed_configs(seed_dirs, n_threads=1), n_repeats, False),
+    }
+
+
+if __name__ == '__main__':
+    args = get_config_benchmark_args()
+
+    with tempfile.TemporaryDirectory(dir=args.root_dir) as root_dir:
+        seed_dirs = make_seed_dirs(root_dir, args.n_seeds)
+        times = benchmark_config_loading(seed_dirs, n_threads=args.n_threads, n_repeats=args.n_repeats)
+
+    print(f"Loading the configs of {args.n_seeds} seed_dirs ({2 * args.n_seeds} files)")
+    for name, duration in times.items():
+        print(f"{name:>25}: {duration:.2f}s")
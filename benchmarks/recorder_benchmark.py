@@ -0,0 +1,77 @@
+from alfred.utils.recorder import Recorder, ColumnarRecorder
+
+import argparse
+import timeit
+import numpy as np
+
+
+def get_recorder_benchmark_args():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--n_steps', type=int, default=100000,
+                        help="Number of calls to write_to_tape() per measure")
+    parser.add_argument('--n_metrics', type=int, default=8,
+                        help="Number of metrics recorded on the tape")
+    parser.add_argument('--n_written', type=int, default=3,
+                        help="Number of metrics written at each step")
+    parser.add_argument('--n_repeats', type=int, default=5,
+                        help="The best of n_repeats measures is reported")
+    return parser.parse_args()
+
+
+def make_steps(n_steps, n_metrics, n_written):
+    """
+    Values written at each step of a training loop: the first metric is an int (e.g. the episode),
+    the other ones are floats, and each step writes n_written of them
+    """
+    rng = np.random.RandomState(1234)
+    metrics = [f'metric{i}' for i in range(n_metrics)]
+
+    steps = []
+    for step in range(n_steps):
+        written = [metrics[0]] + list(rng.choice(metrics[1:], size=n_written - 1, replace=False))
+        steps.append({metric: step if metric == metrics[0] else float(rng.randn()) for metric in written})
+
+    return metrics, steps
+
+
+def time_recorder(recorder_class, metrics, steps, n_repeats):
+    """
+    Returns the best time per write_to_tape() call (in seconds) of a Recorder class
+    """
+    def record():
+        recorder = recorder_class(metrics_to_record=metrics)
+        for new_values_dict in steps:
+            recorder.write_to_tape(new_values_dict)
+
+    return min(timeit.repeat(record, number=1, repeat=n_repeats)) / len(steps)
+
+
+def benchmark_recorders(n_steps, n_metrics, n_written, n_repeats):
+    assert 0 < n_written <= n_metrics
+
+    metrics, steps = make_steps(n_steps, n_metrics, n_written)
+
+    # Both recorders must produce the same tape
+
+    recorder, columnar_recorder = Recorder(metrics), ColumnarRecorder(metrics)
+    for new_values_dict in steps:
+        recorder.write_to_tape(new_values_dict)
+        columnar_recorder.write_to_tape(new_values_dict)
+    assert dict(columnar_recorder.tape) == recorder.tape
+
+    return {recorder_class.__name__: time_recorder(recorder_class, metrics, steps, n_repeats)
+            for recorder_class in [Recorder, ColumnarRecorder]}
+
+
+if __name__ == '__main__':
+    args = get_recorder_benchmark_args()
+    times = benchmark_recorders(n_steps=args.n_steps,
+                                n_metrics=args.n_metrics,
+                                n_written=args.n_written,
+                                n_repeats=args.n_repeats)
+
+    print(f"write_to_tape() - {args.n_written} of {args.n_metrics} metrics per step, {args.n_steps} steps")
+    for name, time_per_write in times.items():
+        print(f"{name:>20}: {1e6 * time_per_write:.2f} us/write")
+    print(f"{'speedup':>20}: {times['Recorder'] / times['ColumnarRecorder']:.2f}x")
@@ -9,5 +9,9 @@ setup(name='alfred',
       install_requires=[
             'numpy>=1.16.3',
             'matplotlib>=3.1.2'
-      ]
+      ],
+      extras_require={
+            'fast': ['orjson'],
+            'pack': ['threadpoolctl']
+      }
 )
@@ -0,0 +1,139 @@
+import sys
+import logging
+import textwrap
+import itertools
+
+import pytest
+
+from alfred.utils.misc import create_logger
+
+# A minimal project using alfred: main.py at the root and one folder per search in schedules/
+
+MAIN_PY = """
+import argparse
+import os
+import time
+
+
+def get_run_args(overwritten_cmd_line):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--alg_name', default='alg')
+    parser.add_argument('--task_name', default='task')
+    parser.add_argument('--desc', default='test')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--lr', type=float, default=0.1)
+    parser.add_argument('--sleep', type=float, default=0.)
+    parser.add_argument('--root_dir', default='storage')
+    return parser.parse_args(overwritten_cmd_line.split())
+
+
+def set_up_alfred():
+    pass
+
+
+def main(config, dir_tree, logger, **kwargs):
+    started_at = time.time()
+    time.sleep(config.sleep)
+    with open(str(dir_tree.seed_dir / 'run_info.txt'), 'w') as f:
+        f.write(f"pid={os.getpid()}\\n"
+                f"started_at={started_at}\\n"
+                f"ended_at={time.time()}\\n"
+                f"affinity={sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else None}\\n"
+                f"omp={os.environ.get('OMP_NUM_THREADS')}\\n"
+                f"resume_checkpoint={dir_tree.resume_checkpoint}\\n")
+"""
+
+
+@pytest.fixture
+def project_dir(tmp_path, monkeypatch):
+    """
+    Creates a project (main.py and an empty schedules package) in a temporary directory and runs the test from it
+    """
+    (tmp_path / 'main.py').write_text(MAIN_PY)
+    (tmp_path / 'schedules').mkdir()
+    (tmp_path / 'schedules' / '__init__.py').write_text('')
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for module_name in [name for name in sys.modules if name == 'schedules' or name.startswith('schedules.')]:
+        monkeypatch.delitem(sys.modules, module_name)
+
+    return tmp_path
+
+
+@pytest.fixture
+def logger():
+    return create_logger(name='TEST', loglevel=logging.WARNING)
+
+
+@pytest.fixture
+def write_schedule(project_dir):
+    """
+    Returns a function writing schedules/<name>/<grid|random>_schedule_<name>.py (grid if the content defines
+    VARIATIONS) and returning its path relative to project_dir
+    """
+    def write(name, content):
+        schedule_type = 'grid' if 'VARIATIONS' in content else 'random'
+        (project_dir / 'schedules' / name).mkdir()
+        (project_dir / 'schedules' / name / '__init__.py').write_text('')
+        schedule_file = f'schedules/{name}/{schedule_type}_schedule_{name}.py'
+        (project_dir / schedule_file).write_text(textwrap.dedent(content))
+        return schedule_file
+
+    return write
+
+
+@pytest.fixture
+def prepare(project_dir, logger):
+    """
+    Returns a function preparing the search of a schedule_file in project_dir/storage and returning its storage_dirs
+    """
+    from alfred.prepare_schedule import prepare_schedule
+
+    def run(schedule_file, desc='test', **kwargs):
+        prepare_schedule(desc=desc, schedule_file=schedule_file, root_dir='storage', add_to_folder=None,
+                         resample=True, logger=logger, ask_for_validation=False, **kwargs)
+        return sorted([path for path in (project_dir / 'storage').iterdir() if path.is_dir()])
+
+    return run
+
+
+# Grid search of the tests: one storage_dir per alg_name, one experiment per combination of the VARIATIONS
+
+GRID_SCHEDULE = """
+from collections import OrderedDict
+from main import get_run_args
+
+ALG_NAMES = {alg_names!r}
+TASK_NAMES = ['task']
+SEEDS = {seeds!r}
+
+VARIATIONS = OrderedDict({variations!r})
+
+{extra}
+"""
+
+
+@pytest.fixture
+def make_storage_dir(project_dir, write_schedule, prepare):
+    """
+    Returns a function preparing a grid search and returning its storage_dir
+    :param variations (dict): hyperparameter -> list of values (lr=[0.1] by default)
+    :param extra (str): code appended to the schedule file (e.g. a function get_resources(config))
+    :param prepare_kwargs: other arguments of prepare_schedule (e.g. use_base_configs=True)
+    """
+    schedule_nums = itertools.count(1)
+
+    def make(variations=None, seeds=(1,), extra='', **prepare_kwargs):
+        variations = {'lr': [0.1]} if variations is None else variations
+        content = GRID_SCHEDULE.format(alg_names=['alg'], seeds=list(seeds), variations=list(variations.items()),
+                                       extra=textwrap.dedent(extra))
+
+        storage_root = project_dir / 'storage'
+        existing_dirs = set(storage_root.iterdir()) if storage_root.exists() else set()
+        new_dirs = [path for path in prepare(write_schedule(f'grid{next(schedule_nums)}', content), **prepare_kwargs)
+                    if path not in existing_dirs]
+        assert len(new_dirs) == 1
+        return new_dirs[0]
+
+    return make
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+import alfred.aggregate_results
+from alfred.aggregate_results import aggregate_storage_dirs
+from alfred.utils.recorder import Recorder
+
+
+def _save_recorder(seed_dir, values):
+    recorder = Recorder(['return'])
+    for value in values:
+        recorder.write_to_tape({'return': value})
+    recorder.save(str(seed_dir / 'metrics.pkl'))
+
+
+@pytest.fixture
+def storage_dir(make_storage_dir):
+    storage_dir = make_storage_dir(variations={'lr': [0.1, 0.2]}, seeds=[1, 2])
+    for seed_dir in storage_dir.glob('experiment*/seed*'):
+        _save_recorder(seed_dir, [1., 2.])
+    return storage_dir
+
+
+@pytest.fixture
+def read_paths(monkeypatch):
+    # Paths of the recorders read by aggregate_storage_dirs (n_processes=1: they are read in this process)
+
+    read_paths = []
+    load_metric = alfred.aggregate_results._load_metric
+
+    def spy(path, metric):
+        read_paths.append(path)
+        return load_metric(path, metric)
+
+    monkeypatch.setattr(alfred.aggregate_results, '_load_metric', spy)
+    return read_paths
+
+
+def _aggregate(storage_dir, logger):
+    summaries = aggregate_storage_dirs([storage_dir], metric='return', recorder_path='metrics.pkl',
+                                       higher_is_better=True, n_processes=1, logger=logger)
+    return {row['experiment']: row for row in summaries[storage_dir]}
+
+
+def test_unmodified_recorders_are_not_read_again(storage_dir, logger, read_paths):
+    assert _aggregate(storage_dir, logger)['experiment1']['best_mean'] == 2.
+    assert len(read_paths) == 4
+
+    read_paths.clear()
+    assert _aggregate(storage_dir, logger)['experiment1']['best_mean'] == 2.
+    assert read_paths == []
+
+
+def test_recorders_with_another_mtime_are_read_again(storage_dir, logger, read_paths):
+    _aggregate(storage_dir, logger)
+
+    # Same size, only the mtime tells that the recorder has changed
+
+    seed_dir = storage_dir / 'experiment1' / 'seed1'
+    old_size = os.stat(str(seed_dir / 'metrics.pkl')).st_size
+    _save_recorder(seed_dir, [1., 4.])
+    stat = os.stat(str(seed_dir / 'metrics.pkl'))
+    assert stat.st_size == old_size
+    os.utime(str(seed_dir / 'metrics.pkl'), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    read_paths.clear()
+    assert _aggregate(storage_dir, logger)['experiment1']['best_mean'] == 3.
+    assert read_paths == [seed_dir / 'metrics.pkl']
+
+
+def test_recorders_with_another_size_are_read_again(storage_dir, logger, read_paths):
+    _aggregate(storage_dir, logger)
+
+    # Same mtime (e.g. coarse timestamps of a network filesystem), only the size tells that the recorder has changed
+
+    seed_dir = storage_dir / 'experiment1' / 'seed1'
+    old_stat = os.stat(str(seed_dir / 'metrics.pkl'))
+    _save_recorder(seed_dir, [1., 2., 6.])
+    os.utime(str(seed_dir / 'metrics.pkl'), ns=(old_stat.st_atime_ns, old_stat.st_mtime_ns))
+    assert os.stat(str(seed_dir / 'metrics.pkl')).st_size != old_stat.st_size
+
+    read_paths.clear()
+    assert _aggregate(storage_dir, logger)['experiment1']['best_mean'] == 4.
+    assert read_paths == [seed_dir / 'metrics.pkl']
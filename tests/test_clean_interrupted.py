@@ -0,0 +1,100 @@
+import os
+import time
+
+import pytest
+
+from alfred.clean_interrupted import clean_interrupted
+from alfred.utils.directory_tree import DirectoryTree, claim_seed, get_seeds_status
+
+@pytest.fixture
+def storage_dir(make_storage_dir):
+    # experiment1: dead run (expired lease), experiment2: alive run, experiment3: unhatched
+
+    storage_dir = make_storage_dir(variations={'lr': [0.1, 0.2, 0.3]})
+
+    for experiment_num in [1, 2]:
+        seed_dir = storage_dir / f'experiment{experiment_num}' / 'seed1'
+        assert claim_seed(seed_dir)
+        (seed_dir / 'important_output.txt').write_text('results')
+
+    dead_seed_dir = storage_dir / 'experiment1' / 'seed1'
+    os.utime(str(dead_seed_dir / 'OPENED'), (time.time() - 3600, time.time() - 3600))
+
+    return storage_dir
+
+
+def _clean(storage_dir, logger, **kwargs):
+    clean_interrupted(from_file=None, storage_name=storage_dir.name, clean_opened=False, clean_crashed=False,
+                      logger=logger, root_dir='storage', lease_timeout=60., **kwargs)
+
+
+def test_expired_seeds_are_not_reclaimed_without_validation(storage_dir, logger, monkeypatch):
+    monkeypatch.setattr('builtins.input', lambda prompt: 'n')
+    _clean(storage_dir, logger, ask_for_validation=True)
+
+    dead_seed_dir = storage_dir / 'experiment1' / 'seed1'
+    assert (dead_seed_dir / 'important_output.txt').exists()
+    assert get_seeds_status(storage_dir)[dead_seed_dir] == 'OPENED'
+
+
+def test_expired_seeds_are_reclaimed_once_validated(storage_dir, logger, monkeypatch):
+    monkeypatch.setattr('builtins.input', lambda prompt: 'y')
+    _clean(storage_dir, logger, ask_for_validation=True)
+
+    seeds_status = get_seeds_status(storage_dir)
+    dead_seed_dir = storage_dir / 'experiment1' / 'seed1'
+    alive_seed_dir = storage_dir / 'experiment2' / 'seed1'
+
+    assert not (dead_seed_dir / 'important_output.txt').exists()
+    assert seeds_status[dead_seed_dir] == 'UNHATCHED'
+    assert (alive_seed_dir / 'important_output.txt').exists()
+    assert seeds_status[alive_seed_dir] == 'OPENED'
+
+
+def test_reclaim_expired_can_be_disabled(storage_dir, logger):
+    _clean(storage_dir, logger, ask_for_validation=False, reclaim_expired=False)
+
+    assert get_seeds_status(storage_dir)[storage_dir / 'experiment1' / 'seed1'] == 'OPENED'
+
+
+def test_seeds_claimed_without_lease_are_only_reset_with_clean_opened(storage_dir, logger):
+    # experiment3 has been claimed by an older version of alfred: empty OPENED flag, without heartbeat
+
+    legacy_seed_dir = storage_dir / 'experiment3' / 'seed1'
+    os.rename(str(legacy_seed_dir / 'UNHATCHED'), str(legacy_seed_dir / 'OPENED'))
+    os.utime(str(legacy_seed_dir / 'OPENED'), (time.time() - 3600, time.time() - 3600))
+
+    _clean(storage_dir, logger, ask_for_validation=False)
+    assert get_seeds_status(storage_dir)[legacy_seed_dir] == 'OPENED'
+
+    clean_interrupted(from_file=None, storage_name=storage_dir.name, clean_opened=True, clean_crashed=False,
+                      logger=logger, root_dir='storage', lease_timeout=60., ask_for_validation=False)
+    assert get_seeds_status(storage_dir)[legacy_seed_dir] == 'UNHATCHED'
+
+
+def test_interrupted_runs_are_resumed_from_their_last_checkpoint(storage_dir, logger):
+    from alfred.launch_schedule import _work_on_schedule
+
+    # The dead run of experiment1 has saved two checkpoints, the last one has been deleted since
+
+    dead_seed_dir = storage_dir / 'experiment1' / 'seed1'
+    dir_tree = DirectoryTree.init_from_seed_path(dead_seed_dir, root='storage')
+    for checkpoint_name in ['step100.pt', 'step200.pt', 'step300.pt']:
+        (dead_seed_dir / checkpoint_name).write_text('weights')
+        dir_tree.register_checkpoint(dead_seed_dir / checkpoint_name)
+    os.remove(str(dead_seed_dir / 'step300.pt'))
+
+    _clean(storage_dir, logger, ask_for_validation=False)
+
+    assert get_seeds_status(storage_dir)[dead_seed_dir] == 'PREEMPTED'
+    assert (dead_seed_dir / 'important_output.txt').exists()
+
+    # The PREEMPTED seed is claimed again and main() gets its newest existing checkpoint, the unhatched one starts over
+
+    assert _work_on_schedule([storage_dir], n_experiments_per_proc=10, logger=logger, root_dir='storage') == 2
+
+    for seed_dir, resume_checkpoint in [(dead_seed_dir, str(dead_seed_dir / 'step200.pt')),
+                                        (storage_dir / 'experiment3' / 'seed1', 'None')]:
+        assert get_seeds_status(storage_dir)[seed_dir] == 'COMPLETED'
+        run_info = dict([line.split('=', 1) for line in (seed_dir / 'run_info.txt').read_text().splitlines()])
+        assert run_info['resume_checkpoint'] == resume_checkpoint
@@ -0,0 +1,101 @@
+import threading
+
+import alfred.defaults
+import alfred.utils.config
+from alfred.utils.config import load_config_from_json, load_dict_from_json, load_seed_configs, save_dict_to_json
+from alfred.utils.directory_tree import get_seeds_status, reset_seed_dir
+
+
+def _make_seed_dirs(tmp_path, n_seeds):
+    seed_dirs = []
+    for seed in range(1, n_seeds + 1):
+        seed_dir = tmp_path / 'experiment1' / f'seed{seed}'
+        seed_dir.mkdir(parents=True)
+        save_dict_to_json({'seed': seed, 'lr': 0.1}, filename=str(seed_dir / 'config.json'))
+        save_dict_to_json({'seed': seed}, filename=str(seed_dir / 'config_unique.json'))
+        seed_dirs.append(seed_dir)
+
+    return seed_dirs
+
+
+def test_json_cache_is_bounded_and_thread_safe(tmp_path, monkeypatch):
+    monkeypatch.setattr(alfred.defaults, 'DEFAULT_JSON_CACHE_MAX_SIZE', 10)
+    monkeypatch.setattr(alfred.utils.config, '_JSON_CACHE', {})
+    seed_dirs = _make_seed_dirs(tmp_path, 200)
+
+    # Many threads evict entries of a small cache at the same time
+
+    errors = []
+
+    def load_all():
+        try:
+            configs = load_seed_configs(seed_dirs, n_threads=1)
+            assert [config.seed for config, _ in configs] == list(range(1, 201))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=load_all) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(alfred.utils.config._JSON_CACHE) <= 10
+
+
+def test_modified_files_are_read_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(alfred.utils.config, '_JSON_CACHE', {})
+    filename = str(tmp_path / 'config.json')
+
+    save_dict_to_json({'lr': 0.1}, filename=filename)
+    assert load_dict_from_json(filename) == {'lr': 0.1}
+
+    save_dict_to_json({'lr': 0.25}, filename=filename)
+    assert load_dict_from_json(filename) == {'lr': 0.25}
+
+
+def test_json_cache_can_be_disabled(tmp_path, monkeypatch):
+    monkeypatch.setattr(alfred.defaults, 'DEFAULT_JSON_CACHE_MAX_SIZE', 0)
+    monkeypatch.setattr(alfred.utils.config, '_JSON_CACHE', {})
+    seed_dirs = _make_seed_dirs(tmp_path, 3)
+
+    load_seed_configs(seed_dirs)
+    assert alfred.utils.config._JSON_CACHE == {}
+
+
+def test_seed_dirs_with_base_configs_are_loaded_from_their_overrides(make_storage_dir, logger):
+    from alfred.launch_schedule import _work_on_schedule
+
+    variations = {'lr': [0.1, 0.2], 'sleep': [0.]}
+    storage_dir = make_storage_dir(variations=variations, seeds=[1, 2])
+    base_storage_dir = make_storage_dir(variations=variations, seeds=[1, 2], use_base_configs=True)
+
+    # One base config per experiment, each seed_dir only has its overrides
+
+    assert len(list((base_storage_dir / 'base_configs').glob('*.json'))) == 2
+
+    seed_names = [f'experiment{experiment_num}/seed{seed}' for experiment_num in [1, 2] for seed in [1, 2]]
+    for seed_name in seed_names:
+        assert sorted([path.name for path in (base_storage_dir / seed_name).iterdir()]) == \
+               ['UNHATCHED', 'config_overrides.json']
+
+    # config.json and config_unique.json are resolved as if they had been saved in the seed_dir
+
+    configs = load_seed_configs([storage_dir / seed_name for seed_name in seed_names])
+    base_configs = load_seed_configs([base_storage_dir / seed_name for seed_name in seed_names])
+    assert [(vars(config), config_unique) for config, config_unique in base_configs] == \
+           [(vars(config), config_unique) for config, config_unique in configs]
+
+    seed_dir = base_storage_dir / 'experiment2' / 'seed2'
+    config = load_config_from_json(str(seed_dir / 'config.json'))
+    assert (config.lr, config.seed) == (0.2, 2)
+    assert load_dict_from_json(str(seed_dir / 'config_unique.json'))['lr'] == 0.2
+
+    # The seed_dirs can be run, and reset without losing their config
+
+    assert _work_on_schedule([base_storage_dir], n_experiments_per_proc=10, logger=logger, root_dir='storage') == 4
+    assert set(get_seeds_status(base_storage_dir).values()) == {'COMPLETED'}
+
+    reset_seed_dir(seed_dir)
+    assert load_config_from_json(str(seed_dir / 'config.json')).lr == 0.2
@@ -0,0 +1,209 @@
+import os
+import sys
+import time
+import random
+import threading
+import multiprocessing
+from collections import Counter
+
+import pytest
+
+from alfred.utils.directory_tree import Heartbeat, claim_seed, release_seed, reclaim_seed, reset_seed_dir, \
+    get_seeds_status, get_all_seeds, get_lease, is_lease_expired
+from alfred.utils.seed_catalog import SeedCatalog
+
+@pytest.fixture
+def make_seed_dir(make_storage_dir):
+    def make(sleep=0.):
+        storage_dir = make_storage_dir(variations={'lr': [0.1], 'sleep': [sleep]})
+        return storage_dir / 'experiment1' / 'seed1'
+
+    return make
+
+
+def _set_mtime(path, age):
+    os.utime(str(path), (time.time() - age, time.time() - age))
+
+
+def test_heartbeat_survives_a_short_miss(make_seed_dir):
+    seed_dir = make_seed_dir()
+    assert claim_seed(seed_dir)
+
+    heartbeat = Heartbeat(seed_dir, interval=0.02, n_retries=5, retry_interval=0.05)
+    heartbeat.start()
+
+    os.rename(str(seed_dir / 'OPENED'), str(seed_dir / 'RECLAIMING'))
+    time.sleep(0.1)
+    os.rename(str(seed_dir / 'RECLAIMING'), str(seed_dir / 'OPENED'))
+    time.sleep(0.1)
+
+    heartbeat.stop()
+    assert not heartbeat.lease_lost
+
+
+def test_heartbeat_gives_the_lease_back_while_it_is_being_reclaimed(make_seed_dir):
+    seed_dir = make_seed_dir()
+    assert claim_seed(seed_dir)
+
+    # The lease looks expired (e.g. the process has been suspended) and a reclaimer has just renamed it
+
+    heartbeat = Heartbeat(seed_dir, interval=0.01, n_retries=5, retry_interval=0.05)
+    _set_mtime(seed_dir / 'OPENED', age=3600)
+    os.rename(str(seed_dir / 'OPENED'), str(seed_dir / 'RECLAIMING'))
+    heartbeat.start()
+    time.sleep(0.05)
+
+    # The re-check of reclaim_seed() then sees a fresh heartbeat and gives the lease back
+
+    assert time.time() - os.stat(str(seed_dir / 'RECLAIMING')).st_mtime < 60.
+    os.rename(str(seed_dir / 'RECLAIMING'), str(seed_dir / 'OPENED'))
+    time.sleep(0.05)
+
+    heartbeat.stop()
+    assert not heartbeat.lease_lost
+
+
+def test_heartbeat_detects_a_lost_lease(make_seed_dir):
+    seed_dir = make_seed_dir()
+    assert claim_seed(seed_dir)
+    _set_mtime(seed_dir / 'OPENED', age=3600)
+    assert reclaim_seed(seed_dir, lease_timeout=60.) == 'UNHATCHED'
+
+    heartbeat = Heartbeat(seed_dir, interval=0.01, n_retries=2, retry_interval=0.01)
+    heartbeat.start()
+    time.sleep(0.2)
+
+    assert heartbeat.lease_lost
+    heartbeat.stop()
+
+
+def test_lost_lease_is_not_released(make_seed_dir, logger):
+    from alfred.launch_schedule import _run_seed
+
+    seed_dir = make_seed_dir(sleep=0.5)
+    assert claim_seed(seed_dir)
+
+    # While the run is going, its seed_dir is reclaimed and claimed by another worker
+
+    def steal_lease():
+        time.sleep(0.1)
+        reset_seed_dir(seed_dir)
+        time.sleep(0.2)
+        assert claim_seed(seed_dir)
+
+    thief = threading.Thread(target=steal_lease)
+    thief.start()
+    completed = _run_seed(seed_dir, SeedCatalog(seed_dir.parents[1]), logger, root_dir='storage', process_i=0,
+                          heartbeat_interval=0.02, main_kwargs={})
+    thief.join()
+
+    assert not completed
+    assert get_seeds_status(seed_dir.parents[1])[seed_dir] == 'OPENED'
+
+
+def _claim_all(seed_dirs, barrier, queue, worker_i):
+    seed_dirs = list(seed_dirs)
+    random.Random(worker_i).shuffle(seed_dirs)
+
+    barrier.wait()
+    queue.put([str(seed_dir) for seed_dir in seed_dirs if claim_seed(seed_dir)])
+
+
+def test_each_seed_is_claimed_exactly_once(make_storage_dir):
+    storage_dir = make_storage_dir(variations={'lr': [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8]}, seeds=[1, 2, 3, 4])
+    seed_dirs = get_all_seeds(storage_dir)
+    assert len(seed_dirs) == 32
+
+    # Workers start claiming the seeds (each in its own order) at the same time
+
+    n_workers = 8
+    context = multiprocessing.get_context('fork')
+    barrier, queue = context.Barrier(n_workers), context.Queue()
+    workers = [context.Process(target=_claim_all, args=(seed_dirs, barrier, queue, i)) for i in range(n_workers)]
+    for worker in workers:
+        worker.start()
+
+    claims = Counter(seed_dir for _ in workers for seed_dir in queue.get(timeout=60))
+    for worker in workers:
+        worker.join()
+
+    assert claims == Counter([str(seed_dir) for seed_dir in seed_dirs])
+    assert set(get_seeds_status(storage_dir).values()) == {'OPENED'}
+
+
+def test_release_only_replaces_the_lease_it_holds(make_seed_dir):
+    seed_dir = make_seed_dir()
+    lease = claim_seed(seed_dir)
+
+    # The seed_dir is reclaimed and claimed again by another process
+
+    reset_seed_dir(seed_dir)
+    other_lease = claim_seed(seed_dir)
+    assert other_lease != lease
+
+    assert not release_seed(seed_dir, 'COMPLETED', lease=lease)
+    assert get_lease(seed_dir) == other_lease
+    assert not (seed_dir / 'COMPLETED').exists()
+
+    assert release_seed(seed_dir, 'COMPLETED', lease=other_lease)
+    assert get_seeds_status(seed_dir.parents[1])[seed_dir] == 'COMPLETED'
+
+
+def test_seeds_claimed_without_lease_never_expire(make_seed_dir):
+    seed_dir = make_seed_dir()
+    os.rename(str(seed_dir / 'UNHATCHED'), str(seed_dir / 'OPENED'))
+    _set_mtime(seed_dir / 'OPENED', age=3600)
+
+    assert not is_lease_expired(seed_dir, lease_timeout=60.)
+    assert reclaim_seed(seed_dir, lease_timeout=60.) is None
+
+
+def _start_process(target, *args):
+    p = multiprocessing.get_context('fork').Process(target=target, args=args)
+    p.start()
+    return p
+
+
+@pytest.mark.parametrize('stolen', [False, True])
+def test_limited_run_only_releases_the_lease_it_holds(make_seed_dir, logger, stolen):
+    from alfred.launch_schedule import _end_limited_run
+
+    seed_dir = make_seed_dir()
+    lease = claim_seed(seed_dir)
+    if stolen:
+        reset_seed_dir(seed_dir)
+        other_lease = claim_seed(seed_dir)
+
+    # The process of the run dies (e.g. after having lost its lease)
+
+    p = _start_process(sys.exit, 1)
+    assert not _end_limited_run(p, seed_dir, SeedCatalog(seed_dir.parents[1]), logger, run_timeout=None,
+                                deadline=None, lease=lease)
+
+    if stolen:
+        assert get_lease(seed_dir) == other_lease
+        assert get_seeds_status(seed_dir.parents[1])[seed_dir] == 'OPENED'
+    else:
+        assert get_seeds_status(seed_dir.parents[1])[seed_dir] == 'CRASH'
+
+
+@pytest.mark.parametrize('stolen', [False, True])
+def test_timed_out_run_only_releases_the_lease_it_holds(make_seed_dir, logger, stolen):
+    from alfred.launch_schedule import _end_limited_run
+
+    seed_dir = make_seed_dir()
+    lease = claim_seed(seed_dir)
+    if stolen:
+        reset_seed_dir(seed_dir)
+        other_lease = claim_seed(seed_dir)
+
+    p = _start_process(time.sleep, 30.)
+    assert not _end_limited_run(p, seed_dir, SeedCatalog(seed_dir.parents[1]), logger, run_timeout=0.,
+                                deadline=time.time(), lease=lease)
+    assert not p.is_alive()
+
+    if stolen:
+        assert get_lease(seed_dir) == other_lease
+        assert get_seeds_status(seed_dir.parents[1])[seed_dir] == 'OPENED'
+    else:
+        assert get_seeds_status(seed_dir.parents[1])[seed_dir] == 'TIMEOUT'
@@ -0,0 +1,77 @@
+import numpy as np
+
+from alfred.prepare_schedule import sample_random_experiments
+from alfred.utils.directory_tree import get_seeds_status
+from alfred.utils.config import load_config_from_json
+
+RANDOM_SCHEDULE = """
+import numpy as np
+from main import get_run_args
+
+ALG_NAMES = {alg_names}
+TASK_NAMES = ['task']
+SEEDS = [1, 2]
+N_EXPERIMENTS = 4
+
+
+def sample_experiment():
+    return {{'lr': float(np.random.uniform(0., 1.))}}
+"""
+
+
+class _Schedule(object):
+    @staticmethod
+    def sample_experiment():
+        return {'lr': np.random.uniform(0., 1.), 'sleep': 0.}
+
+
+def test_sample_random_experiments_without_resampling():
+    assert sample_random_experiments(_Schedule, n_experiments=4, n_samplings=0) == []
+    assert sample_random_experiments(_Schedule, n_experiments=0, n_samplings=2) == [({}, [], []), ({}, [], [])]
+
+
+def test_sample_random_experiments(project_dir):
+    samplings = sample_random_experiments(_Schedule, n_experiments=4, n_samplings=2)
+
+    assert len(samplings) == 2
+    for param_samples, experiments, varied_params in samplings:
+        assert len(experiments) == 4
+        assert varied_params == ['lr']
+        assert len(param_samples['lr']) == 4
+
+
+def test_prepare_random_schedule_single_alg_and_task(write_schedule, prepare):
+    # Only sample_experiment() is defined, and a single alg/task combination means no resampling
+
+    schedule_file = write_schedule('r1', RANDOM_SCHEDULE.format(alg_names=['alg']))
+    storage_dirs = prepare(schedule_file)
+
+    assert len(storage_dirs) == 1
+    seeds_status = get_seeds_status(storage_dirs[0])
+    assert len(seeds_status) == 4 * 2
+    assert set(seeds_status.values()) == {'UNHATCHED'}
+
+
+def test_prepare_random_schedule_resamples_each_alg(write_schedule, prepare):
+    schedule_file = write_schedule('r2', RANDOM_SCHEDULE.format(alg_names=['algA', 'algB']))
+    storage_dirs = prepare(schedule_file)
+
+    assert len(storage_dirs) == 2
+    for storage_dir in storage_dirs:
+        assert len(get_seeds_status(storage_dir)) == 4 * 2
+
+
+def test_create_experiment_dir(project_dir):
+    from argparse import Namespace
+    from alfred.prepare_schedule import create_experiment_dir
+    from alfred.utils.scheduling import load_resources
+
+    config = Namespace(alg_name='alg', task_name='task', desc='test', seed=1, lr=0.1)
+    dir_tree = create_experiment_dir('No1', config, {'lr': 0.1}, SEEDS=[1, 2], root_dir='storage',
+                                     resources_dict={'n_cpus': 2})
+
+    assert dir_tree.seed_dir.name == 'seed2'
+    assert get_seeds_status(dir_tree.storage_dir) == {dir_tree.experiment_dir / 'seed1': 'UNHATCHED',
+                                                      dir_tree.experiment_dir / 'seed2': 'UNHATCHED'}
+    assert load_resources(dir_tree.experiment_dir)['n_cpus'] == 2
+    assert load_config_from_json(str(dir_tree.seed_dir / 'config.json')).lr == 0.1
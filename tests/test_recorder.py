@@ -0,0 +1,176 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from alfred.utils.recorder import Recorder, ColumnarRecorder
+
+
+def _write(recorder, steps):
+    for new_values_dict in steps:
+        recorder.write_to_tape(new_values_dict)
+    return recorder
+
+
+STEPS = [{'loss': 1.5, 'episode': 0},
+         {'episode': 1, 'done': True},
+         {'loss': 2, 'obs': np.arange(3.)},
+         {'episode': 3, 'info': {'a': 1}}]
+
+
+def _assert_same_values(values, expected_values):
+    assert len(values) == len(expected_values)
+    for value, expected_value in zip(values, expected_values):
+        assert type(value) is type(expected_value)
+        if isinstance(expected_value, np.ndarray):
+            assert value.dtype == expected_value.dtype and np.array_equal(value, expected_value)
+        else:
+            assert value == expected_value
+
+
+def test_tape_matches_recorder():
+    metrics = ['loss', 'episode', 'done', 'obs', 'info']
+    tape, columnar_tape = _write(Recorder(metrics), STEPS).tape, _write(ColumnarRecorder(metrics), STEPS).tape
+
+    assert list(columnar_tape.keys()) == metrics
+    for metric in metrics:
+        _assert_same_values(columnar_tape[metric], tape[metric])
+
+
+@pytest.mark.parametrize('values', [
+    [1, 2.5, 3],
+    [2.5, 1, True],
+    [True, 1],
+    [np.float32(1.5), 2.5, np.float32(3.)],
+    [np.int64(1), 1],
+    [np.uint8(3), np.uint8(255)],
+    [np.complex64(1 + 2j), np.complex64(3)],
+    [np.array(3, dtype=np.uint8), np.array(4, dtype=np.uint8)],
+    [np.array([1, 2], dtype=np.uint16), np.array([1., 2.])],
+    [np.array([1 + 1j, 2]), np.array([3, 4j])],
+    [np.arange(3), np.arange(4)],
+    [1, 'text', None, 2],
+])
+def test_tape_matches_recorder_for_every_type(values):
+    steps = [{'x': value} if value is not None else {} for value in values]
+    tape, columnar_tape = _write(Recorder(['x']), steps).tape, _write(ColumnarRecorder(['x']), steps).tape
+
+    _assert_same_values(columnar_tape['x'], tape['x'])
+
+
+def test_tape_is_read_only():
+    recorder = _write(ColumnarRecorder(['loss']), [{'loss': 1.}])
+
+    with pytest.raises(TypeError):
+        recorder.tape['loss'] = [2.]
+
+    # The lists of values are copies
+
+    recorder.tape['loss'].append(2.)
+    assert recorder.tape['loss'] == [1.]
+    assert len(recorder) == 1
+
+
+def test_ints_beyond_int64_fall_back_to_objects():
+    recorder = _write(ColumnarRecorder(['count', 'value']), [{'count': 1, 'value': 0.5},
+                                                             {'count': 2 ** 70},
+                                                             {'count': 3, 'value': 10 ** 400}])
+
+    assert recorder.tape['count'] == [1, 2 ** 70, 3]
+    assert recorder.tape['value'] == [0.5, None, 10 ** 400]
+
+
+def test_save_and_load(tmp_path):
+    recorder = _write(ColumnarRecorder(['loss', 'episode', 'done']), STEPS[:2])
+    recorder.save(str(tmp_path / 'metrics.pkl'))
+
+    with open(str(tmp_path / 'metrics.pkl'), 'rb') as f:
+        assert pickle.load(f) == {'loss': [1.5, None], 'episode': [0, 1], 'done': [None, True]}
+
+    loaded = ColumnarRecorder.init_from_pickle_file(str(tmp_path / 'metrics.pkl'))
+    assert dict(loaded.tape) == dict(recorder.tape)
+
+
+@pytest.mark.parametrize('recorder_class', [Recorder, ColumnarRecorder])
+def test_chunks_round_trip(tmp_path, recorder_class):
+    recorder = recorder_class(['loss', 'episode', 'done', 'obs', 'info'])
+    _write(recorder, STEPS[:2])
+    recorder.save_chunk(str(tmp_path / 'chunks'))
+    recorder.save_chunk(str(tmp_path / 'chunks'))
+    _write(recorder, STEPS[2:])
+    recorder.save_chunk(str(tmp_path / 'chunks'))
+
+    assert len(list((tmp_path / 'chunks').iterdir())) == 2
+
+    loaded = recorder_class.init_from_chunks(str(tmp_path / 'chunks'))
+    assert len(loaded) == len(STEPS)
+    for metric_name in recorder.tape:
+        _assert_same_values(loaded.tape[metric_name], recorder.tape[metric_name])
+
+
+@pytest.mark.parametrize('recorder_class', [Recorder, ColumnarRecorder])
+def test_append_after_loading_chunks(tmp_path, recorder_class):
+    recorder = _write(recorder_class(['loss', 'episode']), [{'loss': 1.5, 'episode': 0}, {'episode': 1}])
+    recorder.save_chunk(str(tmp_path / 'chunks'))
+
+    # A resumed run only saves the steps recorded after loading the chunks
+
+    resumed = recorder_class.init_from_chunks(str(tmp_path / 'chunks'))
+    _write(resumed, [{'loss': 0.5, 'episode': 2}])
+    resumed.save_chunk(str(tmp_path / 'chunks'))
+
+    assert sorted([path.name for path in (tmp_path / 'chunks').iterdir()]) == ['0000000000-0000000002.pkl',
+                                                                                '0000000002-0000000003.pkl']
+
+    loaded = recorder_class.init_from_chunks(str(tmp_path / 'chunks'))
+    assert loaded.tape['loss'] == [1.5, None, 0.5] and loaded.tape['episode'] == [0, 1, 2]
+
+
+def test_partially_written_chunk_is_ignored(tmp_path):
+    recorder = _write(Recorder(['loss']), [{'loss': 1.5}, {'loss': 0.5}])
+    recorder.save_chunk(str(tmp_path / 'chunks'))
+
+    # A run killed while writing its next chunk leaves a truncated temporary file behind
+
+    (tmp_path / 'chunks' / '.0000000002-0000000003.pkl.tmp').write_bytes(b'\x80\x05\x95')
+
+    loaded = Recorder.init_from_pickle_file(str(tmp_path / 'chunks'))
+    assert loaded.tape['loss'] == [1.5, 0.5] and loaded.n_saved_steps == 2
+
+
+def test_stack_metric_across_seeds_of_different_lengths(tmp_path):
+    from alfred.utils.recorder import stack_metric_across_seeds
+
+    experiment_dir = tmp_path / 'experiment1'
+    for seed, n_steps in [(1, 100), (2, 60)]:
+        recorder = _write(ColumnarRecorder(['step']), [{'step': step} for step in range(n_steps)])
+        recorder.save_columnar(experiment_dir / f'seed{seed}' / 'metrics')
+
+    # Seeds are cut to their shared first steps
+
+    values, mask = stack_metric_across_seeds(experiment_dir, 'step')
+    assert values.shape == mask.shape == (2, 60)
+    assert np.array_equal(values[:, 0], [0, 0])
+    assert np.array_equal(values[:, -1], [59, 59])
+
+    # Or aligned on their last steps
+
+    values, _ = stack_metric_across_seeds(experiment_dir, 'step', tail=10)
+    assert values.shape == (2, 10)
+    assert np.array_equal(values[:, 0], [90, 50])
+
+
+def test_stack_metric_across_seeds_without_copy(tmp_path):
+    from alfred.utils.recorder import stack_metric_across_seeds
+
+    experiment_dir = tmp_path / 'experiment1'
+    for seed, n_steps in [(1, 100), (2, 60)]:
+        recorder = _write(ColumnarRecorder(['step']), [{'step': float(step)} for step in range(n_steps)])
+        recorder.save_columnar(experiment_dir / f'seed{seed}' / 'metrics')
+
+    values, mask = stack_metric_across_seeds(experiment_dir, 'step', tail=10, stack=False)
+
+    assert [type(seed_values) for seed_values in values] == [np.memmap, np.memmap]
+    assert [seed_values[0] for seed_values in values] == [90., 50.]
+    assert all([not seed_values.flags.writeable for seed_values in values])
+    assert all([seed_mask.all() for seed_mask in mask])
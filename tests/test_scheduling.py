@@ -0,0 +1,204 @@
+import os
+import time
+import multiprocessing
+
+import pytest
+
+from alfred.utils.directory_tree import claim_seed, get_seeds_status
+from alfred.utils.seed_catalog import SeedCatalog, SeedQueue, _seed_name
+from alfred.utils.scheduling import ResourcePacker, get_available_cpus, load_resources, set_run_resources
+
+GET_RESOURCES = """
+def get_resources(config):
+    return {'n_cpus': 1000 if config.lr == 0.1 else 1}
+"""
+
+
+def _read_run_info(seed_dir):
+    lines = (seed_dir / 'run_info.txt').read_text().splitlines()
+    return dict([line.split('=', 1) for line in lines])
+
+
+def test_packer_allocates_disjoint_cpus():
+    packer = ResourcePacker(cpus=[0, 1, 2, 3], memory_gb=8.)
+
+    first = packer.allocate({'n_cpus': 2, 'memory_gb': 2.})
+    second = packer.allocate({'n_cpus': 1, 'memory_gb': 4.})
+    assert first['cpus'] == [0, 1] and second['cpus'] == [2]
+
+    # Not enough memory left, then not enough cpus left
+
+    assert packer.allocate({'n_cpus': 1, 'memory_gb': 4.}) is None
+    assert packer.allocate({'n_cpus': 2, 'memory_gb': 0.}) is None
+
+    packer.release(first)
+    assert packer.allocate({'n_cpus': 2, 'memory_gb': 2.})['cpus'] == [0, 1]
+
+
+def test_packer_gives_the_whole_node_to_bigger_runs():
+    packer = ResourcePacker(cpus=[0, 1])
+
+    small = packer.allocate({'n_cpus': 1, 'memory_gb': 100.})
+    assert packer.allocate({'n_cpus': 8, 'memory_gb': 0.}) is None
+
+    packer.release(small)
+    assert packer.is_idle()
+    assert packer.allocate({'n_cpus': 8, 'memory_gb': 0.})['cpus'] == [0, 1]
+
+
+def test_pack_schedule_pins_runs_to_their_cpus(make_storage_dir, logger):
+    from alfred.launch_schedule import _pack_schedule
+
+    storage_dir = make_storage_dir(variations={'lr': [0.1, 0.2], 'sleep': [0.2]}, seeds=[1, 2], extra=GET_RESOURCES)
+    cpus = get_available_cpus()[:2]
+
+    n_runs = _pack_schedule([storage_dir], n_runs_max=10, logger=logger, root_dir='storage', cpus=cpus,
+                            memory_gb=None, heartbeat_interval=1., lease_timeout=None)
+
+    assert n_runs == 4
+    assert set(get_seeds_status(storage_dir).values()) == {'COMPLETED'}
+
+    # experiment1 needs more than the node: it gets all the cpus, and never runs alongside another run
+
+    runs = {}
+    for seed_dir in sorted(storage_dir.glob('experiment*/seed*')):
+        run_info = _read_run_info(seed_dir)
+        n_cpus = load_resources(seed_dir.parent)['n_cpus']
+        affinity = eval(run_info['affinity'])
+
+        assert set(affinity) <= set(cpus) and len(affinity) == min(n_cpus, len(cpus))
+        assert run_info['omp'] == str(len(affinity))
+        runs[seed_dir] = (float(run_info['started_at']), float(run_info['ended_at']), n_cpus)
+
+    for seed_dir, (start, end, n_cpus) in runs.items():
+        if n_cpus > len(cpus):
+            assert all([other_end <= start or other_start >= end
+                        for other_seed_dir, (other_start, other_end, _) in runs.items() if other_seed_dir != seed_dir])
+
+
+@pytest.fixture
+def storage_dirs(make_storage_dir):
+    # storage_dir A: 2 experiments x 2 seeds, storage_dir B: 1 experiment x 1 seed
+
+    return make_storage_dir(variations={'lr': [0.1, 0.2]}, seeds=[1, 2]), make_storage_dir()
+
+
+def _pop_all(queue, n_pops=None):
+    pops = []
+    while n_pops is None or len(pops) < n_pops:
+        seed_dir, catalog = queue.pop()
+        if seed_dir is None:
+            break
+        assert catalog.storage_dir == seed_dir.parents[1]
+        pops.append(seed_dir)
+    return pops
+
+
+@pytest.mark.parametrize('policy, expected', [
+    ('sequential', ['A/experiment1/seed1', 'A/experiment2/seed1', 'A/experiment1/seed2', 'A/experiment2/seed2',
+                    'B/experiment1/seed1']),
+    ('seed_major', ['A/experiment1/seed1', 'B/experiment1/seed1', 'A/experiment2/seed1', 'A/experiment1/seed2',
+                    'A/experiment2/seed2']),
+    ('priority', ['A/experiment2/seed1', 'A/experiment2/seed2', 'A/experiment1/seed1', 'B/experiment1/seed1',
+                  'A/experiment1/seed2']),
+])
+def test_seed_queue_order(storage_dirs, policy, expected):
+    names = dict(zip(storage_dirs, ['A', 'B']))
+
+    # 'priority': the experiments with the highest lr first
+
+    priority_fn = lambda seed_dir: 0.1 * int(seed_dir.parent.name.split('experiment')[1])
+    queue = SeedQueue(storage_dirs, policy=policy, priority_fn=priority_fn)
+
+    assert [f"{names[seed_dir.parents[1]]}/{_seed_name(seed_dir)}" for seed_dir in _pop_all(queue)] == expected
+
+
+def test_round_robin_does_not_let_a_storage_dir_catch_up(storage_dirs):
+    storage_dir_a, storage_dir_b = storage_dirs
+    queue = SeedQueue(storage_dirs, policy='round_robin')
+
+    assert _pop_all(queue, n_pops=4) == [storage_dir_a / 'experiment1' / 'seed1', storage_dir_b / 'experiment1' / 'seed1',
+                                         storage_dir_a / 'experiment2' / 'seed1', storage_dir_a / 'experiment1' / 'seed2']
+
+    # B gets a new seed mid-run (e.g. prepare_schedule --add_to_folder): it is served in turn, not twice in a row
+
+    new_seed_dir = storage_dir_b / 'experiment1' / 'seed2'
+    new_seed_dir.mkdir()
+    open(str(new_seed_dir / 'UNHATCHED'), 'w+').close()
+    queue.catalogs[1].record(new_seed_dir, 'UNHATCHED')
+
+    assert _pop_all(queue) == [storage_dir_a / 'experiment2' / 'seed2', new_seed_dir]
+
+
+def test_round_robin_offset(storage_dirs):
+    queue = SeedQueue(storage_dirs, policy='round_robin', offset=1)
+    assert _pop_all(queue, n_pops=2) == [storage_dirs[1] / 'experiment1' / 'seed1',
+                                         storage_dirs[0] / 'experiment1' / 'seed1']
+
+
+def test_reclaimed_seeds_are_queued_again(make_storage_dir, logger):
+    from alfred.launch_schedule import _reclaim_expired_seeds
+
+    storage_dir = make_storage_dir()
+    queue = SeedQueue([storage_dir])
+
+    # The only seed is claimed, then its run dies without releasing it
+
+    seed_dir, catalog = queue.pop()
+    assert claim_seed(seed_dir) is not None
+    catalog.record(seed_dir, 'OPENED')
+    assert queue.pop() == (None, None)
+
+    old_time = time.time() - 60.
+    os.utime(str(seed_dir / 'OPENED'), (old_time, old_time))
+
+    # Regression: refreshing the catalog when reclaiming consumed the UNHATCHED record before the queue could read it
+
+    assert _reclaim_expired_seeds(catalog, lease_timeout=10., logger=logger) == 1
+    assert queue.pop() == (seed_dir, catalog)
+
+
+def test_runs_exceeding_run_timeout_are_killed(make_storage_dir, logger):
+    from alfred.launch_schedule import _work_on_schedule
+
+    storage_dir = make_storage_dir(variations={'lr': [0.1], 'sleep': [60.]})
+    seed_dir = storage_dir / 'experiment1' / 'seed1'
+
+    start_time = time.time()
+    n_completed = _work_on_schedule([storage_dir], n_experiments_per_proc=10, logger=logger, root_dir='storage',
+                                    run_timeout=1.)
+
+    # The run is killed at its deadline (main() never gets to write its run_info.txt) and is not run again
+
+    assert n_completed == 0
+    assert time.time() - start_time < 30.
+    assert multiprocessing.active_children() == []
+    assert not (seed_dir / 'run_info.txt').exists()
+
+    assert get_seeds_status(storage_dir)[seed_dir] == 'TIMEOUT'
+    assert (seed_dir / 'TIMEOUT').read_text().startswith('Killed after 1.0s')
+
+    catalog = SeedCatalog(storage_dir)
+    catalog.refresh()
+    assert catalog.status[_seed_name(seed_dir)] == 'TIMEOUT'
+
+
+def _get_blas_threads(cpus, queue):
+    import numpy
+    from threadpoolctl import threadpool_info
+
+    set_run_resources(cpus)
+    queue.put([info['num_threads'] for info in threadpool_info()])
+
+
+def test_thread_pools_already_loaded_are_limited():
+    pytest.importorskip('threadpoolctl')
+
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    p = context.Process(target=_get_blas_threads, args=(get_available_cpus()[:1], queue))
+    p.start()
+    num_threads = queue.get(timeout=30)
+    p.join()
+
+    assert len(num_threads) > 0 and all([n == 1 for n in num_threads])
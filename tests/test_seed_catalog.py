@@ -0,0 +1,40 @@
+from alfred.utils.directory_tree import claim_seed
+from alfred.utils.seed_catalog import SeedCatalog, _seed_name
+
+def _read_status(storage_dir):
+    catalog = SeedCatalog(storage_dir)
+    catalog.refresh()
+    return catalog.status
+
+
+def test_missing_catalog_is_rebuilt(make_storage_dir):
+    storage_dir = make_storage_dir(seeds=[1, 2])
+    seed_dir = storage_dir / 'experiment1' / 'seed1'
+
+    (storage_dir / SeedCatalog.filename).unlink()
+    assert claim_seed(seed_dir)
+    SeedCatalog(storage_dir).record(seed_dir, 'OPENED')
+
+    assert _read_status(storage_dir) == {'experiment1/seed1': 'OPENED', 'experiment1/seed2': 'UNHATCHED'}
+
+
+def test_record_is_kept_when_losing_the_race_against_a_rebuild(make_storage_dir, monkeypatch):
+    storage_dir = make_storage_dir(seeds=[1, 2])
+    seed_dir = storage_dir / 'experiment1' / 'seed1'
+    catalog = SeedCatalog(storage_dir)
+
+    # Another process rebuilds the catalog from the FLAG-files before this one has claimed the seed_dir,
+    # and links its snapshot first
+
+    stale_snapshot = catalog.path.read_text()
+    catalog.path.unlink()
+
+    def concurrent_rebuild():
+        catalog.path.write_text(stale_snapshot)
+
+    monkeypatch.setattr(catalog, 'rebuild', concurrent_rebuild)
+
+    assert claim_seed(seed_dir)
+    catalog.record(seed_dir, 'OPENED')
+
+    assert _read_status(storage_dir)[_seed_name(seed_dir)] == 'OPENED'
@@ -0,0 +1,96 @@
+import os
+import stat
+
+import pytest
+
+from alfred.sync_wandb import sync_wandb, SYNCED_MARKER
+
+# Stub of the wandb executable: logs the synced run directories, and fails for the runs named '*fail*'
+
+WANDB_STUB = """#!/bin/sh
+for last; do :; done
+echo "$PWD/$last" >> "{log}"
+case "$last" in *fail*) echo "sync failed"; exit 1;; esac
+"""
+
+
+@pytest.fixture
+def wandb_stub(tmp_path):
+    path = tmp_path / 'wandb_stub'
+    path.write_text(WANDB_STUB.format(log=tmp_path / 'wandb_calls.log'))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+
+    def get_synced_runs():
+        calls_path = tmp_path / 'wandb_calls.log'
+        return calls_path.read_text().splitlines() if calls_path.exists() else []
+
+    return str(path), get_synced_runs
+
+
+@pytest.fixture
+def root_dir(tmp_path):
+    root_dir = tmp_path / 'storage'
+    for seed_dir in [root_dir / 'No1_alg_task_test' / 'experiment1' / 'seed1',
+                     root_dir / 'No1_alg_task_test' / 'experiment1' / 'seed2']:
+        wandb_dir = seed_dir / 'wandb'
+        for run_name in ['run-1', 'run-2']:
+            (wandb_dir / run_name).mkdir(parents=True)
+        os.symlink('run-2', str(wandb_dir / 'latest-run'))
+
+    return root_dir
+
+
+def _sync(root_dir, wandb_executable, logger, **kwargs):
+    return sync_wandb(root_dir=root_dir, tag='', ask_for_validation=False, project='project', entity='entity',
+                      logger=logger, wandb_executable=wandb_executable, **kwargs)
+
+
+def test_each_run_is_synced_once(root_dir, wandb_stub, logger):
+    wandb_executable, get_synced_runs = wandb_stub
+
+    assert _sync(root_dir, wandb_executable, logger) == []
+
+    synced_runs = get_synced_runs()
+    assert len(synced_runs) == len(set(synced_runs)) == 4
+    assert not any(run.endswith('latest-run') for run in synced_runs)
+
+
+def test_synced_runs_are_skipped(root_dir, wandb_stub, logger):
+    wandb_executable, get_synced_runs = wandb_stub
+
+    _sync(root_dir, wandb_executable, logger)
+    _sync(root_dir, wandb_executable, logger)
+    assert len(get_synced_runs()) == 4
+
+    _sync(root_dir, wandb_executable, logger, resync=True)
+    assert len(get_synced_runs()) == 8
+
+
+def test_failed_runs_are_retried(root_dir, wandb_stub, logger):
+    wandb_executable, get_synced_runs = wandb_stub
+    failing_run = root_dir / 'No1_alg_task_test' / 'experiment1' / 'seed1' / 'wandb' / 'run-fail'
+    failing_run.mkdir()
+
+    failures = _sync(root_dir, wandb_executable, logger)
+    assert [run_dir for run_dir, _ in failures] == [failing_run]
+    assert not (failing_run / SYNCED_MARKER).exists()
+
+    failures = _sync(root_dir, wandb_executable, logger)
+    assert [run_dir for run_dir, _ in failures] == [failing_run]
+    assert len(get_synced_runs()) == 6
+
+
+def test_missing_executable_fails_every_run_without_aborting(root_dir, tmp_path, logger):
+    failures = _sync(root_dir, str(tmp_path / 'missing_wandb'), logger)
+
+    assert len(failures) == 4
+    assert all(['No such file' in result.stdout for _, result in failures])
+    assert not any((run_dir / SYNCED_MARKER).exists() for run_dir, _ in failures)
+
+
+def test_non_executable_wandb_fails_every_run_without_aborting(root_dir, tmp_path, logger):
+    wandb_path = tmp_path / 'wandb_not_executable'
+    wandb_path.write_text('')
+
+    failures = _sync(root_dir, str(wandb_path), logger)
+    assert len(failures) == 4